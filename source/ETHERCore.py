@@ -22,39 +22,37 @@ This header is implemented in the Structured class.
 # Wei Wang, Engility, wei.wang@engility.com
 #
 
-import os, sys, uuid, getpass, logging, ast, time, datetime, nltk, re, StringIO, csv, traceback, os.path
+import os, sys, uuid, getpass, logging, ast, time, datetime, re, StringIO, csv, traceback, os.path
 import math, copy
 from PySide.QtCore import *
 from PySide.QtGui import *
 from dbstore import *
-import util, textan, timexan
+from reportdata import *
+import util, textan, timexan, batch, extractcache, lazyimport
 # import labanalyzer, metamapTranslator, ETHERNLP
 # from evaluation import EventEvaluation
 from dateutil.parser import *
 import gc, json
-import subprocess, cProfile
+import subprocess
 import codecs
 # from unidecode import unidecode
 #from subprocess import *   
  
 # import lxml.html
-import Tkinter as tk
-import tkFont
+##: Tkinter (font metrics), the image readers and the PDF backend are imported where they are used
 import matplotlib
 import matplotlib.cm as cm
-from matplotlib._png import read_png 
-import matplotlib.image as mpimg
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-from matplotlib.patches import FancyBboxPatch
-from matplotlib.backends.qt_editor.formlayout import ColorButton
 
 matplotlib.rcParams['backend.qt4']='PySide'
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_pdf import PdfPages
 
 from threading import Thread
 
+##: Loaded on first use, see lazyimport.py
+nltk = lazyimport.LazyModule('nltk')
+
 # from reportlab.platypus import Flowable
 # from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_RIGHT, TA_CENTER
 # from reportlab.lib.pagesizes import letter, landscape
@@ -65,20 +63,6 @@ from threading import Thread
 # from reportlab.lib.units import inch, mm
 # from reportlab.lib import utils
  
-dictFeatureNames = {"Symptom":"SYMPTOM", "Vaccine":"VACCINE", "Primary Diagnosis":"DIAGNOSIS", 
-                "Second Level Diagnosis":"SECOND_LEVEL_DIAGNOSIS", "Cause of Death":"CAUSE_OF_DEATH", 
-                "Drug":"DRUG", "Family History":"FAMILY_HISTORY", 
-                "Medical History":"MEDICAL_HISTORY", "Rule out":"RULE_OUT"}
-dictFeatureNamesInv = {"SYMPTOM":"Symptom", "VACCINE":"Vaccine", "DIAGNOSIS": "Primary Diagnosis", 
-                "SECOND_LEVEL_DIAGNOSIS":"Second Level Diagnosis", "CAUSE_OF_DEATH":"Cause of Death", 
-                "DRUG":"Drug", "FAMILY_HISTORY":"Family History", 'TIME_TO_ONSET':'Time to Onset',
-                "MEDICAL_HISTORY":"Medical History", "RULE_OUT":"Rule out", "LOT":'Lot Number'}
-dictFeatureAbr = {"SYMPTOM":"SYM", "VACCINE":"VAX", "DIAGNOSIS": "pDx", 
-                "SECOND_LEVEL_DIAGNOSIS":"sDx", "CAUSE_OF_DEATH":"CoD", 
-                "DRUG":'Tx', "FAMILY_HISTORY":"FHx", 'TIME_TO_ONSET':'',
-                "MEDICAL_HISTORY":"MHx", "RULE_OUT":"R/O", "LOT":''}     
-features2Translate = ["DIAGNOSIS", "CAUSE_OF_DEATH", "SECOND_LEVEL_DIAGNOSIS", "SYMPTOM"]        
-        
 def datetime_strftime(datetimeIn, resolution = 'day', resolution_only = False):
     if not datetimeIn:
         return ''
@@ -229,6 +213,9 @@ class SystemPreferences():
     
     def getAnnotationSettings(self):
         return self.annotations
+    
+    def getDocumentBudget(self):
+        return (self.documentBudgetChars, self.documentBudgetSeconds)
         
     def load_config(self):
         self.setToDefaultConfiguration()
@@ -254,6 +241,9 @@ class SystemPreferences():
         self.showLabDataTab = config['showLabDataTab']
         self.annotations = config['annotations']
         self.codeSummary = config['codeSummary']
+        ##: not in the preferences files saved before the budget existed
+        self.documentBudgetChars = config.get('documentBudgetChars', self.documentBudgetChars)
+        self.documentBudgetSeconds = config.get('documentBudgetSeconds', self.documentBudgetSeconds)
         
     def setToDefaultConfiguration(self):
         self.color_scheme = 'Blues'
@@ -270,6 +260,10 @@ class SystemPreferences():
         self.showFeatureEvaluationTab = False
         self.showLabDataTab = False
         self.codeSummary = False
+        ##: Narratives longer, or extractions slower, get the features only (textan.FeatureExtractor.set_document_budget); 
+        ##: 0 for no limit, the default, as in batch.py
+        self.documentBudgetChars = 0
+        self.documentBudgetSeconds = 0
         
         self.annotations = {"Category": ["Feature", "Time"], 
                             "Summarization": ["Diagnosis", "Secondary Outcome", "Cause of Death", "Symptom", "Vaccine", "Drug"], 
@@ -294,560 +288,14 @@ class SystemPreferences():
         config['showLabDataTab'] = self.showLabDataTab
         config['annotations'] = self.annotations 
         config['codeSummary'] = self.codeSummary 
+        config['documentBudgetChars'] = self.documentBudgetChars
+        config['documentBudgetSeconds'] = self.documentBudgetSeconds
         
         with open(self.filename, 'w') as outfile:
             json.dump(config, outfile)
         
         return 
     
-class FeatureStruct():
-    def __init__(self, (ftype, fstring, sentNum, tStart, tEnd, startPos, endPos, confidence, medDRA, featid, comment, matchid, cleanString)):
-        self.type = ftype
-        self.string = fstring
-        self.sentNum = sentNum
-        
-        if not tStart or tStart=='':
-            self.timeStart = None
-        elif isinstance(tStart, basestring):
-            self.timeStart = parse(tStart)
-        else:
-            self.timeStart = tStart
-            
-        if not tEnd or tEnd=='':
-            self.timeEnd = None
-        elif isinstance(tEnd, basestring):
-            self.timeEnd = parse(tEnd) 
-        else:
-            self.timeEnd = tEnd                      
-            
-        self.startPos = startPos
-        self.endPos = endPos
-        self.confidence = confidence
-        self.medDRA = medDRA
-        self.featureID = featid
-        
-        self.comment = comment
-        self.matchlevel = matchid
-        self.cleanString = cleanString
-    
-    def copy(self):
-        param = (self.type, self.string, self.sentNum, self.timeStart, self.timeEnd, self.startPos, self.endPos, self.confidence, 
-                 self.medDRA, self.featureID, self.comment, self.matchlevel, self.cleanString)
-        featStruct = FeatureStruct(param)
-        return featStruct
-    
-    ##: this is called in consolidation. both string and clean string are set to be the new string
-    def setString(self, s):
-        self.cleanString = s
-        self.string = s
-    
-    def setStartTime(self, tStart):
-        if not tStart or tStart=='':
-            self.timeStart = None
-        elif isinstance(tStart, basestring):
-            try:
-                self.timeStart = parse(tStart)
-            except:
-                self.timeStart = None
-        else:
-            self.timeStart = tStart
-    
-    def setEndTime(self, tEnd):
-        if not tEnd or tEnd=='':
-            self.timeEnd = None
-        elif isinstance(tEnd, basestring):
-            try:
-                self.timeEnd = parse(tEnd) 
-            except:
-                self.timeEnd = None
-        else:
-            self.timeEnd = tEnd       
-                 
-    def getFeatureID(self):
-        return self.featureID
-    
-    def setFeatureID(self, idx):
-        self.featureID = idx
-    
-    ##: for report generation
-    def getFeatureDescription(self):
-        if self.timeStart:
-            strDateStart = self.timeStart.isoformat().split('T')[0]
-        else:
-            strDateStart = ''
-        
-        if self.timeEnd:
-            strDateEnd = self.timeEnd.isoformat().split('T')[0]
-        else:
-            strDateEnd = ''                           
-
-        if strDateStart==strDateEnd:
-            a = [dictFeatureNamesInv[self.type], self.string, strDateStart]
-        else:
-            a = [dictFeatureNamesInv[self.type], self.string, strDateStart+'~'+strDateEnd]
-        return a
-            
-    ##: for report generation
-    def getFeatureDescription_split(self):
-        if self.timeStart:
-            strDateStart = self.timeStart.isoformat().split('T')[0]
-        else:
-            strDateStart = ''
-        
-        if self.timeEnd:
-            strDateEnd = self.timeEnd.isoformat().split('T')[0]
-        else:
-            strDateEnd = ''                           
-
-        negationSet = set([r'disappeared', r'excluded', r'unlikely', r'non', r'no', r'not', r'denies',
-                       r'denied', r'without', r'wo', r'any', r'none', r'negative', r'neg', r'nothing', r'gone'])
-        
-        rows = []
-        fts = re.split(', | and ', self.getString())
-        meddra = self.getMedDRA()
-        if meddra:
-            pts = meddra.split(';; ')
-        else:
-            pts = ['']*len(fts)
-            
-        for i, ft in enumerate(fts):
-            if strDateStart==strDateEnd:
-                row = [dictFeatureNamesInv[self.type], ft, pts[i], strDateStart]
-            else:
-                row = [dictFeatureNamesInv[self.type], ft, pts[i], strDateStart+'~'+strDateEnd]
-                
-            wds = re.split(' |-', ft)
-            if set(wds).intersection(negationSet):
-                row.append('Y')
-            else:
-                row.append('')
-            
-            rows.append(row)
-            
-        return rows
-        
-    def getCleanString(self):
-        return self.cleanString
-    
-    def setPositions(self, (start, end)):
-        self.startPos = start
-        self.endPos = end
-    
-    def getStartPos(self):
-        return self.startPos
-    
-    def getEndPos(self):
-        return self.endPos
-    
-    def hasStartTime(self):
-        if self.timeStart:
-            return True
-        else:
-            return False
-        
-    def hasEndTime(self):
-        if self.timeEnd:
-            return True
-        else:
-            return False
-        
-    def getSentNum(self):
-        return self.sentNum
-    
-    def getStartDate(self):
-        return datetime.date(self.timeStart.year, self.timeStart.month, self.timeStart.day)
-     
-    def getEndDate(self):
-        return datetime.date(self.timeEnd.year, self.timeEnd.month, self.timeEnd.day)
-    
-    def getStartTime(self):
-        return self.timeStart
-    
-    def getEndTime(self):
-        return self.timeEnd
-    
-    def getType(self):
-        return self.type
-    
-    def setType(self, t):
-        self.type = t
-    
-    def getString(self):
-        return self.string
-    
-    def getConfidence(self):
-        return self.confidence
-    
-    def setComment(self, s):
-        self.comment = s
-    
-    def setMatchlevel(self, s):
-        self.matchlevel = s
-        
-    def setMedDRA(self, s):
-        self.medDRA = s
-        
-    def getMedDRA(self):
-        if self.medDRA:
-            return self.medDRA
-        else:
-            return ''
-
-    def getMatchlevel(self):
-        return self.matchlevel
-
-    def getDBFeatureTableRow(self):        
-        if self.timeStart:
-            strDateStart = self.timeStart.isoformat().split('T')[0]
-        else:
-            strDateStart = ''
-        
-        if self.timeEnd:
-            strDateEnd = self.timeEnd.isoformat().split('T')[0]
-        else:
-            strDateEnd = ''           
-
-        a = (self.type, self.string, self.sentNum, strDateStart, strDateEnd, self.startPos, self.endPos, self.medDRA, self.featureID, self.cleanString)
-        return a
-        
-    def getTableRow(self):
-        if self.timeStart:
-            if self.timeEnd - self.timeStart < datetime.timedelta(days=1):
-                strDate = self.timeStart.isoformat().split('T')[0]
-            else:
-                strDate = self.timeStart.isoformat().split('T')[0] + ' ~ ' + self.timeEnd.isoformat().split('T')[0]
-        else:
-            strDate = ''
-
-        strRow = [str(self.sentNum).zfill(3), dictFeatureAbr[self.type], self.string, strDate, self.comment, str(self.featureID).zfill(3), str(self.matchlevel)]
-        
-        return strRow
-
-    def getSummarizationTableRow(self):
-        if self.timeStart:
-            if self.timeEnd - self.timeStart < datetime.timedelta(days=1):
-                strDate = self.timeStart.isoformat().split('T')[0]
-            else:
-                strDate = self.timeStart.isoformat().split('T')[0] + ' ~ ' + self.timeEnd.isoformat().split('T')[0]
-        else:
-            strDate = ''
-        
-        ftype = SummaryElement.dictElemAbr[SummaryElement.dictFeat2Elem[self.type]]
-        strRow = [str(self.featureID).zfill(3), ftype, self.string, self.medDRA, 
-                        strDate, self.comment, self.matchlevel, str(self.startPos), str(self.endPos)]
-                
-#         self.headers = ['FeatureID', 'Type', 'Element Text', 'Preferred Term', 'Date', 'Comment', 'Feedback']
-
-        return strRow
-
-
-class FeatureAnnotation(): 
-    def __init__(self, (annotationID, ftext, ftype, ferror, comment, startPos, endPos, featID, timeID, timeRel)):
-        self.annotationID = annotationID
-        self.text = ftext
-        self.type = ftype
-        self.errorType = ferror
-        self.comment = comment
-        self.startPos = startPos
-        self.endPos = endPos
-        self.featureID = featID
-        self.timeID = timeID
-        self.timeRel = timeRel
-        
-        self.preAnnotation = False
-        self.postAnnotation = False
-    
-    def __eq__(self, other):
-        if self.annotationID != other.annotationID \
-            or self.text != other.text \
-            or self.type != other.type \
-            or self.errorType != other.errorType \
-            or self.comment != other.comment \
-            or self.startPos != other.startPos \
-            or self.endPos != other.endPos \
-            or self.featureID != other.featureID \
-            or self.timeID != other.timeID \
-            or self.timeRel != other.timeRel:
-            return False
-        else:
-            return True
-        
-    def getFeatureID(self):
-        return self.featureID
-    
-    def getText(self):
-        return self.text
-    
-    def setText(self, s):
-        self.text = s
-    
-    def setPreAnnotation(self, pre):
-        self.preAnnotation = pre
-        
-    def setPostAnnotation(self, post):
-        self.postAnnotation = post
-    
-    def setType(self, tp):
-        self.type = tp
-        
-    def getType(self):
-        return self.type
-    
-    def getID(self):
-        return self.annotationID
-    
-    def getIDName(self):
-        sid = 'f'+str(self.annotationID)
-        if self.preAnnotation:
-            sid = sid + '*'
-        elif self.postAnnotation:
-            sid = sid + '+'
-        
-        return sid
-    
-    def setID(self, i):
-        self.annotationID = i
-    
-    def setTimeID(self, i):
-        self.timeID = i
-        if i==-1:
-            self.timeRel = ''
-    
-    def getTimeID(self):
-        return self.timeID
-    
-    def getTimeRelation(self):
-        return self.timeRel
-    
-    def getErrorType(self):
-        return self.errorType
-    
-    def getStartPos(self):
-        return self.startPos
-    
-    def getEndPos(self):
-        return self.endPos
-    
-    def getPositions(self):
-        return (self.startPos, self.endPos)
-    
-    def setPositions(self, (startPos, endPos)):
-        self.startPos = startPos
-        self.endPos = endPos
-        
-    def getTableRow(self):
-        ##:header = ['ID', 'Feature Text', 'StartPos', 'Type', 'TimeID', 'Relation', 'Comment']        
-        sid = 'f'+str(self.annotationID)
-        if self.preAnnotation:
-            sid = sid + '*'
-        elif self.postAnnotation:
-            sid = sid + '+'
-        
-        if self.timeID and self.timeID>0:
-            tid = 't'+str(self.timeID)
-        else:
-            tid = ''
-        strRow = (sid, self.text, str(self.startPos), str(self.endPos), self.type, tid, self.timeRel, self.comment, str(self.featureID))
-        return strRow
-    
-    def getDBRecord(self):
-        record = (self.annotationID, self.text, self.type, self.errorType, self.comment, 
-                self.startPos, self.endPos, '', self.featureID, self.timeID, self.timeRel)
-         
-        return record
-    
-class TimeAnnotation():
-    types = ["", "Date", "Relative", "Duration", "Weekday", "Frequency", "Age", "Time", "Anchor", "Other"]
-    
-    def __init__(self, (annotationID, ftext, ftype, dtime, startPos, endPos, confidence, comment, timeID, timeRel)):
-        self.annotationID = annotationID
-        self.string = ftext
-        self.datetime = dtime
-        self.confidence = confidence
-        self.comment = comment
-        self.startPos = startPos
-        self.endPos = endPos
-        self.timeID = timeID
-        self.timeRel = timeRel
-        
-        if isinstance(ftype, int):
-            self.type = TimeAnnotation.types[ftype]
-        else:
-            self.type = ftype
-            
-        self.preAnnotation = False
-    
-    def __eq__(self, other):
-        if self.annotationID != other.annotationID \
-            or self.string != other.string \
-            or self.datetime != other.datetime \
-            or self.type != other.type \
-            or self.confidence != other.confidence \
-            or self.comment != other.comment \
-            or self.timeID != other.timeID \
-            or self.timeRel != other.timeRel \
-            or self.endPos != other.endPos \
-            or self.startPos != other.startPos:
-            return False
-        else:
-            return True
-
-    def setPreAnnotation(self, pre):
-        self.preAnnotation = pre
-    
-    def setDate(self, dt):
-        self.datetime = dt
-    
-    def getDate(self):
-        return self.datetime
-    
-    def setType(self, ftype):
-        if isinstance(ftype, int):
-            self.type = ftype
-        else:
-            self.type = TimeAnnotation.types.index(ftype)
-    
-    def getID(self):
-        return self.annotationID
-    
-    def setID(self, i):
-        self.annotationID = i
-    
-    def setTimeID(self, i):
-        self.timeID = i
-        if i==-1:
-            self.timeRel = ''
-    
-    def getTimeID(self):
-        return self.timeID
-    
-    def getTimeRelation(self):
-        if not self.timeRel:
-            return ''
-        return self.timeRel
-    
-    def setString(self, s):
-        self.string = s
-    
-    def getString(self):
-        return self.string
-    
-    def getStartPos(self):
-        return self.startPos
-    
-    def getEndPos(self):
-        return self.endPos
-    
-    def getPositions(self):
-        return (self.startPos, self.endPos)
-    
-    def setPositions(self, (startPos, endPos)):
-        self.startPos = startPos
-        self.endPos = endPos
-    
-    def getTableRow(self):
-        ##: header = ['TimeID', 'Time Text', 'StartPos', 'Type', 'Date', 'Comment']          
-        sid = 't'+str(self.annotationID)
-        if self.preAnnotation:
-            sid = sid + '*'
-        
-        if self.timeID and self.timeID>0:
-            tid = 't'+str(self.timeID)
-        else:
-            tid = ''
-
-        ttp = self.type
-        strRow = (sid, self.string, str(self.startPos), str(self.endPos), ttp, self.datetime, tid, self.timeRel, self.comment)
-        return strRow
-    
-    def getRecord(self):
-        rec = (self.annotationID, self.string, self.startPos, self.endPos, self.type, self.datetime, self.confidence, self.comment, self.timeID, self.timeRel)
-        return rec   
-    
-    def getTypeIndex(self):
-        if self.type in TimeAnnotation.types:
-            return TimeAnnotation.types.index(self.type)
-        else:
-            return 0
-    
-    def getType(self):
-        return self.type
-    
-    def getTypeID(self):
-        return self.type
-              
-class SummaryElement():
-    errorTypes = ['', 'Text incomplete', 'Text redundant']
-    featureTypes = ["DIAGNOSIS", "CAUSE_OF_DEATH", "SECOND_LEVEL_DIAGNOSIS", "SYMPTOM", 
-                       "RULE_OUT", "MEDICAL_HISTORY", "FAMILY_HISTORY", "DRUG", "VACCINE"]
-    elementTypes =  ["Diagnosis", "Secondary Outcome", "Cause of Death", "Symptom", "Vaccine", "Drug"]
-    dictElem2Feat = {"Diagnosis":"DIAGNOSIS", "Secondary Outcome":'SECOND_LEVEL_DIAGNOSIS', 
-                              "Cause of Death":"CAUSE_OF_DEATH", "Symptom":"SYMPTOM", "Vaccine":"VACCINE", "Drug":"DRUG"}
-    dictElemAbr = {"Diagnosis":"Dx", "Secondary Outcome":"S/O", "Cause of Death":"CoD", "Symptom":"SYM",
-                             "Vaccine":"VAX", "Drug":"Tx"}
-    dictFeat2Elem = dict((v,k) for k, v in dictElem2Feat.iteritems())
-
-    def __init__(self, (annotationID, ftext, ftype, ferror, comment, startPos, endPos, pt, featID, tStart, tEnd, timeID, timeRel)):
-        self.annotationID = annotationID
-        self.text = ftext
-        self.type = ftype
-        self.errorType = ferror
-        self.comment = comment
-        self.startPos = startPos
-        self.endPos = endPos
-        self.preferTerm = pt
-        self.featureID = featID
-        self.timeID = timeID
-        self.timeRel = timeRel
-        self.startTime = tStart
-        self.endTime = tEnd
-    
-    def getFeatureID(self):
-        return self.featureID
-    
-    def getText(self):
-        return self.text
-    
-    def getPreferTerm(self):
-        return self.preferTerm
-    
-    def getStartTime(self):
-        return self.startTime
-    
-    def getEndTime(self):
-        return self.endTime
-    
-    def getType(self):
-        return self.type
-    
-    def getErrorType(self):
-        return self.errorType
-    
-    def getPositions(self):
-        return (self.startPos, self.endPos)
-    
-    def isElement(self):
-        if self.type in FeatureAnnotation.elementTypes:
-            return True
-        else:
-            return False
-    
-    def isFeature(self):
-        if self.type in FeatureAnnotation.featureTypes:
-            return True
-        else:
-            return False
-    
-    def summarizationDBRecord(self):
-        record = (self.annotationID, self.text, self.type, self.errorType, self.comment, 
-                  self.startPos, self.endPos, self.preferTerm, self.featureID, self.startTime, self.endTime)
-        
-        return record
-    
-    def getFeatureObj(self):
-        feat = FeatureStruct((self.dictElem2Feat[self.type], self.text, -1, self.startTime, self.endTime, self.startPos, 
-                              self.endPos, -1, self.preferTerm, -1, self.comment, -1, self.text))
-        return feat
 
 
 class Structured(QWidget):
@@ -3974,7 +3422,7 @@ class AnnotationFeatureTableBox(QGroupBox):
         
         try:
             if self.mainWindow.extractor == None:
-                self.mainWindow.extractor = textan.FeatureExtractor()
+                self.mainWindow.init_extractor()
             (strStartTime, strEndTime) = self.mainWindow.extractor.extract_annotation_temporal(
                                         report['Free Text'], startPos, endPos, featType,
                                         report['Date of Exposure'], report['Date of Onset'], 
@@ -5236,6 +4684,7 @@ class ReportTemporalPlot(QFrame):
         self.allFeatures = ["DIAGNOSIS", "CAUSE_OF_DEATH", "SECOND_LEVEL_DIAGNOSIS", "SYMPTOM", 
                        "RULE_OUT", "MEDICAL_HISTORY", "FAMILY_HISTORY", "DRUG", "VACCINE"]
         self.linewidth = 4
+        import Tkinter as tk, tkFont
         self.textFontManager = tkFont.Font(root=tk.Tk(), family='sans-serif', size=self.textfontsize)
 
         self.fig = Figure(dpi=self.dpi, facecolor='w', tight_layout=True)
@@ -5246,6 +4695,7 @@ class ReportTemporalPlot(QFrame):
         layout.addWidget(self.canvas)
         
 #         im_syringe = read_png("./rx.png")
+        import matplotlib.image as mpimg
         im_syringe = mpimg.imread("./rx.png")
         self.imbox_syringe = OffsetImage(im_syringe, zoom=0.2)
         im_sick = mpimg.imread("./sad.png")
@@ -5864,6 +5314,7 @@ class ReportTemporalPlot(QFrame):
         self.canvas.draw()
         
     def save_temporal_main_pdf(self, fname):
+        from matplotlib.backends.backend_pdf import PdfPages
         with PdfPages(fname) as pdf:
             pdf.savefig(figure=self.fig)  # saves the current figure into a pdf page            
     
@@ -6813,6 +6264,7 @@ class ReportGroupAnalysisPlot(QFrame):
         self.y_offset = 0.2
         self.textfontsize = 12
         self.linewidth = 4
+        import Tkinter as tk, tkFont
         self.textFontManager = tkFont.Font(root=tk.Tk(), family='sans-serif', size=self.textfontsize)
         self.pickRadius = (.5, .5)
         
@@ -6826,6 +6278,7 @@ class ReportGroupAnalysisPlot(QFrame):
         self.plotFrame.setLayout(layout)
         layout.addWidget(self.canvas)
         
+        from matplotlib._png import read_png
         im_syringe = read_png("./syringe1.png")
         self.imbox_syringe = OffsetImage(im_syringe, zoom=0.2)
         im_sick = read_png("./sick.png")
@@ -8669,6 +8122,10 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(None, "ETHER", str(e))
             sys.exit(app.quit())
 
+        #build the feature extractor in the background, while the database, the reports and the window are set up
+        self.extractorWarmUp = ExtractorWarmUp(self.config)
+        self.extractorWarmUp.start()
+
         #connect to database
         self.vaersdb = dbstore(self.config['localpath'] + 'etherlocal.db', "", self.config['localpath'])
         self.dbHandler = DBHandler(self.vaersdb)
@@ -8692,6 +8149,7 @@ class MainWindow(QMainWindow):
         
         self.extractor = None
         self.lexicon = None
+        self.extractionCache = None
         
         if reportFile == 'idsdebug.csv':
             self.in_debug_mode = True
@@ -9006,7 +8464,7 @@ class MainWindow(QMainWindow):
             return None
         
         for report in report_form_data:
-            report['Received Date'] = parse(report['Received Date']).isoformat().split('T')[0]
+            report['Received Date'] = timexan.parse_date(report['Received Date']).isoformat().split('T')[0]
             
         return report_form_data
 
@@ -9251,59 +8709,10 @@ class MainWindow(QMainWindow):
         self.loading_faers_file = False
         
     def read_saved_report_csv(self, reports_data): 
-         
-        fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text', 'Received Date', 'Lot Number', 'Free Text']
-        if not reports_data[0][0][0].isdigit():
-            reports_data = reports_data[1:]
-        
-        if len(reports_data[0][0].split('-')[0]) > 6:
-            isFAERS = True
-        else:
-            isFAERS = False
-            
-        report_form_data = []
-        for row in reports_data:           
-            if len(row)==9:
-                row.append(row[8])
-            row[5]=row[5].rstrip()
-            row[6]=row[6].rstrip()
-            row[5] = re.sub('\n', ', ', row[5])
-            row[6] = re.sub('\n', '; ', row[6])
-            
-            if isFAERS:
-                row[2] = ''
-                row[3] = ''
-            report = dict(zip(fieldnames, row))
-            report_form_data.append(report)
-        
-        return report_form_data
+        return batch.read_saved_report_csv(reports_data)
     
     def vaers_report_csv_reader(self, reports_data): 
-        
-        reports_data = reports_data[1:]
-        #fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender','Free Text', 'Lab Text']
-        fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text','Free Text']
-        if len(reports_data[0][0]) > 6:
-            isFAERS = True
-        else:
-            isFAERS = False
-            
-        report_form_data = []
-        for row in reports_data:           
-            if len(row)==9:
-                row.append(row[8])
-            row[5]=row[5].rstrip()
-            row[6]=row[6].rstrip()
-            row[5] = re.sub('\n', ', ', row[5])
-            row[6] = re.sub('\n', '; ', row[6])
-            
-            if isFAERS:
-                row[2] = ''
-                row[3] = ''
-            report = dict(zip(fieldnames, row))
-            report_form_data.append(report)
-        
-        return report_form_data
+        return batch.vaers_report_csv_reader(reports_data)
     
     def xml_files_reader(self, reader): 
         sections = ['Boxed Warning', 'Warnings and Precautions', 'Adverse Reactions', 'Use in Specific Populations']
@@ -9375,43 +8784,37 @@ class MainWindow(QMainWindow):
         return report_form_data
     
     def vaers_report_txt_reader_new(self, reader): 
-        #fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender','Free Text', 'Lab Text']
-        fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text','Received Date', 'Lot Number', 'Free Text']
-        report_form_data = []
-        if len(reader[0][0].split('-')[0]) > 6:
-            isFAERS = True
-        else:
-            isFAERS = False
+        return batch.vaers_report_txt_reader(reader)
+    
+    def is_streamed_data_file(self, filename):
+        """True for the formats read by batch.iter_data_file(): VAERS/FAERS txt exports, VAERS and saved csv files"""
+        with open(filename, 'r') as f:
+            if filename[-3:]=='csv':
+                row = next(csv.reader(f), None)
+                return row is not None and len(row)>2 and len(row)<=12
+            line0 = next((line for line in f if line!=''), None)
+            if line0 is None:
+                return False
+            return len(re.split('", "|","', line0))>2
         
-        reportIDs = []
-        for line in reader:
-            #drop initial '"' and trailing '"\n'. split on '" ,  "'
-            fields = re.split('", "|","', line[1:-2])
-            if isFAERS:
-                fields[2] = ''
-                fields[3] = ''
-            if fields[10]=='NULL':
-                fields[10]=''
-                
-            report = dict(zip(fieldnames, fields))
-            
-            if report['Report ID'] in reportIDs:
-                rpt = [r for r in report_form_data if r['Report ID']==report['Report ID']][0]
-                if report['Lot Number']!='':
-                    if rpt['Lot Number']=='':
-                        rpt['Lot Number'] = report['Lot Number']
-                    else:
-                        rpt['Lot Number'] += '; ' + report['Lot Number']
-                continue
-            else:
-                reportIDs.append(report['Report ID'])          
-                
-            #yield report
-            report_form_data.append(report)
-            
-        return report_form_data
+    def iter_data_file(self, filename):
+        """Stream the reports of the data file one at a time, see batch.iter_data_file()"""
+        try:
+            for report in batch.iter_data_file(filename):
+                yield report
+        except Exception as e:
+            QMessageBox.critical(None, "ETHER", str(e) + "\nData file not valid!")
     
     def read_data_file_universal(self, filename):      
+        """Return the reports of the data file: a stream for the txt exports and csv files (see iter_data_file()), 
+        so that read_reports_form_data() pulls them one at a time, or a list for the report ID and XML lists."""
+        try:
+            if self.is_streamed_data_file(filename):
+                return self.iter_data_file(filename)
+        except Exception as e:
+            QMessageBox.critical(None, "ETHER", str(e) + "\nData file not valid!")
+            return None
+        
         try:
             with open(filename, 'r') as f:
 #            with codecs.open(filename, 'r', encoding='utf-8-sig') as f:
@@ -9447,24 +8850,7 @@ class MainWindow(QMainWindow):
             return None
                 
         ##: Complement empty fields
-        fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender','Free Text', 'Lab Text', 
-                      'Serious', 'Died', 'Location', 'History', 'Received Date', 'Lot Number', 'Indication', 'Primary Suspect', 
-                      'Birth Date', 'First Name', 'Middle Initial', 'Last Name', 'Patient ID', 'MFR Control Number']
-                
-        if report_form_data:
-            for fld in fieldnames:
-                if not fld in report_form_data[0].keys():
-                    default = ''
-                    if fld=='Gender':
-                        default = 'UNKNOWN'
-                    elif fld=='Died' or fld=='Serious':
-                        default = False
-                        
-                    for report in report_form_data:
-                        report[fld] = default
-            
-            for report in report_form_data:
-                report['Free Text'] = util.remove_nonascii(report['Free Text'])
+        batch.complement_report_fields(report_form_data)
 
         return report_form_data
     
@@ -9578,14 +8964,19 @@ class MainWindow(QMainWindow):
         return report_data
 
     def read_reports_form_data(self, report_form_data):
-        if report_form_data:
+        """Process the reports, a list or a stream pulled one report at a time, and return the list of processed reports."""
+        if not report_form_data:
+            return
+        
+        ##: the number of reports of a stream is unknown until it ends, the progress bar then only shows activity
+        if isinstance(report_form_data, list):
             numreports = len(report_form_data)
+            progress = QProgressDialog("Extracting features from {0} reports.".format(numreports), "Cancel", 0, numreports - 1)
         else:
-            return
-
-        #display a progress window
-        progress = QProgressDialog("Extracting features from {0} reports.".format(numreports), "Cancel", 0, numreports - 1)
+            numreports = 0
+            progress = QProgressDialog("Extracting features from the reports.", "Cancel", 0, 0)
         
+        #display a progress window
         progress.setWindowTitle("ETHER")
         progressbar = QProgressBar(progress)
         progressbar.setVisible(1)
@@ -9657,93 +9048,76 @@ class MainWindow(QMainWindow):
                 report['Time to Onset'] = ''
                               
             reports.append(report)
-            progress.setValue(idx)
+            if not numreports:
+                progress.setLabelText("Extracting features: {0} reports.".format(idx + 1))
+            ##: also lets the events be processed, with the progress dialog modal
+            progress.setValue(idx if numreports else 0)
             if progress.wasCanceled():
                 #sys.exit()  
                 return None          
 
+        if self.extractionCache:
+            logging.info("Extraction cache: %(hits)d hits, %(misses)d misses, %(size)d entries" % self.extractionCache.getStats())
+        if self.extractor and self.extractor.sentence_cache is not None:
+            logging.info("Sentence cache: %(hits)d hits, %(misses)d misses (hit rate %(hit_rate).2f), %(size)d sentences" % 
+                         self.extractor.sentence_cache.getStats())
         self.vaersdb.create_index()
         return reports
     
-    def processing_report_text(self, report):
+    def init_extractor(self):
+        """Take the feature extractor built by the warm-up thread, waiting for it if it is not ready yet,
+        or build it here if the warm-up failed. Then open the extraction cache."""
+        warmUp = self.extractorWarmUp
+        if warmUp:
+            t0 = time.time()
+            warmUp.join()
+            self.extractorWarmUp = None
+            if warmUp.extractor:
+                self.lexicon = warmUp.lexicon
+                self.extractor = warmUp.extractor
+                logging.info("Extractor built in %.2f s, waited %.2f s for it" % (warmUp.seconds, time.time() - t0))
+            else:
+                logging.warning("Extractor warm-up failed. " + str(warmUp.error))
         
         if not self.extractor:
-            #read lexicon file
+            #read lexicon files, or the compiled lexicon if it is up to date
             try:
-                with open('lexicon.txt', 'r') as f:
-                    lexicon = ast.literal_eval(f.read())
-                with open('lexicon2nd.txt', 'r') as f:
-                    lexicon2 = ast.literal_eval(f.read())    
-                with open('lexicon3rd.txt', 'r') as f:
-                    lexicon3 = ast.literal_eval(f.read())    
+                (self.lexicon, lexiconTables) = textan.load_lexicon()
             except Exception as e:
                 QMessageBox.critical(None, "ETHER", str(e))
                 sys.exit(app.quit())
-            #self.lexicon = lexicon2 + lexicon
-            self.lexicon = lexicon3 + lexicon + lexicon2
             
-            self.extractor = textan.FeatureExtractor(self.config, self.lexicon)
+            self.extractor = textan.FeatureExtractor(self.config, self.lexicon, lexiconTables)
+        
+        #a pathological narrative gets the features only rather than holding up the reading of the reports
+        self.extractor.set_document_budget(*self.sysPreferences.getDocumentBudget())
+            
+        #open the extraction cache, so unchanged narratives are not extracted again;
+        #its connection can only be used by this thread, so it is not opened by the warm-up
+        try:
+            self.extractionCache = batch.create_cache(self.config['localpath'] + extractcache.extractionCacheFile, self.extractor)
+        except Exception as e:
+            logging.warning("Extraction cache is not available. " + str(e))
+        
+    def processing_report_text(self, report):
+        
+        if not self.extractor:
+            self.init_extractor()
          
         if len(report['Report ID'].split('-')[0])<=6:
             self.reportType = 'vaers'
         else:
             self.reportType = 'faers'
         
-        documentFeature= self.extractor.extract_features_temporal(
-                            report['Free Text'], report['Date of Exposure'], report['Date of Onset'], report['Received Date'], self.reportType)
         self.preStrExpDate = report['Date of Exposure']
+        (report, documentFeature) = batch.extract_report(self.extractor, report, self.sysPreferences.toCodeSummary(), self.extractionCache)
                     
         if not documentFeature:
-            report['PreferredTerms'] = ''
-            report['Features'] = []
-            report['Exposure Date'] = None
-            report['Onset Date'] = None
-            report['CalculatedOnsetTime'] = None
-            report['DatesConfidence'] = None                    
-            report['Timexes'] = []
-            report['Lab Data'] = ''
-            report['Comment'] = ''
-            report['Class'] = 0
-            report['DxLevel'] = ''
-            report['Review'] = ''
-            report['Action'] = 0
-            report['Mark'] = False
-            report['Annotations'] = []
-            report['Summarizations'] = []
-            report['TimeAnnotations'] = []
             return report
-                
-        featuresTM = documentFeature.getFeatureArray()
-        features = [FeatureStruct(feat) for feat in featuresTM]
         
-        report['PreferredTerms'] = ''
-        
-        report['Features'] = features
-                        
-        report['Exposure Date'] = documentFeature.getExposeDate()
-        report['Onset Date'] = documentFeature.getOnsetDate()
-        report['CalculatedOnsetTime'] = documentFeature.getCalculatedOnsetTimeHours()
-        #report['IsDatesInput'] = documentFeature.isDatesInput(
-        report['DatesConfidence'] = documentFeature.getConfidenceLevel()
-                    
-        report['Date of Exposure'] = documentFeature.getInputExpDate()
-        report['Date of Onset'] = documentFeature.getInputOnsetDate()
-        report['Received Date'] = documentFeature.getReceivedDate()
-        
-        report['Review'] = util.ReportUtil.getReportSummary(report, self.reportType, self.sysPreferences.toCodeSummary())
-        report['Action'] = -1
-        report['Mark'] = False
-        
-        report['Comment'] = ''
-        (report['Class'], report['DxLevel']) = ('', 0)
-                    
-        report['Timexes'] = documentFeature.getTimexes()
-        
-        report['Annotations'] = []
-        report['TimeAnnotations'] = []
-        report['Summarizations'] = []
-        
-        report['Lab Data'] = ''
+        if report['Degraded']:
+            logging.warning("Report " + report['Report ID'] + " is over the extraction budget (" + report['Degraded'] + 
+                            "), only its features are extracted.")
         
         if self.overwrite_DB and self.vaersdb.checkid(report['Report ID']):
             self.vaersdb.deleteReport(report['Report ID'])
@@ -9876,11 +9250,11 @@ class MainWindow(QMainWindow):
         
         reportFeature = self.vaersdb.retrieveReportFeature(report['Report ID'])
         if reportFeature[0]!='':
-            report['Exposure Date'] = parse(reportFeature[0])
+            report['Exposure Date'] = timexan.parse_date(reportFeature[0])
         else:
             report['Exposure Date'] = None       
         if reportFeature[1]!='':
-            report['Onset Date'] = parse(reportFeature[1])
+            report['Onset Date'] = timexan.parse_date(reportFeature[1])
         else:
             report['Onset Date'] = None
         report['CalculatedOnsetTime'] = reportFeature[2]
@@ -9895,6 +9269,7 @@ class MainWindow(QMainWindow):
         report['Class'] = reportFeature[8]
         report['DxLevel'] = reportFeature[9]
         report['Mark'] = reportFeature[10]
+        report['Degraded'] = reportFeature[11] or ''
         
 #         report['Summary'] = reportFeature[6]
         report['Lab Data'] = []
@@ -9943,49 +9318,14 @@ class MainWindow(QMainWindow):
         return self.vaersdb.hasTextMined(reportid)
         
     def commit_to_DB(self, report, documentFeature):
-        report_form_data = (report['Report ID'], report['Age'], report['Date of Exposure'], report['Date of Onset'], report['Vaccines'], 
-                            report['Vaccine Names'], report['MedDRA'], report['Gender'], report['Free Text'], report['Lab Text'], 
-                            report['Serious'], report['Died'], report['Location'], report['History'], report['Received Date'], 
-                            report['Lot Number'], report['Indication'], report['Primary Suspect'],
-                            report['Birth Date'], report['First Name'], report['Middle Initial'], report['Last Name'], 
-                            report['Patient ID'], report['MFR Control Number'])
-        self.vaersdb.insertReportForm(report_form_data)
-        
-        if report['Exposure Date']:
-            strExpDateEst = report['Exposure Date'].isoformat().split('T')[0]
-        else:
-            strExpDateEst = ''
-        if report['Onset Date']:
-            strOnsetDateEst = report['Onset Date'].isoformat().split('T')[0]
-        else:
-            strOnsetDateEst = ''
-        document_feature = (report['Report ID'], strExpDateEst, strOnsetDateEst, report['CalculatedOnsetTime'], report['DatesConfidence'], 
-                            report['PreferredTerms'], report['Comment'], report['Review'], report['Action'], report['Class'], report['DxLevel'], report['Mark'])
-        self.vaersdb.insertReportFeature(document_feature)
-                    
-        featList = []
-        for feat in report['Features']:
-            featrow = feat.getDBFeatureTableRow()
-            featList.append(featrow)
-                
-        self.vaersdb.insertFeatures(report['Report ID'], featList)
-        
-        labList = []
-        for name, val, unit, specimen, strRange, evaluation, strTest in report['Lab Data']:
-            labList.append((name, val, unit, specimen, evaluation, strTest, '')) # the last '' is comment
-        self.vaersdb.insertLabTests(report['Report ID'], labList)
-
-        timexList = documentFeature.getTimexesDB()
-        self.vaersdb.insertTimexes(report['Report ID'], timexList)
-                    
-        self.vaersdb.conn.commit()
+        batch.commit_report(self.vaersdb, report, documentFeature.getTimexesDB())
                     
     def parse_time_string(self, time_string, preStrExpDate = None):        
         if time_string == '' and preStrExpDate:
             return preStrExpDate
      
         try:
-            dt = parse(time_string)
+            dt = timexan.parse_date(time_string)
         except:
             return preStrExpDate
         
@@ -10133,7 +9473,7 @@ class MainWindow(QMainWindow):
         timexes = self.get_report_timexes(report)
         
         if not self.extractor:
-            self.extractor = textan.FeatureExtractor()
+            self.init_extractor()
         
         print report['Report ID']
         docFeature = self.extractor.extract_feature_time_associations(features, timexes, report['Free Text'])    
@@ -10711,6 +10051,30 @@ class MainWindow(QMainWindow):
         if tab_annotation:
             tab_annotation.central.current_report_changed()
 
+class ExtractorWarmUp(Thread):
+    """Load the lexicon and build the feature extractor in the background, with the nltk
+    sentence and word tokenizers, so that the first report loaded does not wait for them."""
+    def __init__(self, config):
+        Thread.__init__(self)
+        self.daemon = True
+        self.config = config
+        self.lexicon = None
+        self.extractor = None
+        self.error = None
+        self.seconds = 0.
+        
+    def run(self):
+        t0 = time.time()
+        try:
+            (lexicon, lexiconTables) = textan.load_lexicon()
+            extractor = textan.FeatureExtractor(self.config, lexicon, lexiconTables)
+            ##: loads the punkt model and compiles the tokenizer expressions
+            nltk.word_tokenize(nltk.sent_tokenize("Patient received the vaccine. Fever on the next day.")[0])
+            (self.lexicon, self.extractor) = (lexicon, extractor)
+        except Exception as e:
+            self.error = e
+        self.seconds = time.time() - t0
+
 class FindDuplication(Thread):
     def __init__(self, inputFileName, reportType):        
         Thread.__init__(self)
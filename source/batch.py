@@ -0,0 +1,783 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Headless batch extraction for ETHER
+
+This module runs feature extraction and feature-time association over a file of VAERS/FAERS reports,
+and stores the results in the local database, without the GUI (no Qt, Tk or matplotlib imports).
+It is meant for server-side ingestion, and can be used as a library or from the command line:
+
+    python batch.py reports.txt --db etherlocal.db [--overwrite]
+
+The core functions it provides include:
+
+read_data_file() -- Read a VAERS/FAERS txt export, or a VAERS/saved csv file, into a list of report dictionaries.
+
+iter_data_file() -- Read the same files as a stream of report dictionaries, one row at a time.
+
+extract_report() -- Extract features and time information from one report, and fill in the report fields
+the same way MainWindow.processing_report_text does. The result is taken from the extraction cache if it is there.
+A report over the extractor budget (FeatureExtractor.set_document_budget) gets the features only, and is flagged as degraded.
+
+create_cache() -- Open the persistent extraction cache (extractcache.ExtractionCache) of an extractor.
+
+commit_report() -- Store one processed report in the database, the same way MainWindow.commit_to_DB does.
+
+iter_extractions() -- Extract a sequence of reports, serially or in a pool of worker processes.
+Each worker builds its own FeatureExtractor once at startup, and sends back compact feature/timex records,
+so the database and the extraction cache are only written by the calling process.
+
+iter_extracted_reports() -- Read and extract a data file as a stream, one report at a time, in constant memory.
+
+run_batch() -- Process a whole data file, and return the throughput statistics, and optionally the time
+of each extraction stage (util.StageTimer).
+
+classify_reports() -- Classify reports with util.ReportClassifier (anaphylaxis screening), serially or in a pool
+of worker processes, and return the classifications aligned with the report IDs.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import sys, re, csv, ast, time, logging, argparse, itertools, multiprocessing
+import util, textan, extractcache
+from dbstore import dbstore
+from reportdata import FeatureStruct
+
+##: Fields every report dictionary must have before it can be processed and stored
+reportFieldNames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender','Free Text', 'Lab Text',
+                    'Serious', 'Died', 'Location', 'History', 'Received Date', 'Lot Number', 'Indication', 'Primary Suspect',
+                    'Birth Date', 'First Name', 'Middle Initial', 'Last Name', 'Patient ID', 'MFR Control Number']
+
+def _csv_row_report(fieldnames, row, isFAERS):
+    if len(row)==9:
+        row.append(row[8])
+    row[5]=row[5].rstrip()
+    row[6]=row[6].rstrip()
+    row[5] = re.sub('\n', ', ', row[5])
+    row[6] = re.sub('\n', '; ', row[6])
+
+    if isFAERS:
+        row[2] = ''
+        row[3] = ''
+    return dict(zip(fieldnames, row))
+
+def iter_saved_report_csv(rows):
+    """Yield the reports of the csv file saved by ETHER (12 columns), from an iterator of rows"""
+    fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text', 'Received Date', 'Lot Number', 'Free Text']
+    rows = iter(rows)
+    row = next(rows, None)
+    if row is None:
+        return
+    if not row[0][0].isdigit():
+        row = next(rows, None)
+        if row is None:
+            return
+
+    if len(row[0].split('-')[0]) > 6:
+        isFAERS = True
+    else:
+        isFAERS = False
+
+    yield _csv_row_report(fieldnames, row, isFAERS)
+    for row in rows:
+        yield _csv_row_report(fieldnames, row, isFAERS)
+
+def read_saved_report_csv(reports_data):
+    """Read the csv file saved by ETHER (12 columns)"""
+    return list(iter_saved_report_csv(reports_data))
+
+def iter_vaers_report_csv(rows):
+    """Yield the reports of the VAERS csv export (fewer than 12 columns), from an iterator of rows"""
+    fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text','Free Text']
+    rows = iter(rows)
+    next(rows, None)    ##: header
+    row = next(rows, None)
+    if row is None:
+        return
+
+    if len(row[0]) > 6:
+        isFAERS = True
+    else:
+        isFAERS = False
+
+    yield _csv_row_report(fieldnames, row, isFAERS)
+    for row in rows:
+        yield _csv_row_report(fieldnames, row, isFAERS)
+
+def vaers_report_csv_reader(reports_data):
+    """Read the VAERS csv export (fewer than 12 columns)"""
+    return list(iter_vaers_report_csv(reports_data))
+
+def _txt_line_report(line, isFAERS):
+    fieldnames = ['Report ID','Age','Date of Exposure','Date of Onset','Vaccines','Vaccine Names','MedDRA','Gender', 'Lab Text','Received Date', 'Lot Number', 'Free Text']
+    #drop initial '"' and trailing '"\n'. split on '" ,  "'
+    fields = re.split('", "|","', line[1:-2])
+    if isFAERS:
+        fields[2] = ''
+        fields[3] = ''
+    if fields[10]=='NULL':
+        fields[10]=''
+    return dict(zip(fieldnames, fields))
+
+def _merge_lot_number(rpt, report):
+    if report['Lot Number']!='':
+        if rpt['Lot Number']=='':
+            rpt['Lot Number'] = report['Lot Number']
+        else:
+            rpt['Lot Number'] += '; ' + report['Lot Number']
+
+def vaers_report_txt_reader(reader):
+    """Read the VAERS/FAERS txt export, one quoted report per line.
+    Lines with a repeated Report ID only contribute their lot numbers."""
+    report_form_data = []
+    if len(reader[0][0].split('-')[0]) > 6:
+        isFAERS = True
+    else:
+        isFAERS = False
+
+    dictReports = {}
+    for line in reader:
+        report = _txt_line_report(line, isFAERS)
+
+        if report['Report ID'] in dictReports:
+            _merge_lot_number(dictReports[report['Report ID']], report)
+            continue
+
+        dictReports[report['Report ID']] = report
+        report_form_data.append(report)
+
+    return report_form_data
+
+def txt_repeated_lot_numbers(lines):
+    """Return {Report ID: lot numbers} of the lines of a VAERS/FAERS txt export that repeat a Report ID,
+    in the order of the file. Only the IDs and the lot numbers of the repeated lines are kept in memory."""
+    isFAERS = None
+    seen = set()
+    repeatedLots = {}
+    for line in lines:
+        if isFAERS is None:
+            isFAERS = len(line[0].split('-')[0]) > 6    ##: as in vaers_report_txt_reader()
+        report = _txt_line_report(line, isFAERS)
+
+        if report['Report ID'] in seen:
+            repeatedLots.setdefault(report['Report ID'], []).append(report['Lot Number'])
+        else:
+            seen.add(report['Report ID'])
+    return repeatedLots
+
+def iter_vaers_report_txt(lines, repeatedLots = None):
+    """Yield the reports of the VAERS/FAERS txt export, one quoted report per line, from an iterator of lines.
+    Lines with a repeated Report ID only contribute their lot numbers, as in vaers_report_txt_reader().
+    repeatedLots is given by txt_repeated_lot_numbers(), a first pass over the lines: the lot numbers are
+    then merged wherever the ID is repeated. Without it, only the lines right after the report are merged,
+    since a report is yielded when the next Report ID starts."""
+    isFAERS = None
+    seen = set()
+    pending = None
+    for line in lines:
+        if isFAERS is None:
+            isFAERS = len(line[0].split('-')[0]) > 6    ##: as in vaers_report_txt_reader()
+        report = _txt_line_report(line, isFAERS)
+
+        if report['Report ID'] in seen:
+            if repeatedLots is None and report['Report ID']==pending['Report ID']:
+                _merge_lot_number(pending, report)
+            continue
+
+        if pending:
+            yield pending
+        seen.add(report['Report ID'])
+        for lot in (repeatedLots or {}).get(report['Report ID'], []):
+            _merge_lot_number(report, {'Lot Number': lot})
+        pending = report
+
+    if pending:
+        yield pending
+
+def complement_report_fields(report_form_data):
+    """Add the missing fields with default values, and remove non-ascii characters from the narratives"""
+    if not report_form_data:
+        return report_form_data
+
+    for fld in reportFieldNames:
+        if not fld in report_form_data[0].keys():
+            default = ''
+            if fld=='Gender':
+                default = 'UNKNOWN'
+            elif fld=='Died' or fld=='Serious':
+                default = False
+
+            for report in report_form_data:
+                report[fld] = default
+
+    for report in report_form_data:
+        report['Free Text'] = util.remove_nonascii(report['Free Text'])
+
+    return report_form_data
+
+def read_data_file(filename):
+    """Read a data file into a list of report dictionaries.
+    FAERS Business Objects csv files, XML label files and report ID lists need the GUI, and raise ValueError here."""
+    with open(filename, 'r') as f:
+        if filename[-3:]=='csv':
+            reader = csv.reader(f)
+            raw_data = [row for row in reader]
+            ncol = len(raw_data[0])
+            if ncol==12:
+                report_form_data = read_saved_report_csv(raw_data)
+            elif ncol>2 and ncol<12:
+                report_form_data = vaers_report_csv_reader(raw_data)
+            else:
+                raise ValueError(filename + ": data file format is not supported in batch mode!")
+        else:
+            raw_data = f.readlines()
+            raw_data = [r for r in raw_data if r!=''] ##: remove empty line
+
+            ncol = len(re.split('", "|","', raw_data[0]))
+            if ncol>2:
+                report_form_data = vaers_report_txt_reader(raw_data)
+            else:
+                raise ValueError(filename + ": data file format is not supported in batch mode!")
+
+    return complement_report_fields(report_form_data)
+
+def iter_data_file(filename):
+    """Yield the reports of a data file one at a time, reading it row by row, so that the memory used
+    does not depend on the file size, other than the Report IDs of a txt export. The formats are those of
+    read_data_file(), and the reports are the same; a txt export is read twice, see iter_vaers_report_txt(). ValueError is raised by the first next() for other formats."""
+    with open(filename, 'r') as f:
+        if filename[-3:]=='csv':
+            rows = csv.reader(f)
+            row = next(rows, None)
+            if row is None:
+                return
+            ncol = len(row)
+            rows = itertools.chain([row], rows)
+            if ncol==12:
+                reports = iter_saved_report_csv(rows)
+            elif ncol>2 and ncol<12:
+                reports = iter_vaers_report_csv(rows)
+            else:
+                raise ValueError(filename + ": data file format is not supported in batch mode!")
+        else:
+            lines = (line for line in f if line!='')
+            line = next(lines, None)
+            if line is None:
+                return
+            ncol = len(re.split('", "|","', line))
+            if ncol>2:
+                ##: a first pass over the file for the lot numbers of the repeated Report IDs
+                repeatedLots = txt_repeated_lot_numbers(itertools.chain([line], lines))
+                f.seek(0)
+                reports = iter_vaers_report_txt((line for line in f if line!=''), repeatedLots)
+            else:
+                raise ValueError(filename + ": data file format is not supported in batch mode!")
+
+        for report in reports:
+            yield complement_report_fields([report])[0]
+
+def create_extractor():
+    """Create a feature extractor with config.py and the lexicon files in the current directory"""
+    return textan.FeatureExtractor()
+
+def create_cache(filename = extractcache.extractionCacheFile, extractor = None):
+    """Open the extraction cache for the extractor, or for config.py and the lexicon files in the current directory."""
+    if extractor:
+        (config, lexicon) = (extractor.config, extractor.lexicon)
+    else:
+        with open('config.py', 'r') as f:
+            config = ast.literal_eval(f.read())
+        (lexicon, tables) = textan.load_lexicon()
+    return extractcache.ExtractionCache(filename, extractcache.engine_digest(config, lexicon))
+
+def report_cache_key(cache, report):
+    """Key of the report extraction in the cache"""
+    return cache.getKey(report['Free Text'], report['Date of Exposure'], report['Date of Onset'], report['Received Date'],
+                        util.ReportUtil.get_report_type(report))
+
+def extract_report(extractor, report, codeSummary = False, cache = None):
+    """Extract features and time information from the report narrative, and fill in the report fields.
+    With an extraction cache, a cached result is used, or the new one is stored.
+    An extraction is timed by extractor.timer if it is enabled. A degraded extraction, over the extractor budget, is not cached.
+    Return (report, documentFeature); documentFeature is None if nothing could be extracted."""
+    reportType = util.ReportUtil.get_report_type(report)
+
+    documentFeature = None
+    if cache:
+        key = report_cache_key(cache, report)
+        documentFeature = cache.get(key)
+
+    if documentFeature is None:
+        with extractor.timer.document(report['Report ID'], len(report['Free Text'] or '')):
+            documentFeature= extractor.extract_features_temporal(
+                            report['Free Text'], report['Date of Exposure'], report['Date of Onset'], report['Received Date'], reportType)
+        if cache and documentFeature and not documentFeature.getDegraded():
+            cache.put(key, documentFeature)
+
+    return fill_report(report, documentFeature, codeSummary)
+
+def fill_report(report, documentFeature, codeSummary = False):
+    """Fill in the report fields with the extracted DocumentFeature. Return (report, documentFeature)."""
+    reportType = util.ReportUtil.get_report_type(report)
+
+    if not documentFeature:
+        report['PreferredTerms'] = ''
+        report['Features'] = []
+        report['Exposure Date'] = None
+        report['Onset Date'] = None
+        report['CalculatedOnsetTime'] = None
+        report['DatesConfidence'] = None
+        report['Timexes'] = []
+        report['Lab Data'] = ''
+        report['Comment'] = ''
+        report['Class'] = 0
+        report['DxLevel'] = ''
+        report['Review'] = ''
+        report['Action'] = 0
+        report['Mark'] = False
+        report['Degraded'] = ''
+        report['Annotations'] = []
+        report['Summarizations'] = []
+        report['TimeAnnotations'] = []
+        return (report, None)
+
+    featuresTM = documentFeature.getFeatureArray()
+    features = [FeatureStruct(feat) for feat in featuresTM]
+
+    report['PreferredTerms'] = ''
+
+    report['Features'] = features
+
+    report['Exposure Date'] = documentFeature.getExposeDate()
+    report['Onset Date'] = documentFeature.getOnsetDate()
+    report['CalculatedOnsetTime'] = documentFeature.getCalculatedOnsetTimeHours()
+    report['DatesConfidence'] = documentFeature.getConfidenceLevel()
+
+    report['Date of Exposure'] = documentFeature.getInputExpDate()
+    report['Date of Onset'] = documentFeature.getInputOnsetDate()
+    report['Received Date'] = documentFeature.getReceivedDate()
+
+    report['Review'] = util.ReportUtil.getReportSummary(report, reportType, codeSummary)
+    report['Action'] = -1
+    report['Mark'] = False
+    report['Degraded'] = documentFeature.getDegraded()
+
+    report['Comment'] = ''
+    (report['Class'], report['DxLevel']) = ('', 0)
+
+    report['Timexes'] = documentFeature.getTimexes()
+
+    report['Annotations'] = []
+    report['TimeAnnotations'] = []
+    report['Summarizations'] = []
+
+    report['Lab Data'] = ''
+
+    return (report, documentFeature)
+
+def commit_report(db, report, timexList):
+    """Store the report form data, the extracted features and the timexes in the database.
+    timexList is given by DocumentFeature.getTimexesDB()"""
+    report_form_data = (report['Report ID'], report['Age'], report['Date of Exposure'], report['Date of Onset'], report['Vaccines'],
+                        report['Vaccine Names'], report['MedDRA'], report['Gender'], report['Free Text'], report['Lab Text'],
+                        report['Serious'], report['Died'], report['Location'], report['History'], report['Received Date'],
+                        report['Lot Number'], report['Indication'], report['Primary Suspect'],
+                        report['Birth Date'], report['First Name'], report['Middle Initial'], report['Last Name'],
+                        report['Patient ID'], report['MFR Control Number'])
+    db.insertReportForm(report_form_data)
+
+    if report['Exposure Date']:
+        strExpDateEst = report['Exposure Date'].isoformat().split('T')[0]
+    else:
+        strExpDateEst = ''
+    if report['Onset Date']:
+        strOnsetDateEst = report['Onset Date'].isoformat().split('T')[0]
+    else:
+        strOnsetDateEst = ''
+    document_feature = (report['Report ID'], strExpDateEst, strOnsetDateEst, report['CalculatedOnsetTime'], report['DatesConfidence'],
+                        report['PreferredTerms'], report['Comment'], report['Review'], report['Action'], report['Class'], report['DxLevel'], report['Mark'],
+                        report.get('Degraded', ''))
+    db.insertReportFeature(document_feature)
+
+    featList = []
+    for feat in report['Features']:
+        featrow = feat.getDBFeatureTableRow()
+        featList.append(featrow)
+
+    db.insertFeatures(report['Report ID'], featList)
+
+    labList = []
+    for name, val, unit, specimen, strRange, evaluation, strTest in report['Lab Data']:
+        labList.append((name, val, unit, specimen, evaluation, strTest, '')) # the last '' is comment
+    db.insertLabTests(report['Report ID'], labList)
+
+    db.insertTimexes(report['Report ID'], timexList)
+
+    db.conn.commit()
+
+##: Report fields filled in by extract_report()
+extractedFieldNames = ['PreferredTerms', 'Features', 'Exposure Date', 'Onset Date', 'CalculatedOnsetTime', 'DatesConfidence',
+                       'Date of Exposure', 'Date of Onset', 'Received Date', 'Review', 'Action', 'Mark', 'Degraded', 'Comment', 'Class', 'DxLevel',
+                       'Timexes', 'Annotations', 'TimeAnnotations', 'Summarizations', 'Lab Data']
+
+def pack_extraction(report, documentFeature):
+    """Compact extraction result of a report: the extracted fields, with features as tuples, and the timex list for the database"""
+    fields = dict((fld, report[fld]) for fld in extractedFieldNames if fld in report)
+    fields['Features'] = [feat.getRecord() for feat in report['Features']]
+    if documentFeature:
+        timexList = documentFeature.getTimexesDB()
+    else:
+        timexList = None
+    return (fields, timexList)
+
+def unpack_extraction(report, (fields, timexList)):
+    """Fill the report with a packed extraction result, return the timex list"""
+    report.update(fields)
+    report['Features'] = [FeatureStruct(feat) for feat in fields['Features']]
+    return timexList
+
+##: Feature extractor of a worker process, created once by _init_worker()
+##: Reports of the input held at a time by iter_extractions() with a pool, in chunks per worker
+windowChunks = 8
+
+_worker_extractor = None
+_worker_codeSummary = False
+_worker_serialize = False
+
+def _init_worker(codeSummary, serialize = False, timing = False, budget = None):
+    global _worker_extractor, _worker_codeSummary, _worker_serialize
+    _worker_extractor = create_extractor()
+    _worker_extractor.timer.enable(timing)
+    if budget:
+        _worker_extractor.set_document_budget(*budget)
+    _worker_codeSummary = codeSummary
+    _worker_serialize = serialize
+
+def sentence_cache_counts(extractor):
+    """Return the (hits, misses) of the sentence cache of the extractor so far"""
+    cache = extractor.sentence_cache
+    if cache is None:
+        return (0, 0)
+    return (cache.hits, cache.misses)
+
+def _add_sentence_counts(sentenceStats, before, after):
+    if sentenceStats is not None:
+        sentenceStats['hits'] = sentenceStats.get('hits', 0) + after[0] - before[0]
+        sentenceStats['misses'] = sentenceStats.get('misses', 0) + after[1] - before[1]
+
+def _extract_in_worker(report):
+    counts = sentence_cache_counts(_worker_extractor)
+    try:
+        (report, documentFeature) = extract_report(_worker_extractor, report, _worker_codeSummary)
+    except Exception as e:
+        return (None, str(e), None, _worker_extractor.timer.popDocuments(), (counts, sentence_cache_counts(_worker_extractor)))
+    ##: the serialized DocumentFeature, for the calling process to store in the extraction cache
+    data = None
+    if _worker_serialize and documentFeature and not documentFeature.getDegraded():
+        data = extractcache.dumps(documentFeature)
+    ##: the stage times and the sentence cache use of the report, for the calling process to merge
+    return (pack_extraction(report, documentFeature), None, data, _worker_extractor.timer.popDocuments(), 
+            (counts, sentence_cache_counts(_worker_extractor)))
+
+def iter_extractions(reports, extractor = None, codeSummary = False, workers = 1, chunksize = 16, cache = None, timer = None,
+                     sentenceStats = None, budget = None):
+    """Extract the reports and yield (report, timexList, error) in the input order.
+    timexList is None if nothing is extracted, error is None unless the extraction failed.
+    With workers > 1, the reports are sent in chunks to a pool of worker processes, each with its own extractor.
+    With an extraction cache, the cached reports are not extracted again, and the new results are stored.
+    With an enabled util.StageTimer, the stages of every extraction are timed, in this process or in the workers.
+    The hits and misses of the sentence caches of the extractors are added to the sentenceStats dictionary.
+    A budget (maxChars, maxSeconds) is set on the extractors, see FeatureExtractor.set_document_budget()."""
+    if workers <= 1:
+        if not extractor:
+            extractor = create_extractor()
+        if timer:
+            extractor.timer = timer
+        if budget:
+            extractor.set_document_budget(*budget)
+        for report in reports:
+            counts = sentence_cache_counts(extractor)
+            try:
+                (report, documentFeature) = extract_report(extractor, report, codeSummary, cache)
+            except Exception as e:
+                yield (report, None, str(e))
+                continue
+            finally:
+                _add_sentence_counts(sentenceStats, counts, sentence_cache_counts(extractor))
+            if documentFeature:
+                yield (report, documentFeature.getTimexesDB(), None)
+            else:
+                yield (report, None, None)
+        return
+
+    ##: the reports are consumed twice, sent to the pool and merged with the results, a window at a time
+    ##: (Pool.imap would read all the input ahead)
+    timing = bool(timer and timer.enabled)
+    pool = None
+    reports = iter(reports)
+    try:
+        while True:
+            window = list(itertools.islice(reports, workers * chunksize * windowChunks))
+            if not window:
+                break
+            
+            keys = [None] * len(window)
+            cached = [None] * len(window)
+            if cache:
+                for i, report in enumerate(window):
+                    keys[i] = report_cache_key(cache, report)
+                    cached[i] = cache.get(keys[i])
+            misses = [report for (report, hit) in zip(window, cached) if hit is None]
+            
+            results = None
+            if misses:
+                ##: no pool is started while all reports are cached
+                if not pool:
+                    pool = multiprocessing.Pool(workers, _init_worker, (codeSummary, cache is not None, timing, budget))
+                results = pool.imap(_extract_in_worker, misses, chunksize)
+            
+            for i, report in enumerate(window):
+                if cached[i] is not None:
+                    (report, documentFeature) = fill_report(report, cached[i], codeSummary)
+                    yield (report, documentFeature.getTimexesDB(), None)
+                    continue
+                    
+                (packed, error, data, timings, (before, after)) = next(results)
+                for record in timings:
+                    timer.mergeDocument(record)
+                _add_sentence_counts(sentenceStats, before, after)
+                if error:
+                    yield (report, None, error)
+                    continue
+                if data:
+                    cache.putSerialized(keys[i], data)
+                timexList = unpack_extraction(report, packed)
+                yield (report, timexList, None)
+        if pool:
+            pool.close()
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+_worker_classifier = None
+
+def _init_classifier_worker():
+    global _worker_classifier
+    _worker_classifier = util.ReportClassifier()
+
+def _classify_in_worker(text):
+    try:
+        return (_worker_classifier.classify_text(text), None)
+    except Exception as e:
+        return (None, str(e))
+
+def classify_reports(reports, workers = 1, chunksize = 64, classifier = None):
+    """Classify the narratives of the reports with util.ReportClassifier. Return (reportIds, classes), two lists
+    in the order of the reports, where classes[i] is 'positive', '' or None if the report couldn't be classified.
+    With workers > 1, the narratives are sent in chunks to a pool of worker processes, each with its own classifier."""
+    reportIds = []
+    texts = []
+    for report in reports:
+        reportIds.append(report['Report ID'])
+        texts.append(report['Free Text'])
+    
+    if workers <= 1:
+        if not classifier:
+            classifier = util.ReportClassifier()
+        results = []
+        for text in texts:
+            try:
+                results.append((classifier.classify_text(text), None))
+            except Exception as e:
+                results.append((None, str(e)))
+    else:
+        pool = multiprocessing.Pool(workers, _init_classifier_worker)
+        try:
+            results = pool.map(_classify_in_worker, texts, chunksize)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    
+    classes = []
+    for reportid, (cls, error) in zip(reportIds, results):
+        if error:
+            logging.warning("Couldn't classify report " + reportid + ". " + error)
+        classes.append(cls)
+    return (reportIds, classes)
+
+def iter_extracted_reports(filename, extractor = None, codeSummary = False, workers = 1, chunksize = 16, cache = None, timer = None,
+                           sentenceStats = None, budget = None):
+    """Read and extract the reports of a data file as a stream: yield (report, timexList, error) one report
+    at a time, as iter_extractions(), with a memory use independent of the file size."""
+    return iter_extractions(iter_data_file(filename), extractor, codeSummary, workers, chunksize, cache, timer, sentenceStats, budget)
+
+def run_batch(filename, dbname = 'etherlocal.db', overwrite = False, codeSummary = False, workers = 1, chunksize = 16,
+              cacheFile = extractcache.extractionCacheFile, timingFile = None, budget = None, reprocessDegraded = False):
+    """Extract and store all reports in the data file.
+    Reports already text-mined in the database are skipped unless overwrite is True, or unless reprocessDegraded
+    is True and they were stored degraded, i.e., with the features only because they were over the budget.
+    With a budget (maxChars, maxSeconds), a longer or slower report gets the features only, and is flagged in the database.
+    With workers > 1, extraction runs in a process pool, and the database is written by this process only.
+    A stored report is replaced only by a successful extraction: one that fails in a worker keeps its stored results.
+    Unchanged narratives are taken from the extraction cache file, unless cacheFile is None.
+    With a timingFile, the time of every extraction stage is written to it, per report as it ends and in total (CSV or JSON).
+    The file is read, extracted and stored one report at a time.
+    Return a dictionary of statistics, including the throughput in reports/sec, the hits/misses of the
+    extraction and sentence caches, and the stage times."""
+
+    t0 = time.time()
+    if workers <= 1:
+        extractor = create_extractor()
+    else:
+        extractor = None    ##: each worker creates its own
+    tInit = time.time() - t0
+    lexiconStats = dict(textan.lexiconLoadStats)
+    
+    cache = None
+    if cacheFile:
+        cache = create_cache(cacheFile, extractor)
+    timer = util.StageTimer(timingFile is not None)
+    if timingFile:
+        ##: the records of the reports are written as they end, not kept for the whole run
+        timer.open_output(timingFile)
+
+    db = dbstore(dbname, "", '')
+
+    stats = {'reports': 0, 'processed': 0, 'skipped': 0, 'failed': 0, 'degraded': 0, 'init_seconds': tInit, 'workers': workers,
+             'lexicon': lexiconStats}
+    t0 = time.time()
+    
+    def to_skip(reportid):
+        return (db.checkid(reportid) and not overwrite and db.hasTextMined(reportid) 
+                and not (reprocessDegraded and db.isDegraded(reportid)))
+    
+    ##: IDs sent to the extraction; a pool pulls a window of reports before any is stored, so a report ID seen 
+    ##: again is only checked against the database when it is stored, as the serial extraction would find it
+    pulledIds = set()
+    
+    def reports_to_extract():
+        ##: the data file is streamed, and the reports are pulled by the extraction as it goes
+        for report in iter_data_file(filename):
+            stats['reports'] += 1
+            reportid = report['Report ID']
+            if reportid not in pulledIds and to_skip(reportid):
+                stats['skipped'] += 1
+                continue
+            pulledIds.add(reportid)
+            yield report
+
+    sentenceStats = {'hits': 0, 'misses': 0}
+    for report, timexList, error in iter_extractions(reports_to_extract(), extractor, codeSummary, workers, chunksize, cache, timer,
+                                                     sentenceStats, budget):
+        reportid = report['Report ID']
+        if to_skip(reportid):
+            stats['skipped'] += 1
+            continue
+        
+        if error:
+            if db.hasTextMined(reportid):
+                error += " The stored results are kept."
+            logging.warning("Couldn't process report " + report['Report ID'] + ". " + error)
+            stats['failed'] += 1
+            continue
+
+        if timexList is not None:
+            ##: replaced only by a successful extraction, a failed one leaves the stored report alone
+            if db.checkid(reportid):
+                db.deleteReport(reportid)
+            commit_report(db, report, timexList)
+        if report.get('Degraded'):
+            stats['degraded'] += 1
+        stats['processed'] += 1
+
+    stats['seconds'] = time.time() - t0
+    db.create_index()
+    db.conn.commit()
+    db.close()
+    
+    if cache:
+        stats['cache'] = cache.getStats()
+        cache.close()
+        
+    lookups = sentenceStats['hits'] + sentenceStats['misses']
+    sentenceStats['hit_rate'] = float(sentenceStats['hits']) / lookups if lookups else 0.
+    stats['sentence_cache'] = sentenceStats
+        
+    if timingFile:
+        stats['timing'] = timer.getTotals()
+        timer.close_output()
+
+    if stats['seconds'] > 0:
+        stats['reports_per_sec'] = stats['processed'] / stats['seconds']
+    else:
+        stats['reports_per_sec'] = 0.
+
+    return stats
+
+if __name__ == "__main__":
+    ##: first, so that a worker of a frozen executable doesn't parse the command line
+    multiprocessing.freeze_support()
+    logging.basicConfig(level=logging.WARN)
+
+    argparser = argparse.ArgumentParser(description='ETHER headless batch extraction')
+    argparser.add_argument('datafile', help='VAERS/FAERS txt export, or VAERS csv file')
+    argparser.add_argument('--db', default='etherlocal.db', help='local database file (default: etherlocal.db)')
+    argparser.add_argument('--overwrite', action='store_true', help='re-extract reports already in the database')
+    argparser.add_argument('--code-summary', action='store_true', help='use MedDRA terms in the report summary')
+    argparser.add_argument('--workers', type=int, default=1, help='number of extraction processes (default: 1, no pool)')
+    argparser.add_argument('--chunksize', type=int, default=16, help='reports sent to a worker at a time (default: 16)')
+    argparser.add_argument('--cache', default=extractcache.extractionCacheFile, 
+                           help='extraction cache file (default: %s)' % extractcache.extractionCacheFile)
+    argparser.add_argument('--no-cache', action='store_true', help='extract every report, without the extraction cache')
+    argparser.add_argument('--max-chars', type=int, default=0, metavar='N', 
+                           help='extract the features only, without time, of the narratives longer than N characters')
+    argparser.add_argument('--max-seconds', type=float, default=0, metavar='SEC', 
+                           help='extract the features only of the reports still in the temporal stage after SEC seconds')
+    argparser.add_argument('--reprocess-degraded', action='store_true', 
+                           help='re-extract the reports stored with the features only, e.g., without --max-chars/--max-seconds')
+    argparser.add_argument('--timing', metavar='FILE', help='write the time of each extraction stage per report to FILE (.csv or .json)')
+    argparser.add_argument('--classify', metavar='CSVFILE', 
+                           help='classify the reports (anaphylaxis screening) into CSVFILE instead of extracting them')
+    args = argparser.parse_args()
+
+    if args.classify:
+        t0 = time.time()
+        (reportIds, classes) = classify_reports(iter_data_file(args.datafile), args.workers, args.chunksize)
+        seconds = time.time() - t0
+        with open(args.classify, 'wb') as f:
+            writer = csv.writer(f, dialect='excel', delimiter=',')
+            writer.writerow(['Report ID', 'Classification'])
+            for reportid, cls in zip(reportIds, classes):
+                writer.writerow([reportid, cls if cls is not None else 'error'])
+        print 'Classified %d reports in %.2f sec: %d positive, %d failed' % (len(reportIds), seconds, classes.count('positive'),
+                                classes.count(None))
+        sys.exit(0 if None not in classes else 1)
+    cacheFile = None if args.no_cache else args.cache
+    stats = run_batch(args.datafile, args.db, args.overwrite, args.code_summary, args.workers, args.chunksize, cacheFile, 
+                      args.timing, (args.max_chars, args.max_seconds), args.reprocess_degraded)
+
+    if args.workers <= 1:
+        print 'Extractor initialized in %.2f sec' % stats['init_seconds']
+        lexiconStats = stats['lexicon']
+        if lexiconStats.get('source')=='compiled':
+            print 'Lexicon loaded from the compiled file in %.2f sec (%.2f sec saved over parsing the text lexicons)' % (
+                                lexiconStats['seconds'], lexiconStats['saved_seconds'])
+        elif lexiconStats:
+            print 'Lexicon parsed from the text files in %.2f sec, compiled file rebuilt' % lexiconStats['seconds']
+    print 'Processed %d of %d reports (%d skipped, %d failed) in %.2f sec: %.2f reports/sec' % (stats['processed'], stats['reports'],
+                                stats['skipped'], stats['failed'], stats['seconds'], stats['reports_per_sec'])
+    if stats['degraded']:
+        print 'Over the budget: %d reports extracted without time, flagged for --reprocess-degraded' % stats['degraded']
+    if 'cache' in stats:
+        print 'Extraction cache: %d hits, %d misses (hit rate %.2f), %d entries' % (stats['cache']['hits'], stats['cache']['misses'],
+                                stats['cache']['hit_rate'], stats['cache']['size'])
+    print 'Sentence cache: %d hits, %d misses (hit rate %.2f)' % (stats['sentence_cache']['hits'], stats['sentence_cache']['misses'],
+                                stats['sentence_cache']['hit_rate'])
+    if 'timing' in stats:
+        print 'Stage times written to %s' % args.timing
+        for name, stageStats in stats['timing'].items():
+            print '    %-40s %8.3f sec %7d calls' % (name, stageStats['seconds'], stageStats['calls'])
+    sys.exit(0 if stats['failed']==0 else 1)
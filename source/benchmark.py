@@ -0,0 +1,762 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Performance benchmarks for the ETHER extraction engine
+
+This module times the extraction components on report narratives, and checks that the
+faster implementations give the same results as the reference ones. The suite benchmark
+measures the throughput and latency of the whole application on a data file, or on synthetic
+reports (reportgen.py). Every run writes its results to a JSON file, to compare versions.
+It can be run from the command line, from the source folder:
+
+    python benchmark.py tagger [--data reports.txt] [--repeat 20]
+    python benchmark.py suite [--synthetic 1000] [--seed 0] [--output results.json]
+    python benchmark.py startup [--reference HEAD] [--repeat 5]
+    python benchmark.py classifier [--synthetic 1000] [--workers 4]
+    python benchmark.py memory [--synthetic 1000] [--reference HEAD]
+    python benchmark.py timexscan [--data reports.txt] [--repeat 3]
+    python benchmark.py timexmerge [--sentences 50,100,200,400] [--repeat 3]
+    python benchmark.py dates [--synthetic 1000]
+    python benchmark.py formdates [--reports 100000]
+
+The core functions it provides include:
+
+load_narratives() -- Read the free text of the reports in a data file.
+
+bench_tagger() -- Compare the tokens/sec of FastTagger against LinearTagger.
+
+bench_chunker() -- Compare the sentences/sec of chunker.TagChunker against nltk.RegexpParser on the config grammars.
+
+bench_cascade() -- Compare the per-sentence latency of the feature chunking with and without the cascade.
+
+bench_classifier() -- Compare the reports/sec of util.ReportClassifier with nltk.RegexpTagger and nltk.RegexpParser, with
+its hash tagger and TagChunker, and in a pool of worker processes (batch.classify_reports).
+
+run_suite() -- Measure reports/sec and p50/p99 latency of the extraction, the timex annotation, the
+database insert/retrieve, the report filters and the group analysis curves.
+
+bench_startup() -- Measure the import time of the engine modules in new processes, and the heavy packages they load.
+
+bench_memory() -- Measure the bytes per report of the extracted and annotated reports, and of each report data class.
+
+bench_timex_scanner() -- Compare the tokens/sec of timexan.findTimexes() with the window prefilter and the timex scanner against
+the loop over the patterns.
+
+bench_timex_merge() -- Compare the latency of timexan.findTimexes() on narratives dense in dates, with the indexed and the pairwise
+merge of the timexes.
+
+bench_date_parsers() -- Compare the dates/sec of the timexan date parsers with and without their caches, and measure the hit rates.
+
+bench_form_dates() -- Compare the dates/sec of dateutil and of timexan.parse_date() on the report dates reloaded from the database.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import os, sys, time, datetime, random, argparse, json, platform, subprocess, tempfile, shutil, cPickle
+import dateutil.parser
+import nltk
+import util, textan, timexan, chunker, batch, extractcache, reportgen, perfgate
+from dbstore import dbstore
+
+##: Criteria of the filter benchmark, as (operator, feature type, string, from, to, axis) of MainWindow.apply_filter_criteria
+filterCriteria = [[('AND', 'SYMPTOM', 'Any', 0, 28, 'Vax')],
+                  [('AND', 'DIAGNOSIS', '', None, None, 'Date'), ('OR', 'DRUG', 'Any', None, None, 'Date')],
+                  [('AND', 'ALL', 'fever|rash|pain', -7, 60, 'Vax'), ('NOT', 'CAUSE_OF_DEATH', '', None, None, 'Date')],
+                  [('AND', 'SYMPTOM', 'Any', 0, 80, 'Age')]]
+##: Plot types and time axes of the group analysis curves
+curveAxes = ['From Exposure', 'Date of Occurrence', 'Age at Occurrence']
+curveFeatures = ['DIAGNOSIS', 'CAUSE_OF_DEATH', 'SECOND_LEVEL_DIAGNOSIS', 'SYMPTOM', 'RULE_OUT', 'MEDICAL_HISTORY', 
+                 'FAMILY_HISTORY', 'DRUG', 'VACCINE']
+
+def load_narratives(filename = 'reports.txt'):
+    """Return the free text of all reports in the data file."""
+    return [report['Free Text'] for report in batch.read_data_file(filename) if report['Free Text']]
+
+def load_reports(filename = 'reports.txt', synthetic = 0, seed = 0, faersRatio = 0.):
+    """Return the reports of the data file, or synthetic reports if synthetic > 0."""
+    if synthetic > 0:
+        return reportgen.ReportGenerator(seed, faersRatio).generate(synthetic)
+    return batch.read_data_file(filename)
+
+def tokenize_narratives(narratives):
+    """Return the lower case tokens of every sentence, as they are given to the tagger."""
+    sentences = []
+    for text in narratives:
+        for sentence in util.sentence_tokenize(text):
+            sentences.append([w.lower() for w in nltk.word_tokenize(sentence)])
+    return sentences
+
+def _time_tagger(tagger, sentences, repeat):
+    tags = []
+    t0 = time.time()
+    for i in range(repeat):
+        tags = [tagger.tag(tokens) for tokens in sentences]
+    return (time.time() - t0, tags)
+
+def bench_tagger(sentences, repeat = 20, lexicon = None, lexiconTables = None):
+    """Tag the sentences repeat times with LinearTagger and with FastTagger (its cache starting empty).
+    Return a dictionary with tokens/sec of both taggers, the speedup and whether the tags are identical."""
+    if lexicon is None:
+        (lexicon, lexiconTables) = textan.load_lexicon()
+    numTokens = sum(len(tokens) for tokens in sentences) * repeat
+
+    linear = textan.LinearTagger(lexicon, lexiconTables)
+    fast = textan.FastTagger(lexicon, lexiconTables)
+    (secLinear, tagsLinear) = _time_tagger(linear, sentences, repeat)
+    (secFast, tagsFast) = _time_tagger(fast, sentences, repeat)
+
+    return {'benchmark': 'tagger', 'tokens': numTokens, 'repeat': repeat,
+            'linear_tokens_per_sec': numTokens / secLinear, 'fast_tokens_per_sec': numTokens / secFast,
+            'speedup': secLinear / secFast, 'identical': tagsLinear==tagsFast, 'cache': fast.cache.getStats()}
+
+def _time_parser(parser, sentences, repeat):
+    trees = []
+    t0 = time.time()
+    for i in range(repeat):
+        trees = [parser.parse(tagged) for tagged in sentences]
+    return (time.time() - t0, trees)
+
+def bench_chunker(taggedSentences, grammar, repeat = 5):
+    """Chunk the tagged sentences repeat times with nltk.RegexpParser and with TagChunker.
+    Return a dictionary with sentences/sec of both parsers, the speedup and whether the trees are identical."""
+    taggedSentences = [tagged for tagged in taggedSentences if tagged]
+    numSentences = len(taggedSentences) * repeat
+
+    (secNltk, treesNltk) = _time_parser(nltk.RegexpParser(grammar), taggedSentences, repeat)
+    (secChunker, treesChunker) = _time_parser(chunker.TagChunker(grammar), taggedSentences, repeat)
+
+    return {'benchmark': 'chunker', 'sentences': numSentences, 'repeat': repeat,
+            'nltk_sentences_per_sec': numSentences / secNltk, 'chunker_sentences_per_sec': numSentences / secChunker,
+            'speedup': secNltk / secChunker, 'identical': treesNltk==treesChunker}
+
+def bench_cascade(extractor, taggedSentences, repeat = 5):
+    """Extract the features of the tagged sentences, re-tokenizing the second pass input, and 
+    feeding it with the first pass leaves (cascade). The modes alternate for repeat rounds, and the 
+    fastest round of each is kept. Return a dictionary with the ms/sentence of both modes, for the 
+    whole chunking and for building the second pass input alone, the speedups and whether the 
+    features are identical."""
+    taggedSentences = [tagged for tagged in taggedSentences if tagged]
+    numSentences = len(taggedSentences)
+    trees = [extractor.cp.parse(tagged) for tagged in taggedSentences]
+    
+    modes = [('retokenize', False, extractor.get_second_pass_tokens), ('cascade', True, extractor.get_cascade_tokens)]
+    best = {}
+    features = {}
+    for i in range(repeat):
+        for mode, cascade, second_pass_tokens in modes:
+            t0 = time.time()
+            features[mode] = [extractor.extract_sentence_features(tagged, n, cascade) for n, tagged in enumerate(taggedSentences)]
+            t1 = time.time()
+            for tree in trees:
+                second_pass_tokens(tree)
+            t2 = time.time()
+            best[mode] = min(best.get(mode, (t1-t0, t2-t1)), (t1-t0, t2-t1))
+    
+    result = {'benchmark': 'cascade', 'sentences': numSentences, 'repeat': repeat}
+    for mode in best:
+        result[mode + '_ms_per_sentence'] = best[mode][0] * 1000. / numSentences
+        result[mode + '_second_pass_input_ms_per_sentence'] = best[mode][1] * 1000. / numSentences
+    result['speedup'] = result['retokenize_ms_per_sentence'] / result['cascade_ms_per_sentence']
+    result['second_pass_input_speedup'] = (result['retokenize_second_pass_input_ms_per_sentence'] / 
+                                           result['cascade_second_pass_input_ms_per_sentence'])
+    result['identical'] = features['retokenize']==features['cascade']
+    return result
+
+def bench_classifier(reports, workers = 4):
+    """Classify the reports with the reference classifier (nltk.RegexpTagger and nltk.RegexpParser), with 
+    util.ReportClassifier, and with batch.classify_reports() in workers processes. Return a dictionary with
+    the reports/sec of each, the speedups and whether the classifications are identical."""
+    reference = util.ReportClassifier()
+    reference.regexp_tagger = nltk.RegexpTagger(reference.lexicon)
+    reference.cp = nltk.RegexpParser(reference.grammar)
+    numReports = len(reports)
+    
+    t0 = time.time()
+    (reportIds, refClasses) = batch.classify_reports(reports, classifier=reference)
+    t1 = time.time()
+    (reportIds, classes) = batch.classify_reports(reports, classifier=util.ReportClassifier())
+    t2 = time.time()
+    (reportIds, poolClasses) = batch.classify_reports(reports, workers)
+    t3 = time.time()
+    
+    return {'benchmark': 'classifier', 'reports': numReports, 'workers': workers, 'positive': classes.count('positive'),
+            'reference_reports_per_sec': numReports / (t1 - t0), 'fast_reports_per_sec': numReports / (t2 - t1),
+            'pool_reports_per_sec': numReports / (t3 - t2), 'speedup': (t1 - t0) / (t2 - t1), 'pool_speedup': (t1 - t0) / (t3 - t2),
+            'identical': refClasses==classes and refClasses==poolClasses}
+
+def _timex_documents(narratives):
+    """Return the narratives as the input of timexan.findTimexes(), one sentence of all tokens each"""
+    documents = []
+    for text in narratives:
+        (tokens, starts) = util.TokenizedDocument(text).getTokenSpans()
+        documents.append({'stdin': {0: dict(enumerate(tokens))}})
+    return documents
+
+def bench_timex_scanner(narratives, repeat = 3):
+    """Find the timexes of the narratives repeat times with the loop over the patterns (legacy) and with the
+    window prefilter and timex scanner of timexan.findTimexes(). Return a dictionary with tokens/sec of both, 
+    the speedup, the windows pruned by the prefilter and whether the timex spans are identical."""
+    documents = _timex_documents(narratives)
+    numTokens = sum(len(doc['stdin'][0]) for doc in documents) * repeat
+
+    seconds = {}
+    spans = {}
+    for legacy in [True, False]:
+        timexan.reset_timex_window_stats()
+        t0 = time.time()
+        for i in range(repeat):
+            spans[legacy] = [[(timex['start'], timex['end']) for timex in timexan.findTimexes(doc, legacy)] for doc in documents]
+        seconds[legacy] = time.time() - t0
+
+    return {'benchmark': 'timexscan', 'tokens': numTokens, 'repeat': repeat, 'timexes': sum(len(s) for s in spans[False]),
+            'legacy_tokens_per_sec': numTokens / seconds[True], 'scanner_tokens_per_sec': numTokens / seconds[False],
+            'speedup': seconds[True] / seconds[False], 'windows': timexan.get_timex_window_stats(), 'identical': spans[True]==spans[False]}
+
+def bench_timex_merge(sizes = (50, 100, 200, 400), repeat = 3, seed = 0):
+    """Find the timexes of a synthetic narrative of each size (dated sentences, reportgen.ReportGenerator.generate_timeline()) 
+    with the pairwise merge (timexan.legacyTimexMerge) and with the indexed one, keeping the fastest of repeat rounds.
+    Return a dictionary with the latency of both for each size, the worst-case speedup and whether the timexes are identical."""
+    generator = reportgen.ReportGenerator(seed)
+    legacyMerge = timexan.legacyTimexMerge
+    results = []
+    identical = True
+    try:
+        for size in sizes:
+            document = _timex_documents([generator.generate_timeline(size)])[0]
+            res = {'sentences': size, 'tokens': len(document['stdin'][0])}
+            timexes = {}
+            for legacy in [True, False]:
+                timexan.legacyTimexMerge = legacy
+                latencies = []
+                for i in range(repeat):
+                    t0 = time.time()
+                    timexes[legacy] = timexan.findTimexes(document)
+                    latencies.append(time.time() - t0)
+                res[('legacy' if legacy else 'indexed') + '_ms'] = min(latencies) * 1000
+            res['timexes'] = len(timexes[False])
+            res['speedup'] = res['legacy_ms'] / res['indexed_ms']
+            identical = identical and timexes[True]==timexes[False]
+            results.append(res)
+    finally:
+        timexan.legacyTimexMerge = legacyMerge
+    
+    return {'benchmark': 'timexmerge', 'repeat': repeat, 'results': results, 'worst_legacy_ms': results[-1]['legacy_ms'], 
+            'worst_indexed_ms': results[-1]['indexed_ms'], 'speedup': results[-1]['speedup'], 'identical': identical}
+
+def bench_date_parsers(reports, repeat = 1):
+    """Parse the DATE timexes of the narratives as annotateTimexes() does (parse_raw_time(), then parse_string_complementary()), 
+    and the dates of the report forms (parse_time_string()), repeat times, without and with the caches of the parsers 
+    (timexan.memoizeDateParsers), the caches starting empty. Return a dictionary with the dates/sec of both, the speedup,
+    the cache statistics and whether the parsed dates are identical."""
+    timexStrings = []
+    for report in reports:
+        timexStrings += [timex.getString() for timex in timexan.annotateTimexes(report['Free Text']) if timex.getType()=='DATE']
+    formDates = [dateStr for report in reports for dateStr in _report_dates(report)]
+    numDates = (len(timexStrings) + len(formDates)) * repeat
+    
+    memoize = timexan.memoizeDateParsers
+    seconds = {}
+    parsed = {}
+    try:
+        for memo in [False, True]:
+            timexan.memoizeDateParsers = memo
+            timexan.clear_date_parser_caches()
+            t0 = time.time()
+            for i in range(repeat):
+                dates = []
+                for timexString in timexStrings:
+                    timexDate = timexan.parse_raw_time(timexString) if not ' to ' in timexString else None
+                    if not timexDate:
+                        timexDate = timexan.parse_string_complementary(timexString)
+                    dates.append(timexDate)
+                dates += [timexan.parse_time_string(dateStr) for dateStr in formDates]
+            seconds[memo] = time.time() - t0
+            parsed[memo] = dates
+        stats = timexan.get_date_parser_stats()
+    finally:
+        timexan.memoizeDateParsers = memoize
+    
+    return {'benchmark': 'dates', 'timexes': len(timexStrings), 'form_dates': len(formDates), 'repeat': repeat,
+            'uncached_dates_per_sec': numDates / seconds[False], 'cached_dates_per_sec': numDates / seconds[True],
+            'speedup': seconds[False] / seconds[True], 'cache': stats, 'identical': parsed[False]==parsed[True]}
+
+def bench_form_dates(numReports = 100000, seed = 0):
+    """Parse the exposure and onset dates of numReports synthetic reports, as reloaded from the database 
+    (ISO dates, MainWindow.retrieve_report_TM_from_DB()) and as read from a VAERS txt export (10-MAR-10), 
+    with dateutil.parser.parse, and with timexan.parse_date() without and with the cache of its dateutil fallback. 
+    Return a dictionary with the dates/sec of each, the speedups and whether the dates are identical."""
+    rand = random.Random(seed)
+    generator = reportgen.ReportGenerator(seed)
+    dateStrings = {'database': [], 'txt': []}
+    for i in range(numReports):
+        expDate = datetime.date(2005, 1, 1) + datetime.timedelta(days=rand.randint(0, 3650))
+        onsetDate = expDate + datetime.timedelta(days=rand.choice([0, 0, 1, 1, 2, 3, 5, 7, 10, 14, 21]))
+        dateStrings['database'] += [expDate.isoformat(), onsetDate.isoformat()]
+        dateStrings['txt'] += [generator.format_form_date(expDate), generator.format_form_date(onsetDate)]
+    
+    memoize = timexan.memoizeDateParsers
+    result = {'benchmark': 'formdates', 'reports': numReports, 'identical': True}
+    try:
+        for layout in ['database', 'txt']:
+            seconds = {}
+            dates = {}
+            for name, parse, memo in [('dateutil', dateutil.parser.parse, False), ('layout', timexan.parse_date, False),
+                                      ('cached', timexan.parse_date, True)]:
+                timexan.memoizeDateParsers = memo
+                timexan.clear_date_parser_caches()
+                t0 = time.time()
+                dates[name] = [parse(dateStr) for dateStr in dateStrings[layout]]
+                seconds[name] = time.time() - t0
+                result['%s_%s_dates_per_sec' % (layout, name)] = len(dateStrings[layout]) / seconds[name]
+            result[layout + '_layout_speedup'] = seconds['dateutil'] / seconds['layout']
+            result[layout + '_cached_speedup'] = seconds['dateutil'] / seconds['cached']
+            result['identical'] = result['identical'] and dates['dateutil']==dates['layout']==dates['cached']
+    finally:
+        timexan.memoizeDateParsers = memoize
+    return result
+
+def percentile(values, p):
+    """Nearest-rank percentile of the values, p in [0, 100]"""
+    if not values:
+        return 0.
+    values = sorted(values)
+    rank = max(int(round(p / 100. * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def latency_stats(name, latencies, reports = None):
+    """Return the result of a benchmark of per-call latencies in seconds. The throughput is reports/sec,
+    counting each call as one report unless the number of reports processed is given."""
+    seconds = sum(latencies)
+    if reports is None:
+        reports = len(latencies)
+    return {'benchmark': name, 'calls': len(latencies), 'reports': reports, 'seconds': seconds,
+            'reports_per_sec': reports / seconds if seconds > 0 else 0.,
+            'mean_ms': seconds * 1000. / len(latencies) if latencies else 0.,
+            'p50_ms': percentile(latencies, 50) * 1000., 'p99_ms': percentile(latencies, 99) * 1000.}
+
+def _report_dates(report):
+    return (report['Date of Exposure'], report['Date of Onset'], report['Received Date'])
+
+def bench_extraction(extractor, reports):
+    """Extract every report with FeatureExtractor.extract_features_temporal, and fill in the report fields.
+    Return (result, list of (report, documentFeature))."""
+    latencies = []
+    extracted = []
+    for report in reports:
+        (expDateStr, onsetDateStr, receivedDateStr) = _report_dates(report)
+        reportType = util.ReportUtil.get_report_type(report)
+        t0 = time.time()
+        documentFeature = extractor.extract_features_temporal(report['Free Text'], expDateStr, onsetDateStr, receivedDateStr, reportType)
+        latencies.append(time.time() - t0)
+        extracted.append(batch.fill_report(dict(report), documentFeature))
+    return (latency_stats('extract_features_temporal', latencies), extracted)
+
+def bench_timexes(extractor, reports):
+    """Annotate the time expressions of every report with timexan.annotateTimexes, from the input exposure date."""
+    latencies = []
+    for report in reports:
+        expDate = extractor.parse_time_string(report['Date of Exposure'])
+        t0 = time.time()
+        timexan.annotateTimexes(report['Free Text'], expDate)
+        latencies.append(time.time() - t0)
+    return latency_stats('annotate_timexes', latencies)
+
+def bench_dbstore(extracted, dbname = None):
+    """Insert the extracted reports into a new database, as batch.commit_report does, and retrieve them
+    as MainWindow does when loading reports. Return the insert and retrieve results."""
+    if dbname is None:
+        (fd, dbname) = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(dbname)
+    db = dbstore(dbname, '', '')
+    try:
+        insert = []
+        for report, documentFeature in extracted:
+            timexList = documentFeature.getTimexesDB() if documentFeature else []
+            t0 = time.time()
+            batch.commit_report(db, report, timexList)
+            insert.append(time.time() - t0)
+        db.create_index()
+        db.conn.commit()
+
+        retrieve = []
+        for report, documentFeature in extracted:
+            reportid = report['Report ID']
+            t0 = time.time()
+            db.retrieveReportForm(reportid)
+            db.retrieveReportFeature(reportid)
+            db.retrieveFeatures(reportid)
+            db.retrieveFeatureComments(reportid)
+            db.retrieveTimexes(reportid)
+            retrieve.append(time.time() - t0)
+    finally:
+        db.close()
+        os.remove(dbname)
+    return [latency_stats('dbstore_insert', insert), latency_stats('dbstore_retrieve', retrieve)]
+
+class _ReportListHost:
+    """The report list and selection of MainWindow, to run its filter and the group analysis curves 
+    without the widgets. Redrawing and menu updates do nothing."""
+    def __init__(self, reports):
+        self.reports = reports
+        self.selectedReportIndices = range(len(reports))
+        self.mainWindow = self
+        self.canvas = self
+        self.filters_current = []
+        self.filters_recent = []
+        self.data_all_action = self
+
+    def draw(self):
+        pass
+    def setChecked(self, checked):
+        pass
+    def update_filter_menu(self):
+        pass
+    def update_selected_reports(self):
+        pass
+
+def _import_gui():
+    """Return the ETHERCore module, or None without the GUI packages (PySide, matplotlib)"""
+    try:
+        import ETHERCore
+        return ETHERCore
+    except ImportError:
+        return None
+
+def bench_filter(reports, repeat = 5, gui = None):
+    """Apply each of the filterCriteria to all reports with MainWindow.apply_filter_criteria. The latency
+    is of one filter over all reports. Return None without the GUI packages."""
+    gui = gui or _import_gui()
+    if not gui:
+        return None
+    apply_filter_criteria = gui.MainWindow.apply_filter_criteria.im_func
+    host = _ReportListHost(reports)
+    latencies = []
+    for i in range(repeat):
+        for criteria in filterCriteria:
+            host.selectedReportIndices = range(len(reports))
+            t0 = time.time()
+            apply_filter_criteria(host, criteria, str(criteria))
+            latencies.append(time.time() - t0)
+    return latency_stats('apply_filter_criteria', latencies, len(reports) * len(latencies))
+
+def bench_curves(reports, repeat = 5, gui = None):
+    """Build the curves of the group analysis plots (feature counts and report counts) over all reports,
+    for each time axis. The latency is of one set of curves. Return None without the GUI packages."""
+    gui = gui or _import_gui()
+    if not gui:
+        return None
+    plot = gui.ReportGroupAnalysisPlot
+    host = _ReportListHost(reports)
+    host.combine_tooltips = lambda tip, newtip: plot.combine_tooltips.im_func(host, tip, newtip)
+    builders = [plot.get_multi_report_curves.im_func, plot.get_report_count_curves.im_func]
+    latencies = []
+    for i in range(repeat):
+        for axisType in curveAxes:
+            for builder in builders:
+                t0 = time.time()
+                builder(host, curveFeatures, axisType)
+                latencies.append(time.time() - t0)
+    return latency_stats('group_analysis_curves', latencies, len(reports) * len(latencies))
+
+def get_revision():
+    """Return the git revision of the source, or '' outside of a repository"""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull).strip()
+    except Exception:
+        return ''
+
+def run_suite(reports, repeat = 5, extractor = None):
+    """Run all the application benchmarks on the reports. Return a dictionary with the environment
+    (revision, engine digest, python version) and the results of each benchmark. The GUI benchmarks 
+    are listed in 'skipped' without the GUI packages."""
+    if not extractor:
+        extractor = textan.FeatureExtractor()
+    results = {'benchmark': 'suite', 'reports': len(reports), 'repeat': repeat, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'revision': get_revision(), 'engine': extractcache.engine_digest(extractor.config, extractor.lexicon),
+               'python': platform.python_version(), 'platform': platform.platform(), 'results': [], 'skipped': []}
+
+    (result, extracted) = bench_extraction(extractor, reports)
+    results['results'].append(result)
+    results['results'].append(bench_timexes(extractor, reports))
+    results['results'] += bench_dbstore(extracted)
+
+    gui = _import_gui()
+    extractedReports = [report for report, documentFeature in extracted]
+    for name, bench in [('apply_filter_criteria', bench_filter), ('group_analysis_curves', bench_curves)]:
+        result = bench(extractedReports, repeat, gui) if gui else None
+        if result:
+            results['results'].append(result)
+        else:
+            results['skipped'].append(name)
+    return results
+
+##: Modules imported by the startup benchmark, and the heavy packages it looks for after each import
+startupModules = ['util', 'timexan', 'textan', 'dbstore', 'batch', 'reportdata', 'extractcache']
+heavyPackages = ['nltk', 'Tkinter', 'PySide', 'matplotlib', 'lxml.etree']
+
+startupScript = '''import sys, time, json
+t0 = time.time()
+import %s
+seconds = time.time() - t0
+print json.dumps({'seconds': seconds, 'modules': len([m for m in sys.modules.values() if m]),
+                  'loaded': [name for name in %r if sys.modules.get(name)]})
+'''
+
+def _time_import(engineDir, module, repeat):
+    """Import the module of the engine folder in repeat new processes. Return the fastest import time,
+    the process time, the number of modules loaded and the heavy packages among them."""
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        output = subprocess.check_output([sys.executable, '-c', startupScript % (module, heavyPackages)], cwd=engineDir)
+        processSeconds = time.time() - t0
+        res = json.loads(output.strip().splitlines()[-1])
+        if best is None or res['seconds'] < best['seconds']:
+            best = {'module': module, 'seconds': res['seconds'], 'process_seconds': processSeconds,
+                    'modules': res['modules'], 'loaded': res['loaded']}
+    return best
+
+def bench_startup(repeat = 5, reference = None, modules = startupModules):
+    """Measure the import time of each module of this folder in new processes, keeping the fastest of
+    repeat runs. With a reference engine, a source folder or a git revision (see perfgate.py), measure it
+    as well and give the speedup of each module."""
+    result = {'benchmark': 'startup', 'repeat': repeat, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': get_revision(),
+              'python': platform.python_version(), 'reference': reference, 'results': []}
+    tempDir = tempfile.mkdtemp(prefix='benchmark_') if reference else None
+    try:
+        refDir = perfgate.prepare_engine(reference, tempDir) if reference else None
+        for module in modules:
+            res = _time_import(perfgate.sourceDir, module, repeat)
+            if refDir:
+                ref = _time_import(refDir, module, repeat)
+                for key in ['seconds', 'process_seconds', 'modules', 'loaded']:
+                    res['reference_' + key] = ref[key]
+                res['speedup'] = ref['seconds'] / res['seconds'] if res['seconds'] > 0 else 0.
+            result['results'].append(res)
+    finally:
+        if tempDir:
+            shutil.rmtree(tempDir, ignore_errors=True)
+    return result
+
+##: Measures the memory of the extracted reports, with the modules of the folder it runs in: the loaded report
+##: (with its FeatureStruct), the DocumentFeature (Feature, Timex3, TLink), and the reviewer annotations, one
+##: FeatureAnnotation and SummaryElement per feature and one TimeAnnotation per timex. Every object is counted
+##: once, with its __dict__; classes, functions and modules are left out.
+memoryScript = '''import sys, json, cPickle, types
+import textan, batch
+from reportdata import FeatureStruct, FeatureAnnotation, TimeAnnotation, SummaryElement
+
+skipped = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+seen = set()
+classStats = {}
+
+def deep_size(obj):
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, skipped):
+            continue
+        seen.add(id(obj))
+        objSize = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack += obj.keys() + obj.values()
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack += list(obj)
+        elif hasattr(obj, '__class__') and not isinstance(obj, (basestring, int, long, float, bool)):
+            instDict = getattr(obj, '__dict__', None)
+            if instDict is not None:
+                seen.add(id(instDict))
+                objSize += sys.getsizeof(instDict)
+                stack += instDict.values()
+            for cls in type(obj).__mro__ if hasattr(type(obj), '__mro__') else []:
+                for name in cls.__dict__.get('__slots__', ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+            stats = classStats.setdefault(obj.__class__.__name__, {'instances': 0, 'bytes': 0})
+            stats['instances'] += 1
+            stats['bytes'] += objSize
+        size += objSize
+    return size
+
+with open(sys.argv[1], 'rb') as f:
+    reports = cPickle.load(f)
+extractor = textan.FeatureExtractor()
+totals = {'report': 0, 'document_feature': 0, 'annotations': 0}
+##: the measured objects are kept, so that their ids are not reused by the next ones
+measured = []
+for report in reports:
+    (report, documentFeature) = batch.extract_report(extractor, report)
+    annotations = []
+    for i, feat in enumerate(report['Features']):
+        (start, end) = (feat.getStartPos(), feat.getEndPos())
+        annotations.append(FeatureAnnotation((i, feat.getString(), feat.getType(), '', '', start, end, i, -1, '')))
+        annotations.append(SummaryElement((i, feat.getString(), 'Symptom', '', '', start, end, '', i, None, None, -1, '')))
+    if documentFeature:
+        for i, timex in enumerate(documentFeature.timexList):
+            annotations.append(TimeAnnotation((i, timex.getString(), timex.getType(), timex.getDateTime(), timex.getStartPos(),
+                                               timex.getEndPos(), 1, '', i, '')))
+    totals['report'] += deep_size(report)
+    totals['document_feature'] += deep_size(documentFeature)
+    totals['annotations'] += deep_size(annotations)
+    measured.append((report, documentFeature, annotations))
+print json.dumps({'reports': len(reports), 'totals': totals, 'classes': classStats})
+'''
+
+##: Classes of which the memory benchmark gives the bytes per instance
+memoryClasses = ['Feature', 'Timex3', 'TLink', 'FeatureStruct', 'FeatureAnnotation', 'TimeAnnotation', 'SummaryElement']
+
+def _measure_memory(engineDir, corpusFile):
+    output = subprocess.check_output([sys.executable, '-c', memoryScript, corpusFile], cwd=engineDir)
+    res = json.loads(output.strip().splitlines()[-1])
+    result = {'bytes_per_report': float(sum(res['totals'].values())) / res['reports']}
+    for name, total in res['totals'].items():
+        result[name + '_bytes_per_report'] = float(total) / res['reports']
+    for name in memoryClasses:
+        stats = res['classes'].get(name)
+        if stats:
+            result[name + '_instances'] = stats['instances']
+            result[name + '_bytes_per_instance'] = float(stats['bytes']) / stats['instances']
+    return result
+
+def bench_memory(reports, reference = None):
+    """Measure the memory of the reports once extracted and annotated, per report and per instance of each 
+    report data class (memoryClasses), in a new process. With a reference engine, a source folder or a git
+    revision (see perfgate.py), measure it as well, and give the ratio of the bytes per report."""
+    result = {'benchmark': 'memory', 'reports': len(reports), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 
+              'revision': get_revision(), 'python': platform.python_version(), 'reference': reference}
+    tempDir = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        corpusFile = os.path.join(tempDir, 'reports.pkl')
+        with open(corpusFile, 'wb') as f:
+            cPickle.dump(reports, f, cPickle.HIGHEST_PROTOCOL)
+        result.update(_measure_memory(perfgate.sourceDir, corpusFile))
+        if reference:
+            refResult = _measure_memory(perfgate.prepare_engine(reference, tempDir), corpusFile)
+            for key, value in refResult.items():
+                result['reference_' + key] = value
+            result['reduction'] = 1. - result['bytes_per_report'] / refResult['bytes_per_report']
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+    return result
+
+def write_results(result, filename):
+    with open(filename, 'w') as f:
+        json.dump(result, f, indent=1, sort_keys=True)
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='ETHER extraction benchmarks')
+    argparser.add_argument('benchmark', choices=['tagger', 'chunker', 'cascade', 'suite', 'startup', 'classifier', 'memory',
+                                                'timexscan', 'timexmerge', 'dates', 'formdates'], help='component to benchmark')
+    argparser.add_argument('--data', default='reports.txt', help='data file of the narratives (default: reports.txt)')
+    argparser.add_argument('--synthetic', type=int, default=0, metavar='N', help='use N synthetic reports instead of the data file')
+    argparser.add_argument('--seed', default='0', help='seed of the synthetic reports (default: 0)')
+    argparser.add_argument('--faers-ratio', type=float, default=0., help='fraction of synthetic FAERS reports (default: 0)')
+    argparser.add_argument('--repeat', type=int, default=None, help='times each narrative is processed, or each import for startup (default: 20, suite and startup: 5, timexscan and timexmerge: 3, dates: 1)')
+    argparser.add_argument('--workers', type=int, default=4, help='classifier: number of worker processes (default: 4)')
+    argparser.add_argument('--reports', type=int, default=100000, help='formdates: number of synthetic reports (default: 100000)')
+    argparser.add_argument('--sentences', default='50,100,200,400', help='timexmerge: sizes of the dated narratives, comma separated (default: 50,100,200,400)')
+    argparser.add_argument('--reference', help='startup, memory: also measure this engine, a source folder or git revision')
+    argparser.add_argument('--output', help='results file (default: benchmark_<benchmark>_<time>.json)')
+    args = argparser.parse_args()
+    if args.repeat is None:
+        args.repeat = {'suite': 5, 'startup': 5, 'timexscan': 3, 'timexmerge': 3, 'dates': 1}.get(args.benchmark, 20)
+
+    if args.benchmark not in ['startup', 'timexmerge', 'formdates']:
+        reports = load_reports(args.data, args.synthetic, args.seed, args.faers_ratio)
+        narratives = [report['Free Text'] for report in reports if report['Free Text']]
+    if args.benchmark=='startup':
+        result = bench_startup(args.repeat, args.reference)
+        for res in result['results']:
+            line = '%-12s import %7.1f ms  %4d modules  heavy: %s' % (res['module'], res['seconds'] * 1000, res['modules'],
+                                                                    ', '.join(res['loaded']) or '-')
+            if 'speedup' in res:
+                line += '  (reference %7.1f ms, %4d modules, %.1fx)' % (res['reference_seconds'] * 1000, res['reference_modules'],
+                                                                      res['speedup'])
+            print line
+    elif args.benchmark=='suite':
+        result = run_suite(reports, args.repeat)
+        for res in result['results']:
+            print '%-26s %9.1f reports/sec  p50 %8.2f ms  p99 %8.2f ms' % (res['benchmark'], res['reports_per_sec'], 
+                                                                          res['p50_ms'], res['p99_ms'])
+        for name in result['skipped']:
+            print '%-26s skipped (no GUI packages)' % name
+    elif args.benchmark=='memory':
+        result = bench_memory(reports, args.reference)
+        hasReference = 'reduction' in result
+        for key in ['bytes_per_report', 'report_bytes_per_report', 'document_feature_bytes_per_report', 'annotations_bytes_per_report']:
+            line = '%-36s %9.0f' % (key, result[key])
+            if hasReference:
+                line += '  (reference %9.0f)' % result['reference_' + key]
+            print line
+        for name in memoryClasses:
+            if name + '_bytes_per_instance' in result:
+                line = '%-18s %7d instances %7.0f bytes/instance' % (name, result[name + '_instances'], result[name + '_bytes_per_instance'])
+                if hasReference and 'reference_' + name + '_bytes_per_instance' in result:
+                    line += '  (reference %7.0f)' % result['reference_' + name + '_bytes_per_instance']
+                print line
+        if hasReference:
+            print 'Memory per report reduced by %.1f%%' % (result['reduction'] * 100)
+    elif args.benchmark=='classifier':
+        result = bench_classifier([report for report in reports if report['Free Text']], args.workers)
+        print 'RegexpTagger/RegexpParser: %.1f reports/sec' % result['reference_reports_per_sec']
+        print 'Hash tagger/TagChunker:    %.1f reports/sec (%.2fx)' % (result['fast_reports_per_sec'], result['speedup'])
+        print '%d worker processes:        %.1f reports/sec (%.2fx)' % (result['workers'], result['pool_reports_per_sec'], 
+                                                                       result['pool_speedup'])
+    elif args.benchmark=='timexscan':
+        result = bench_timex_scanner(narratives, args.repeat)
+        print 'Pattern loop:  %.0f tokens/sec' % result['legacy_tokens_per_sec']
+        print 'Timex scanner: %.0f tokens/sec (%.2fx), %d timexes' % (result['scanner_tokens_per_sec'], result['speedup'],
+                                                                       result['timexes'])
+        print 'Prefilter:     %d of %d windows pruned (%.1f%%)' % (result['windows']['pruned'], result['windows']['windows'], 
+                                                                    result['windows']['pruned_rate'] * 100)
+    elif args.benchmark=='timexmerge':
+        result = bench_timex_merge([int(size) for size in args.sentences.split(',')], args.repeat, args.seed)
+        for res in result['results']:
+            print '%4d sentences %6d tokens %5d timexes: pairwise merge %9.1f ms, indexed merge %9.1f ms (%.2fx)' % (res['sentences'], 
+                        res['tokens'], res['timexes'], res['legacy_ms'], res['indexed_ms'], res['speedup'])
+    elif args.benchmark=='dates':
+        result = bench_date_parsers(reports, args.repeat)
+        print 'Date parsers:        %.0f dates/sec' % result['uncached_dates_per_sec']
+        print 'Cached date parsers: %.0f dates/sec (%.2fx)' % (result['cached_dates_per_sec'], result['speedup'])
+        for name, stats in sorted(result['cache'].items()):
+            print '    %-40s %6d hits %6d misses (hit rate %.2f)' % (name, stats['hits'], stats['misses'], stats['hit_rate'])
+    elif args.benchmark=='formdates':
+        result = bench_form_dates(args.reports, args.seed)
+        for layout in ['database', 'txt']:
+            print '%-8s dateutil %8.0f dates/sec, layouts %8.0f dates/sec (%.2fx), cached %8.0f dates/sec (%.2fx)' % (layout,
+                        result[layout + '_dateutil_dates_per_sec'], result[layout + '_layout_dates_per_sec'], result[layout + '_layout_speedup'],
+                        result[layout + '_cached_dates_per_sec'], result[layout + '_cached_speedup'])
+    elif args.benchmark=='tagger':
+        result = bench_tagger(tokenize_narratives(narratives), args.repeat)
+        print 'LinearTagger: %.0f tokens/sec' % result['linear_tokens_per_sec']
+        print 'FastTagger:   %.0f tokens/sec (%.2fx, cache hit rate %.2f)' % (result['fast_tokens_per_sec'], result['speedup'],
+                                                                                 result['cache']['hit_rate'])
+    elif args.benchmark=='chunker':
+        extractor = textan.FeatureExtractor()
+        tagged = [extractor.get_untagged(tokens) for tokens in tokenize_narratives(narratives)]
+        result = {}
+        for name in ['grammar', 'grammar1']:
+            result[name] = bench_chunker(tagged, extractor.config[name], args.repeat)
+            print '%s: nltk.RegexpParser %.0f sentences/sec, TagChunker %.0f sentences/sec (%.2fx)' % (name,
+                        result[name]['nltk_sentences_per_sec'], result[name]['chunker_sentences_per_sec'], result[name]['speedup'])
+        result['identical'] = result['grammar']['identical'] and result['grammar1']['identical']
+    elif args.benchmark=='cascade':
+        extractor = textan.FeatureExtractor()
+        tagged = [extractor.get_untagged(tokens) for tokens in tokenize_narratives(narratives)]
+        result = bench_cascade(extractor, tagged, args.repeat)
+        print 'Re-tokenized second pass: %.3f ms/sentence, second pass input %.3f ms/sentence' % (
+                    result['retokenize_ms_per_sentence'], result['retokenize_second_pass_input_ms_per_sentence'])
+        print 'Cascade second pass:      %.3f ms/sentence (%.2fx), second pass input %.3f ms/sentence (%.2fx)' % (
+                    result['cascade_ms_per_sentence'], result['speedup'], 
+                    result['cascade_second_pass_input_ms_per_sentence'], result['second_pass_input_speedup'])
+
+    print json.dumps(result, sort_keys=True)
+    if not args.output:
+        args.output = 'benchmark_%s_%s.json' % (args.benchmark, time.strftime('%Y%m%d_%H%M%S'))
+    write_results(result, args.output)
+    print 'Results written to %s' % args.output
+    sys.exit(0 if result.get('identical', True) else 1)
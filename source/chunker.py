@@ -0,0 +1,179 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Chunk parser for the feature grammars
+
+This module provides a drop-in replacement of nltk.RegexpParser for the chunk grammars in config.py.
+nltk converts the tags of every sentence to a '<tag1><tag2>...' string, and applies each rule as a
+regex substitution over that string, rule by rule and stage by stage. Here the grammar is compiled
+once: every tag is encoded as an integer ID, stored as one character, and every rule is compiled
+into a regex over those characters, where a tag pattern such as <Modifier|Allergy> becomes a
+character class. The rules are applied in the same order, to the same unchunked regions, with
+the same leftmost-first matching, so the trees are identical to those of nltk.RegexpParser.
+
+This module includes:
+    class TagChunker -- chunk parser compiled from a grammar of chunk rules ({...})
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import re
+import lazyimport
+##: Loaded on first use, see lazyimport.py
+nltk = lazyimport.LazyModule('nltk')
+
+##: Tag patterns this chunker compiles: alternations of tag names, e.g., <Food|Drug|Medication>
+re_tag_literals = re.compile(r'^\w+(\|\w+)*$')
+##: Anything but tag patterns and these operators in a rule is left to nltk.RegexpParser
+re_rule_operators = re.compile(r'^[()|?*+]*$')
+re_tag_pattern = re.compile(r'<([^<>]*)>')
+
+class TagChunker:
+    """ Chunk parser compiled from a grammar of chunk rules. It has the parse() method of
+        nltk.RegexpParser, and falls back to it for grammars using other kinds of rules
+        (chink, split, merge), or tag patterns other than tag names. """
+
+    ##: code of the tags not used in the grammar; IDs of the grammar tags start after it
+    otherCode = 0x100
+
+    def __init__(self, grammar, root_label='S'):
+        self._root_label = root_label
+        self._grammar = grammar
+        self._fallback = None
+        self.tagCodes = {}
+        self._stages = []
+
+        try:
+            stages = self._read_grammar(grammar)
+            self._stages = [(label, self._compile_rules(rules)) for label, rules in stages]
+        except ValueError:
+            self._fallback = nltk.RegexpParser(grammar, root_label=root_label)
+
+    def _read_grammar(self, grammar):
+        """Split the grammar into stages [(label, [tag pattern of each rule])], the same way
+        as nltk.RegexpParser. Raise ValueError for rules this chunker does not compile."""
+        stages = []
+        rules = []
+        lhs = None
+        for line in grammar.split('\n'):
+            line = line.strip()
+
+            ##: New stage begins if there's an unescaped ':'
+            m = re.match('(?P<nonterminal>(\\.|[^:])*)(:(?P<rule>.*))', line)
+            if m:
+                if rules:
+                    stages.append((lhs, rules))
+                lhs = m.group('nonterminal').strip()
+                rules = []
+                line = m.group('rule').strip()
+
+            ##: Skip blank & comment-only lines
+            if line == '' or line.startswith('#'):
+                continue
+
+            ##: Split off the comment (but don't split on '\#')
+            m = re.match(r'(?P<rule>(\\.|[^#])*)(?P<comment>#.*)?', line)
+            rule = m.group('rule').strip()
+            if not (rule and rule[0] == '{' and rule[-1] == '}' and not re.search('[{}]', rule[1:-1])):
+                raise ValueError('Not a chunk rule: %s' % rule)
+            if not lhs:
+                raise ValueError('Expected stage marker (eg NP:)')
+            rules.append(rule[1:-1])
+
+        if rules:
+            stages.append((lhs, rules))
+        return stages
+
+    def _tag_code(self, tag):
+        if not tag in self.tagCodes:
+            self.tagCodes[tag] = unichr(self.otherCode + 1 + len(self.tagCodes))
+        return self.tagCodes[tag]
+
+    def _compile_rules(self, rules):
+        """Compile the tag patterns into regexes over tag codes.
+        Return a list of (regexp, set of the tag codes the rule uses)."""
+        compiled = []
+        for tagPattern in rules:
+            tagPattern = re.sub(r'\s', '', tagPattern)
+            if not re_rule_operators.match(re_tag_pattern.sub('', tagPattern)):
+                raise ValueError('Unsupported tag pattern: %s' % tagPattern)
+
+            codes = set()
+            def tag_class(m):
+                if not re_tag_literals.match(m.group(1)):
+                    raise ValueError('Unsupported tag pattern: %s' % m.group(0))
+                tagCodes = [self._tag_code(tag) for tag in m.group(1).split('|')]
+                codes.update(tagCodes)
+                return '[' + ''.join(tagCodes) + ']'
+
+            pattern = re_tag_pattern.sub(tag_class, tagPattern)
+            compiled.append((re.compile(pattern, re.U), codes))
+        return compiled
+
+    def _tag(self, tok):
+        if isinstance(tok, tuple):
+            return tok[1]
+        elif isinstance(tok, nltk.Tree):
+            return tok.label()
+        else:
+            raise ValueError('chunk structures must contain tagged ' 'tokens or trees')
+
+    def _parse_stage(self, label, rules, pieces, rootLabel):
+        """Apply the rules of one stage to the pieces, and return the chunked tree."""
+        other = unichr(self.otherCode)
+        tagCodes = self.tagCodes
+        string = u''.join([tagCodes.get(self._tag(tok), other) for tok in pieces])
+        present = set(string)
+
+        ##: chunks as sorted, non-overlapping (start, end) ranges of the pieces
+        chunks = []
+        for regexp, codes in rules:
+            if not present.intersection(codes):
+                continue
+
+            ##: match only in the unchunked regions, as nltk does
+            newChunks = []
+            start = 0
+            for end, nextStart in [(c[0], c[1]) for c in chunks] + [(len(string), None)]:
+                if end > start:
+                    for m in regexp.finditer(string, start, end):
+                        if m.end() > m.start():
+                            newChunks.append((m.start(), m.end()))
+                start = nextStart
+            if newChunks:
+                chunks = sorted(chunks + newChunks)
+
+        if not chunks:
+            return nltk.Tree(rootLabel, pieces)
+
+        children = []
+        pos = 0
+        for start, end in chunks:
+            children += pieces[pos:start]
+            children.append(nltk.Tree(label, pieces[start:end]))
+            pos = end
+        children += pieces[pos:]
+        return nltk.Tree(rootLabel, children)
+
+    def parse(self, chunk_struct, trace=None):
+        """Chunk a tagged sentence, i.e., a list of (word, tag), or a tree. Return the chunked tree."""
+        if self._fallback:
+            return self._fallback.parse(chunk_struct, trace)
+
+        for label, rules in self._stages:
+            if len(chunk_struct) == 0:
+                print('Warning: parsing empty text')
+                chunk_struct = nltk.Tree(self._root_label, [])
+                continue
+
+            try:
+                rootLabel = chunk_struct.label()
+            except AttributeError:
+                rootLabel = self._root_label
+
+            chunk_struct = self._parse_stage(label, rules, chunk_struct[:], rootLabel)
+        return chunk_struct
+
+    def __repr__(self):
+        return "<TagChunker with %d stages>" % len(self._stages)
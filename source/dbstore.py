@@ -1,11 +1,13 @@
 #!/usr/bin python
 # -*- coding: utf-8 -*-
 
-import sqlite3, os, sys, pyodbc, string
-from PySide.QtCore import *
-from PySide.QtGui import *
+import sqlite3, os, sys, string
 
 import json
+
+##: Columns of ETHER_REPORT_EXTRACTED in the order of the report_feature tuple of insertReportFeature()
+reportFeatureColumns = ('VAERS_ID', 'TIME_EXPOSURE', 'TIME_ONSET', 'ONSET_HOURS', 'CONFIDENCE_LEVEL', 'PREFER_TERM', 'SUMMARY',
+                        'REVIEW', 'ACTION', 'CLASS', 'DXLEVEL', 'MARK', 'DEGRADED')
     
 class dbstore:
 
@@ -15,6 +17,7 @@ class dbstore:
         if dbname == "oracle":
             try:                
                 # pyodbc connection
+                import pyodbc
                 driver = "DRIVER={Microsoft ODBC for Oracle};"
                 #driver = "DRIVER={Oracle in Ora10g};" #Oracle driver, doesn't work
                 cred = "UID=VAERS_TM;PWD=May08_2012;" # credentials for test, preprod, and prod
@@ -24,6 +27,7 @@ class dbstore:
                 self.c = self.conn.cursor()
             except:
                 # cannot connect
+                from PySide.QtGui import QMessageBox
                 msgBox = QMessageBox(QMessageBox.Critical, "VaeTM", "Cannot connect to the remote database.")
                 msgBox.setInformativeText("Do you want to store the extracted features in a local database?")
                 msgBox.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel)
@@ -46,6 +50,16 @@ class dbstore:
                 self.conn.text_factory = str
                 self.c = self.conn.cursor()
                 self.create_tables()
+        
+        ##: The Oracle tables aren't migrated by db_version_validation(), they may have no DEGRADED column
+        self.degradedColumn = self.has_report_extracted_column('DEGRADED')
+    
+    def has_report_extracted_column(self, column):
+        try:
+            self.c.execute("select * from {}ETHER_REPORT_EXTRACTED where 1=0".format(self.schema))
+        except Exception:
+            return False
+        return column in [desc[0].upper() for desc in self.c.description]
     
     def close(self):
         self.conn.close()
@@ -64,6 +78,8 @@ class dbstore:
         cols = [c[1] for c in tbinfo]
         if not 'MARK' in cols:
             self.c.execute("alter table ETHER_REPORT_EXTRACTED add column MARK boolean")
+        if not 'DEGRADED' in cols:
+            self.c.execute("alter table ETHER_REPORT_EXTRACTED add column DEGRADED text default ''")
             
         self.c.execute("PRAGMA table_info(ETHER_ANNOTATIONS);")
         tbinfo = self.c.fetchall()
@@ -119,6 +135,7 @@ class dbstore:
             with open(filename, 'r') as json_data:
                 config = json.load(json_data)
         except Exception as e:
+            from PySide.QtGui import QMessageBox
             QMessageBox.critical(None, "ETHER", str(e)+"\nCoundn't find preferences.json! Default parameters will be used.")
             return
         
@@ -147,6 +164,7 @@ class dbstore:
             with open(filename, 'r') as json_data:
                 config = json.load(json_data)
         except Exception as e:
+            from PySide.QtGui import QMessageBox
             QMessageBox.critical(None, "ETHER", str(e)+"\nCoundn't find preferences.json! Default parameters will be used.")
             return
         
@@ -175,7 +193,7 @@ class dbstore:
                 LOT_NUMBER text, INDICATION text, PRIMARY_SUSPECT text, \
                 BIRTH_DATE text, FIRST_NAME text, MIDDLE_INITIAL text, LAST_NAME text, PATIENT_ID text, MFR_CONTROL_NUMBER text)")
         self.c.execute("create table ETHER_REPORT_EXTRACTED (VAERS_ID text, TIME_EXPOSURE text, TIME_ONSET text, ONSET_HOURS integer, CONFIDENCE_LEVEL integer, \
-                PREFER_TERM text, SUMMARY text, REVIEW text, ACTION integer, CLASS boolean, DXLEVEL integer, MARK boolean)")
+                PREFER_TERM text, SUMMARY text, REVIEW text, ACTION integer, CLASS boolean, DXLEVEL integer, MARK boolean, DEGRADED text)")
         #self.c.execute("create table ETHER_REPORT_EXTRACTED (VAERS_ID text, TIME_EXPOSURE text, TIME_ONSET text, ONSET_HOURS integer, CONFIDENCE_LEVEL integer, PREFER_TERM text, SUMMARY text, CLASS text)")
         #self.c.execute("create table ETHER_FEATURES (VAERS_ID text, FEATURE_ID integer, FEATURE_TYPE text, FEATURE_TEXT text, SENTENCE_NUMBER integer, FEATURE_TEMP_START text, FEATURE_TEMP_END text, PREFER_TERM text)")
         self.c.execute("create table ETHER_FEATURES (VAERS_ID text, FEATURE_ID integer, FEATURE_TYPE text, FEATURE_TEXT text, SENTENCE_NUMBER integer, START_POS integer, END_POS integer, FEATURE_TEMP_START text, FEATURE_TEMP_END text, PREFER_TERM text, CLEAN_TEXT text)")
@@ -213,7 +231,12 @@ class dbstore:
 #         for ftype, feature, sentnumber, tempmodifier in featurelist:
 #             self.c.execute("insert into {}VAERS_TM_EXTRACTED values (?, ?, ?, ?, ?)".format(self.schema), (reportid, ftype, feature, sentnumber, tempmodifier))
     def insertReportFeature(self, report_feature):        
-        self.c.execute("insert into {}ETHER_REPORT_EXTRACTED values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(self.schema), report_feature)
+        columns = reportFeatureColumns[:len(report_feature)]
+        if not self.degradedColumn and 'DEGRADED' in columns:
+            columns = columns[:-1]
+            report_feature = report_feature[:len(columns)]
+        self.c.execute("insert into {}ETHER_REPORT_EXTRACTED ({}) values ({})".format(self.schema, ', '.join(columns), 
+                                                                                 ', '.join(['?'] * len(columns))), report_feature)
         #self.c.execute("insert into {}ETHER_REPORT_EXTRACTED values (?, ?, ?, ?, ?, ?)".format(self.schema), report_feature)
 
     def insertReportForm(self, report_form):        
@@ -297,6 +320,21 @@ class dbstore:
         self.c.execute("select distinct VAERS_ID from {}ETHER_REPORT_EXTRACTED where VAERS_ID = ?".format(self.schema), [reportid])
         return self.c.fetchone()
     
+    def isDegraded(self, reportid):
+        """True if the report was stored with the features only, over the extraction budget"""
+        if not self.degradedColumn:
+            return False
+        self.c.execute("select DEGRADED from {}ETHER_REPORT_EXTRACTED where VAERS_ID = ?".format(self.schema), [reportid])
+        row = self.c.fetchone()
+        return bool(row and row[0])
+    
+    def retrieveDegradedReportIDs(self):
+        """IDs of the reports stored with the features only, to be extracted in full later"""
+        if not self.degradedColumn:
+            return []
+        self.c.execute("select VAERS_ID from {}ETHER_REPORT_EXTRACTED where DEGRADED is not null and DEGRADED != ''".format(self.schema))
+        return [row[0] for row in self.c.fetchall()]
+    
     def retriveReportID(self, sql = None):
         strcmd = "select VAERS_ID from ETHER_REPORT_EXTRACTED"
         if sql:
@@ -313,7 +351,10 @@ class dbstore:
         return recordlist[0]
      
     def retrieveReportFeature(self, reportid):
-        self.c.execute("select TIME_EXPOSURE, TIME_ONSET, ONSET_HOURS, CONFIDENCE_LEVEL, PREFER_TERM, SUMMARY, REVIEW, ACTION, CLASS, DXLEVEL, MARK from {}ETHER_REPORT_EXTRACTED where VAERS_ID = ?".format(self.schema), [reportid])
+        if not self.degradedColumn:
+            self.c.execute("select TIME_EXPOSURE, TIME_ONSET, ONSET_HOURS, CONFIDENCE_LEVEL, PREFER_TERM, SUMMARY, REVIEW, ACTION, CLASS, DXLEVEL, MARK from {}ETHER_REPORT_EXTRACTED where VAERS_ID = ?".format(self.schema), [reportid])
+            return tuple(self.c.fetchall()[0]) + ('',)
+        self.c.execute("select TIME_EXPOSURE, TIME_ONSET, ONSET_HOURS, CONFIDENCE_LEVEL, PREFER_TERM, SUMMARY, REVIEW, ACTION, CLASS, DXLEVEL, MARK, DEGRADED from {}ETHER_REPORT_EXTRACTED where VAERS_ID = ?".format(self.schema), [reportid])
         #return self.c.fetchall()        
         recordlist = self.c.fetchall()
         return recordlist[0]
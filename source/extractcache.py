@@ -0,0 +1,103 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Persistent cache of extraction results
+
+This module stores the DocumentFeature extracted from a narrative in a sqlite file, so that a
+narrative already seen is not extracted again: when the same reports are loaded into a new
+database, reloaded with overwriting, or come back in overlapping VAERS exports. The key is a
+hash of the narrative, the input dates and the report type, together with the extraction engine:
+the grammars of config.py, the lexicon and the cache version, so any change to them misses.
+
+The core functions it provides include:
+
+engine_digest() -- Hash the config grammars and the lexicon an extractor is built with.
+
+class ExtractionCache -- Look up and store serialized DocumentFeature, and count hits and misses.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import sqlite3, hashlib, marshal, cPickle
+
+extractionCacheFile = 'extraction_cache.db'
+##: Increase it when a change of the extraction code changes its results, to invalidate the cached ones
+extractionCacheVersion = 2
+##: Entries of config.py used by textan.FeatureExtractor
+configKeys = ['grammar', 'grammar1', 'features', 'features_grammar1']
+
+def engine_digest(config, lexicon):
+    """Return a hash of the extraction engine: the config grammars and feature lists, the lexicon,
+    and the cache version."""
+    engine = (extractionCacheVersion, [(key, config.get(key)) for key in configKeys], lexicon)
+    return hashlib.sha1(marshal.dumps(engine)).hexdigest()
+
+def dumps(documentFeature):
+    """Serialize a DocumentFeature for the cache."""
+    return cPickle.dumps(documentFeature, cPickle.HIGHEST_PROTOCOL)
+
+class ExtractionCache:
+    """Extraction results stored in a sqlite file, keyed by getKey(). The connection can only be
+    used by the thread that creates the cache."""
+
+    def __init__(self, filename = extractionCacheFile, engineDigest = ''):
+        self.filename = filename
+        self.engineDigest = engineDigest
+        self.conn = sqlite3.connect(filename)
+        self.conn.text_factory = str
+        self.c = self.conn.cursor()
+        self.c.execute("create table if not exists EXTRACTION_CACHE (CACHE_KEY text primary key, DOCUMENT_FEATURE blob)")
+        self.conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def close(self):
+        self.conn.close()
+
+    def getKey(self, text, expDateStr = None, onsetDateStr = None, receivedDateStr = None, reportType = 'vaers'):
+        """Return the key of the extraction of the text with these input dates by this engine."""
+        fields = [self.engineDigest, text, expDateStr or '', onsetDateStr or '', receivedDateStr or '', reportType]
+        return hashlib.sha1(marshal.dumps(fields)).hexdigest()
+
+    def get(self, key):
+        """Return the cached DocumentFeature, or None. An entry that cannot be read is a miss."""
+        self.c.execute("select DOCUMENT_FEATURE from EXTRACTION_CACHE where CACHE_KEY = ?", (key,))
+        row = self.c.fetchone()
+        if row:
+            try:
+                documentFeature = cPickle.loads(str(row[0]))
+                self.hits += 1
+                return documentFeature
+            except Exception:
+                ##: written by another version of the classes, to be replaced
+                self.errors += 1
+        self.misses += 1
+        return None
+
+    def put(self, key, documentFeature):
+        self.putSerialized(key, dumps(documentFeature))
+
+    def putSerialized(self, key, data):
+        """Store a DocumentFeature serialized by dumps()"""
+        self.c.execute("insert or replace into EXTRACTION_CACHE (CACHE_KEY, DOCUMENT_FEATURE) values (?, ?)", (key, sqlite3.Binary(data)))
+        self.conn.commit()
+
+    def clear(self):
+        self.c.execute("delete from EXTRACTION_CACHE")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def getSize(self):
+        """Return the number of cached extractions"""
+        self.c.execute("select count(*) from EXTRACTION_CACHE")
+        return self.c.fetchone()[0]
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        rate = float(self.hits) / lookups if lookups else 0.
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': rate, 'errors': self.errors, 'size': self.getSize()}
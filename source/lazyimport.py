@@ -0,0 +1,49 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Modules imported on first use
+
+Importing nltk takes most of the startup time of the analysis modules, and it brings Tkinter with
+it; lxml is only needed by the XML exports. This module defers such imports to the first access
+to one of their attributes, so that textan, timexan, util and dbstore load quickly, without any
+GUI or plotting stack, in the worker processes and the command line tools:
+
+    nltk = lazyimport.LazyModule('nltk')
+    ...
+    tokens = nltk.word_tokenize(text)      ##: nltk is imported here
+
+The core functions it provides include:
+
+class LazyModule -- Stand-in of a module, imported by the first attribute access.
+
+is_loaded() -- Tell if a module has been imported, through a LazyModule or not.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import sys, importlib
+
+class LazyModule(object):
+    """Stand-in of the module name. The module is imported by the first attribute access, and
+    the attributes accessed are then kept, so that later accesses cost as much as with the module."""
+
+    def __init__(self, name):
+        self._lazyName = name
+        self._lazyModule = None
+
+    def __getattr__(self, attr):
+        ##: only called for the attributes not found yet, i.e., not kept in __dict__
+        if self._lazyModule is None:
+            self._lazyModule = importlib.import_module(self._lazyName)
+        value = getattr(self._lazyModule, attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = 'loaded' if self._lazyModule is not None else 'not loaded'
+        return "<lazy module '%s' (%s)>" % (self._lazyName, state)
+
+def is_loaded(name):
+    """Return True if the module has been imported in this process"""
+    return sys.modules.get(name) is not None
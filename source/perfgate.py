@@ -0,0 +1,221 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Differential performance gate of the extraction engine
+
+This module runs a reference and a candidate version of the extraction engine on the same corpus,
+compares their outputs (DocumentFeature.getFeatureArray() and getTimexesDB()) field by field, and
+measures the speedup of the candidate. The gate fails if any output differs, other than the known
+differences listed in knownDifferences, or if the throughput of the candidate drops below a fraction of the reference. An engine is a source folder, or a git
+revision exported to a temporary folder; each one runs in its own process, so that both versions
+of the modules can be loaded. It can be run from the command line, from the source folder:
+
+    python perfgate.py [--reference HEAD] [--candidate .] [--synthetic 500 | --data reports.txt] [--min-throughput 0.95]
+
+With the defaults, the working tree is compared against the last commit.
+
+The core functions it provides include:
+
+prepare_engine() -- Return the source folder of an engine, exporting a git revision if needed.
+
+run_engine() -- Extract the corpus with an engine in a separate process, and return its outputs and times.
+
+diff_outputs() -- List the differences between the outputs of two engines, field by field.
+
+run_gate() -- Compare two engines on a corpus, and return the results with the pass/fail decision.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+##: Only the standard library is imported here: the engine modules are imported by the worker process, from the engine folder
+import os, sys, time, argparse, json, subprocess, tempfile, tarfile, shutil, cPickle, StringIO
+
+##: Fields of the getFeatureArray() and getTimexesDB() records
+featureFields = ['type', 'string', 'sentence', 'start time', 'end time', 'start', 'end', 'confidence', 'MedDRA', 'id',
+                 'comment', 'match', 'clean string']
+timexFields = ['string', 'date', 'start', 'confidence']
+
+##: Accepted differences with the revisions before the feature character offsets were taken from the tokens
+##: (FeatureExtractor.initialize_feature_obj_list), as (report ID, output, record index, field, reference value, 
+##: candidate value): on reports.txt, the new spans cover the feature text, where the old search of the feature 
+##: string in the sentence matched "Diagnosis: ... Syndromer)." and " related.".
+knownDifferences = [('463697-1', 'features', 4, 'start', 319, 330), ('463697-1', 'features', 4, 'end', 388, 376),
+                    ('463697-1', 'features', 18, 'start', 1043, 1010), ('463697-1', 'features', 18, 'end', 1052, 1043)]
+
+sourceDir = os.path.dirname(os.path.abspath(__file__))
+
+def export_revision(revision, dest):
+    """Extract the source folder at a git revision into dest"""
+    topDir = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=sourceDir).strip()
+    prefix = subprocess.check_output(['git', 'rev-parse', '--show-prefix'], cwd=sourceDir).strip()
+    data = subprocess.check_output(['git', 'archive', '--format=tar', '%s:%s' % (revision, prefix)], cwd=topDir)
+    archive = tarfile.open(fileobj=StringIO.StringIO(data))
+    archive.extractall(dest)
+    archive.close()
+
+def prepare_engine(engine, tempDir):
+    """Return the source folder of the engine: the folder itself, or a git revision exported under tempDir."""
+    if os.path.isdir(engine):
+        return os.path.abspath(engine)
+    engineDir = tempfile.mkdtemp(prefix='engine_', dir=tempDir)
+    export_revision(engine, engineDir)
+    return engineDir
+
+def load_corpus(filename = 'reports.txt', synthetic = 0, seed = 0):
+    """Return the corpus as a list of (report ID, text, exposure date, onset date, received date, report type),
+    from a data file or synthetic reports. Uses the modules of this folder."""
+    import util, benchmark
+    reports = benchmark.load_reports(filename, synthetic, seed)
+    return [(report['Report ID'], report['Free Text'], report['Date of Exposure'], report['Date of Onset'], report['Received Date'],
+             util.ReportUtil.get_report_type(report)) for report in reports]
+
+def extract_corpus(corpus, repeat = 1):
+    """Extract the corpus with the textan module on sys.path, repeat times. Return a dictionary of the
+    extractor initialization time, the per-document times of the fastest round, and the outputs:
+    (feature array, timex list) of each document, or the error message."""
+    import textan
+    t0 = time.time()
+    extractor = textan.FeatureExtractor()
+    initSeconds = time.time() - t0
+
+    best = None
+    for i in range(repeat):
+        latencies = []
+        outputs = []
+        for (reportid, text, expDateStr, onsetDateStr, receivedDateStr, reportType) in corpus:
+            t0 = time.time()
+            try:
+                documentFeature = extractor.extract_features_temporal(text, expDateStr, onsetDateStr, receivedDateStr, reportType)
+                latency = time.time() - t0
+                if documentFeature:
+                    outputs.append((documentFeature.getFeatureArray(), documentFeature.getTimexesDB()))
+                else:
+                    outputs.append(None)
+            except Exception as e:
+                latency = time.time() - t0
+                outputs.append('%s: %s' % (type(e).__name__, e))
+            latencies.append(latency)
+        if best is None or sum(latencies) < sum(best):
+            best = latencies
+    return {'init_seconds': initSeconds, 'latencies': best, 'seconds': sum(best), 'outputs': outputs}
+
+def _run_worker(engineDir, corpusFile, outputFile, repeat):
+    ##: the engine modules come from its folder only, not from the folder of this script
+    sys.path[0] = engineDir
+    os.chdir(engineDir)
+    with open(corpusFile, 'rb') as f:
+        corpus = cPickle.load(f)
+    result = extract_corpus(corpus, repeat)
+    with open(outputFile, 'wb') as f:
+        cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+
+def run_engine(engineDir, corpusFile, tempDir, repeat = 1):
+    """Extract the pickled corpus with the engine in a new process. Return the result of extract_corpus()."""
+    (fd, outputFile) = tempfile.mkstemp(suffix='.pkl', dir=tempDir)
+    os.close(fd)
+    subprocess.check_call([sys.executable, os.path.abspath(__file__), '--worker', engineDir, corpusFile, outputFile, str(repeat)])
+    with open(outputFile, 'rb') as f:
+        return cPickle.load(f)
+
+def _diff_records(reportid, output, fields, refRecords, candRecords):
+    diffs = []
+    if len(refRecords)!=len(candRecords):
+        diffs.append((reportid, output, None, 'count', len(refRecords), len(candRecords)))
+    for i, (ref, cand) in enumerate(zip(refRecords, candRecords)):
+        for k in range(max(len(ref), len(cand))):
+            refValue = ref[k] if k < len(ref) else None
+            candValue = cand[k] if k < len(cand) else None
+            if refValue!=candValue:
+                diffs.append((reportid, output, i, fields[k] if k < len(fields) else str(k), refValue, candValue))
+    return diffs
+
+def diff_outputs(reportids, refOutputs, candOutputs):
+    """Return the differences as a list of (report ID, output, record index, field, reference value, candidate value),
+    where output is 'features', 'timexes', or 'document' when the extraction failed or gave nothing."""
+    diffs = []
+    for reportid, ref, cand in zip(reportids, refOutputs, candOutputs):
+        if not isinstance(ref, tuple) or not isinstance(cand, tuple):
+            if ref!=cand:
+                diffs.append((reportid, 'document', None, 'output', ref, cand))
+            continue
+        diffs += _diff_records(reportid, 'features', featureFields, ref[0], cand[0])
+        diffs += _diff_records(reportid, 'timexes', timexFields, ref[1], cand[1])
+    return diffs
+
+def run_gate(reference, candidate, corpus, repeat = 3, minThroughput = 0.95, maxDiffs = 50):
+    """Extract the corpus with both engines, folders or git revisions, and compare them.
+    The gate passes if the outputs are identical, but for the knownDifferences, and the candidate 
+    reports/sec is at least minThroughput times the reference. Return a dictionary of the results."""
+    tempDir = tempfile.mkdtemp(prefix='perfgate_')
+    try:
+        corpusFile = os.path.join(tempDir, 'corpus.pkl')
+        with open(corpusFile, 'wb') as f:
+            cPickle.dump(corpus, f, cPickle.HIGHEST_PROTOCOL)
+
+        refResult = run_engine(prepare_engine(reference, tempDir), corpusFile, tempDir, repeat)
+        candResult = run_engine(prepare_engine(candidate, tempDir), corpusFile, tempDir, repeat)
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    reportids = [doc[0] for doc in corpus]
+    diffs = diff_outputs(reportids, refResult['outputs'], candResult['outputs'])
+    known = [diff for diff in diffs if diff in knownDifferences]
+    diffs = [diff for diff in diffs if diff not in knownDifferences]
+    result = {'reference': reference, 'candidate': candidate, 'reports': len(corpus), 'repeat': repeat,
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'min_throughput': minThroughput}
+    for name, res in [('reference', refResult), ('candidate', candResult)]:
+        result[name + '_init_seconds'] = res['init_seconds']
+        result[name + '_seconds'] = res['seconds']
+        result[name + '_reports_per_sec'] = len(corpus) / res['seconds'] if res['seconds'] > 0 else 0.
+    result['speedup'] = refResult['seconds'] / candResult['seconds'] if candResult['seconds'] > 0 else 0.
+    result['identical'] = not diffs
+    result['differences'] = len(diffs)
+    result['different_reports'] = len(set(diff[0] for diff in diffs))
+    result['known_differences'] = [list(diff[:4]) + [repr(diff[4]), repr(diff[5])] for diff in known]
+    result['first_differences'] = [list(diff[:4]) + [repr(diff[4]), repr(diff[5])] for diff in diffs[:maxDiffs]]
+    result['throughput_ok'] = result['speedup'] >= minThroughput
+    result['passed'] = result['identical'] and result['throughput_ok']
+    return result
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1]=='--worker':
+        _run_worker(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+        sys.exit(0)
+
+    argparser = argparse.ArgumentParser(description='ETHER differential performance gate')
+    argparser.add_argument('--reference', default='HEAD', help='reference engine: source folder or git revision (default: HEAD)')
+    argparser.add_argument('--candidate', default=sourceDir, help='candidate engine: source folder or git revision (default: this folder)')
+    argparser.add_argument('--data', default='reports.txt', help='data file of the corpus (default: reports.txt)')
+    argparser.add_argument('--synthetic', type=int, default=0, metavar='N', help='use N synthetic reports instead of the data file')
+    argparser.add_argument('--seed', default='0', help='seed of the synthetic reports (default: 0)')
+    argparser.add_argument('--repeat', type=int, default=3, help='rounds of extraction, the fastest is kept (default: 3)')
+    argparser.add_argument('--min-throughput', type=float, default=0.95,
+                           help='fail if the candidate reports/sec is below this fraction of the reference (default: 0.95)')
+    argparser.add_argument('--output', help='results file (default: perfgate_<time>.json)')
+    args = argparser.parse_args()
+
+    corpus = load_corpus(args.data, args.synthetic, args.seed)
+    result = run_gate(args.reference, args.candidate, corpus, args.repeat, args.min_throughput)
+
+    print 'Reference %s: %.2f reports/sec' % (args.reference, result['reference_reports_per_sec'])
+    print 'Candidate %s: %.2f reports/sec (%.2fx)' % (args.candidate, result['candidate_reports_per_sec'], result['speedup'])
+    if result['identical'] and result['known_differences']:
+        print 'Outputs identical on %d reports, but for %d known differences (see knownDifferences)' % (result['reports'], 
+                                                                                                   len(result['known_differences']))
+    elif result['identical']:
+        print 'Outputs identical on %d reports' % result['reports']
+    else:
+        print 'Outputs differ: %d differences in %d of %d reports' % (result['differences'], result['different_reports'], result['reports'])
+        for (reportid, output, index, field, refValue, candValue) in result['first_differences']:
+            print '    %s %s %s %s: %s != %s' % (reportid, output, index, field, refValue, candValue)
+    if not result['throughput_ok']:
+        print 'Throughput below %.2f of the reference' % args.min_throughput
+
+    if not args.output:
+        args.output = 'perfgate_%s.json' % time.strftime('%Y%m%d_%H%M%S')
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=1, sort_keys=True)
+    print 'Results written to %s' % args.output
+    print 'PASSED' if result['passed'] else 'FAILED'
+    sys.exit(0 if result['passed'] else 1)
@@ -0,0 +1,595 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Report data structures shared by the ETHER GUI and the headless batch runner
+
+This module has no GUI dependencies. It includes:
+    class FeatureStruct -- feature record as displayed, stored in and retrieved from the database
+    class FeatureAnnotation -- feature annotation made by the reviewer
+    class TimeAnnotation -- time annotation made by the reviewer
+    class SummaryElement -- summarization element made by the reviewer
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import re, datetime
+from dateutil.parser import parse
+
+dictFeatureNames = {"Symptom":"SYMPTOM", "Vaccine":"VACCINE", "Primary Diagnosis":"DIAGNOSIS", 
+                "Second Level Diagnosis":"SECOND_LEVEL_DIAGNOSIS", "Cause of Death":"CAUSE_OF_DEATH", 
+                "Drug":"DRUG", "Family History":"FAMILY_HISTORY", 
+                "Medical History":"MEDICAL_HISTORY", "Rule out":"RULE_OUT"}
+dictFeatureNamesInv = {"SYMPTOM":"Symptom", "VACCINE":"Vaccine", "DIAGNOSIS": "Primary Diagnosis", 
+                "SECOND_LEVEL_DIAGNOSIS":"Second Level Diagnosis", "CAUSE_OF_DEATH":"Cause of Death", 
+                "DRUG":"Drug", "FAMILY_HISTORY":"Family History", 'TIME_TO_ONSET':'Time to Onset',
+                "MEDICAL_HISTORY":"Medical History", "RULE_OUT":"Rule out", "LOT":'Lot Number'}
+dictFeatureAbr = {"SYMPTOM":"SYM", "VACCINE":"VAX", "DIAGNOSIS": "pDx", 
+                "SECOND_LEVEL_DIAGNOSIS":"sDx", "CAUSE_OF_DEATH":"CoD", 
+                "DRUG":'Tx', "FAMILY_HISTORY":"FHx", 'TIME_TO_ONSET':'',
+                "MEDICAL_HISTORY":"MHx", "RULE_OUT":"R/O", "LOT":''}     
+features2Translate = ["DIAGNOSIS", "CAUSE_OF_DEATH", "SECOND_LEVEL_DIAGNOSIS", "SYMPTOM"]        
+
+class FeatureStruct(object):
+    ##: The report data classes keep their attributes in slots, without an instance __dict__, as every loaded report
+    ##: holds lists of them
+    __slots__ = ('type', 'string', 'sentNum', 'timeStart', 'timeEnd', 'startPos', 'endPos', 'confidence', 'medDRA', 'featureID',
+                 'comment', 'matchlevel', 'cleanString')
+    
+    def __init__(self, (ftype, fstring, sentNum, tStart, tEnd, startPos, endPos, confidence, medDRA, featid, comment, matchid, cleanString)):
+        self.type = ftype
+        self.string = fstring
+        self.sentNum = sentNum
+        
+        if not tStart or tStart=='':
+            self.timeStart = None
+        elif isinstance(tStart, basestring):
+            self.timeStart = parse(tStart)
+        else:
+            self.timeStart = tStart
+            
+        if not tEnd or tEnd=='':
+            self.timeEnd = None
+        elif isinstance(tEnd, basestring):
+            self.timeEnd = parse(tEnd) 
+        else:
+            self.timeEnd = tEnd                      
+            
+        self.startPos = startPos
+        self.endPos = endPos
+        self.confidence = confidence
+        self.medDRA = medDRA
+        self.featureID = featid
+        
+        self.comment = comment
+        self.matchlevel = matchid
+        self.cleanString = cleanString
+    
+    def copy(self):
+        featStruct = FeatureStruct(self.getRecord())
+        return featStruct
+    
+    ##: the tuple this feature is constructed from, e.g., to pass it between processes
+    def getRecord(self):
+        return (self.type, self.string, self.sentNum, self.timeStart, self.timeEnd, self.startPos, self.endPos, self.confidence, 
+                self.medDRA, self.featureID, self.comment, self.matchlevel, self.cleanString)
+    
+    ##: this is called in consolidation. both string and clean string are set to be the new string
+    def setString(self, s):
+        self.cleanString = s
+        self.string = s
+    
+    def setStartTime(self, tStart):
+        if not tStart or tStart=='':
+            self.timeStart = None
+        elif isinstance(tStart, basestring):
+            try:
+                self.timeStart = parse(tStart)
+            except:
+                self.timeStart = None
+        else:
+            self.timeStart = tStart
+    
+    def setEndTime(self, tEnd):
+        if not tEnd or tEnd=='':
+            self.timeEnd = None
+        elif isinstance(tEnd, basestring):
+            try:
+                self.timeEnd = parse(tEnd) 
+            except:
+                self.timeEnd = None
+        else:
+            self.timeEnd = tEnd       
+                 
+    def getFeatureID(self):
+        return self.featureID
+    
+    def setFeatureID(self, idx):
+        self.featureID = idx
+    
+    ##: for report generation
+    def getFeatureDescription(self):
+        if self.timeStart:
+            strDateStart = self.timeStart.isoformat().split('T')[0]
+        else:
+            strDateStart = ''
+        
+        if self.timeEnd:
+            strDateEnd = self.timeEnd.isoformat().split('T')[0]
+        else:
+            strDateEnd = ''                           
+
+        if strDateStart==strDateEnd:
+            a = [dictFeatureNamesInv[self.type], self.string, strDateStart]
+        else:
+            a = [dictFeatureNamesInv[self.type], self.string, strDateStart+'~'+strDateEnd]
+        return a
+            
+    ##: for report generation
+    def getFeatureDescription_split(self):
+        if self.timeStart:
+            strDateStart = self.timeStart.isoformat().split('T')[0]
+        else:
+            strDateStart = ''
+        
+        if self.timeEnd:
+            strDateEnd = self.timeEnd.isoformat().split('T')[0]
+        else:
+            strDateEnd = ''                           
+
+        negationSet = set([r'disappeared', r'excluded', r'unlikely', r'non', r'no', r'not', r'denies',
+                       r'denied', r'without', r'wo', r'any', r'none', r'negative', r'neg', r'nothing', r'gone'])
+        
+        rows = []
+        fts = re.split(', | and ', self.getString())
+        meddra = self.getMedDRA()
+        if meddra:
+            pts = meddra.split(';; ')
+        else:
+            pts = ['']*len(fts)
+            
+        for i, ft in enumerate(fts):
+            if strDateStart==strDateEnd:
+                row = [dictFeatureNamesInv[self.type], ft, pts[i], strDateStart]
+            else:
+                row = [dictFeatureNamesInv[self.type], ft, pts[i], strDateStart+'~'+strDateEnd]
+                
+            wds = re.split(' |-', ft)
+            if set(wds).intersection(negationSet):
+                row.append('Y')
+            else:
+                row.append('')
+            
+            rows.append(row)
+            
+        return rows
+        
+    def getCleanString(self):
+        return self.cleanString
+    
+    def setPositions(self, (start, end)):
+        self.startPos = start
+        self.endPos = end
+    
+    def getStartPos(self):
+        return self.startPos
+    
+    def getEndPos(self):
+        return self.endPos
+    
+    def hasStartTime(self):
+        if self.timeStart:
+            return True
+        else:
+            return False
+        
+    def hasEndTime(self):
+        if self.timeEnd:
+            return True
+        else:
+            return False
+        
+    def getSentNum(self):
+        return self.sentNum
+    
+    def getStartDate(self):
+        return datetime.date(self.timeStart.year, self.timeStart.month, self.timeStart.day)
+     
+    def getEndDate(self):
+        return datetime.date(self.timeEnd.year, self.timeEnd.month, self.timeEnd.day)
+    
+    def getStartTime(self):
+        return self.timeStart
+    
+    def getEndTime(self):
+        return self.timeEnd
+    
+    def getType(self):
+        return self.type
+    
+    def setType(self, t):
+        self.type = t
+    
+    def getString(self):
+        return self.string
+    
+    def getConfidence(self):
+        return self.confidence
+    
+    def setComment(self, s):
+        self.comment = s
+    
+    def setMatchlevel(self, s):
+        self.matchlevel = s
+        
+    def setMedDRA(self, s):
+        self.medDRA = s
+        
+    def getMedDRA(self):
+        if self.medDRA:
+            return self.medDRA
+        else:
+            return ''
+
+    def getMatchlevel(self):
+        return self.matchlevel
+
+    def getDBFeatureTableRow(self):        
+        if self.timeStart:
+            strDateStart = self.timeStart.isoformat().split('T')[0]
+        else:
+            strDateStart = ''
+        
+        if self.timeEnd:
+            strDateEnd = self.timeEnd.isoformat().split('T')[0]
+        else:
+            strDateEnd = ''           
+
+        a = (self.type, self.string, self.sentNum, strDateStart, strDateEnd, self.startPos, self.endPos, self.medDRA, self.featureID, self.cleanString)
+        return a
+        
+    def getTableRow(self):
+        if self.timeStart:
+            if self.timeEnd - self.timeStart < datetime.timedelta(days=1):
+                strDate = self.timeStart.isoformat().split('T')[0]
+            else:
+                strDate = self.timeStart.isoformat().split('T')[0] + ' ~ ' + self.timeEnd.isoformat().split('T')[0]
+        else:
+            strDate = ''
+
+        strRow = [str(self.sentNum).zfill(3), dictFeatureAbr[self.type], self.string, strDate, self.comment, str(self.featureID).zfill(3), str(self.matchlevel)]
+        
+        return strRow
+
+    def getSummarizationTableRow(self):
+        if self.timeStart:
+            if self.timeEnd - self.timeStart < datetime.timedelta(days=1):
+                strDate = self.timeStart.isoformat().split('T')[0]
+            else:
+                strDate = self.timeStart.isoformat().split('T')[0] + ' ~ ' + self.timeEnd.isoformat().split('T')[0]
+        else:
+            strDate = ''
+        
+        ftype = SummaryElement.dictElemAbr[SummaryElement.dictFeat2Elem[self.type]]
+        strRow = [str(self.featureID).zfill(3), ftype, self.string, self.medDRA, 
+                        strDate, self.comment, self.matchlevel, str(self.startPos), str(self.endPos)]
+                
+#         self.headers = ['FeatureID', 'Type', 'Element Text', 'Preferred Term', 'Date', 'Comment', 'Feedback']
+
+        return strRow
+
+
+class FeatureAnnotation(object): 
+    __slots__ = ('annotationID', 'text', 'type', 'errorType', 'comment', 'startPos', 'endPos', 'featureID', 'timeID', 'timeRel',
+                 'preAnnotation', 'postAnnotation')
+    
+    def __init__(self, (annotationID, ftext, ftype, ferror, comment, startPos, endPos, featID, timeID, timeRel)):
+        self.annotationID = annotationID
+        self.text = ftext
+        self.type = ftype
+        self.errorType = ferror
+        self.comment = comment
+        self.startPos = startPos
+        self.endPos = endPos
+        self.featureID = featID
+        self.timeID = timeID
+        self.timeRel = timeRel
+        
+        self.preAnnotation = False
+        self.postAnnotation = False
+    
+    def __eq__(self, other):
+        if self.annotationID != other.annotationID \
+            or self.text != other.text \
+            or self.type != other.type \
+            or self.errorType != other.errorType \
+            or self.comment != other.comment \
+            or self.startPos != other.startPos \
+            or self.endPos != other.endPos \
+            or self.featureID != other.featureID \
+            or self.timeID != other.timeID \
+            or self.timeRel != other.timeRel:
+            return False
+        else:
+            return True
+        
+    def getFeatureID(self):
+        return self.featureID
+    
+    def getText(self):
+        return self.text
+    
+    def setText(self, s):
+        self.text = s
+    
+    def setPreAnnotation(self, pre):
+        self.preAnnotation = pre
+        
+    def setPostAnnotation(self, post):
+        self.postAnnotation = post
+    
+    def setType(self, tp):
+        self.type = tp
+        
+    def getType(self):
+        return self.type
+    
+    def getID(self):
+        return self.annotationID
+    
+    def getIDName(self):
+        sid = 'f'+str(self.annotationID)
+        if self.preAnnotation:
+            sid = sid + '*'
+        elif self.postAnnotation:
+            sid = sid + '+'
+        
+        return sid
+    
+    def setID(self, i):
+        self.annotationID = i
+    
+    def setTimeID(self, i):
+        self.timeID = i
+        if i==-1:
+            self.timeRel = ''
+    
+    def getTimeID(self):
+        return self.timeID
+    
+    def getTimeRelation(self):
+        return self.timeRel
+    
+    def getErrorType(self):
+        return self.errorType
+    
+    def getStartPos(self):
+        return self.startPos
+    
+    def getEndPos(self):
+        return self.endPos
+    
+    def getPositions(self):
+        return (self.startPos, self.endPos)
+    
+    def setPositions(self, (startPos, endPos)):
+        self.startPos = startPos
+        self.endPos = endPos
+        
+    def getTableRow(self):
+        ##:header = ['ID', 'Feature Text', 'StartPos', 'Type', 'TimeID', 'Relation', 'Comment']        
+        sid = 'f'+str(self.annotationID)
+        if self.preAnnotation:
+            sid = sid + '*'
+        elif self.postAnnotation:
+            sid = sid + '+'
+        
+        if self.timeID and self.timeID>0:
+            tid = 't'+str(self.timeID)
+        else:
+            tid = ''
+        strRow = (sid, self.text, str(self.startPos), str(self.endPos), self.type, tid, self.timeRel, self.comment, str(self.featureID))
+        return strRow
+    
+    def getDBRecord(self):
+        record = (self.annotationID, self.text, self.type, self.errorType, self.comment, 
+                self.startPos, self.endPos, '', self.featureID, self.timeID, self.timeRel)
+         
+        return record
+    
+class TimeAnnotation(object):
+    __slots__ = ('annotationID', 'string', 'datetime', 'confidence', 'comment', 'startPos', 'endPos', 'timeID', 'timeRel', 'type',
+                 'preAnnotation')
+    types = ["", "Date", "Relative", "Duration", "Weekday", "Frequency", "Age", "Time", "Anchor", "Other"]
+    
+    def __init__(self, (annotationID, ftext, ftype, dtime, startPos, endPos, confidence, comment, timeID, timeRel)):
+        self.annotationID = annotationID
+        self.string = ftext
+        self.datetime = dtime
+        self.confidence = confidence
+        self.comment = comment
+        self.startPos = startPos
+        self.endPos = endPos
+        self.timeID = timeID
+        self.timeRel = timeRel
+        
+        if isinstance(ftype, int):
+            self.type = TimeAnnotation.types[ftype]
+        else:
+            self.type = ftype
+            
+        self.preAnnotation = False
+    
+    def __eq__(self, other):
+        if self.annotationID != other.annotationID \
+            or self.string != other.string \
+            or self.datetime != other.datetime \
+            or self.type != other.type \
+            or self.confidence != other.confidence \
+            or self.comment != other.comment \
+            or self.timeID != other.timeID \
+            or self.timeRel != other.timeRel \
+            or self.endPos != other.endPos \
+            or self.startPos != other.startPos:
+            return False
+        else:
+            return True
+
+    def setPreAnnotation(self, pre):
+        self.preAnnotation = pre
+    
+    def setDate(self, dt):
+        self.datetime = dt
+    
+    def getDate(self):
+        return self.datetime
+    
+    def setType(self, ftype):
+        if isinstance(ftype, int):
+            self.type = ftype
+        else:
+            self.type = TimeAnnotation.types.index(ftype)
+    
+    def getID(self):
+        return self.annotationID
+    
+    def setID(self, i):
+        self.annotationID = i
+    
+    def setTimeID(self, i):
+        self.timeID = i
+        if i==-1:
+            self.timeRel = ''
+    
+    def getTimeID(self):
+        return self.timeID
+    
+    def getTimeRelation(self):
+        if not self.timeRel:
+            return ''
+        return self.timeRel
+    
+    def setString(self, s):
+        self.string = s
+    
+    def getString(self):
+        return self.string
+    
+    def getStartPos(self):
+        return self.startPos
+    
+    def getEndPos(self):
+        return self.endPos
+    
+    def getPositions(self):
+        return (self.startPos, self.endPos)
+    
+    def setPositions(self, (startPos, endPos)):
+        self.startPos = startPos
+        self.endPos = endPos
+    
+    def getTableRow(self):
+        ##: header = ['TimeID', 'Time Text', 'StartPos', 'Type', 'Date', 'Comment']          
+        sid = 't'+str(self.annotationID)
+        if self.preAnnotation:
+            sid = sid + '*'
+        
+        if self.timeID and self.timeID>0:
+            tid = 't'+str(self.timeID)
+        else:
+            tid = ''
+
+        ttp = self.type
+        strRow = (sid, self.string, str(self.startPos), str(self.endPos), ttp, self.datetime, tid, self.timeRel, self.comment)
+        return strRow
+    
+    def getRecord(self):
+        rec = (self.annotationID, self.string, self.startPos, self.endPos, self.type, self.datetime, self.confidence, self.comment, self.timeID, self.timeRel)
+        return rec   
+    
+    def getTypeIndex(self):
+        if self.type in TimeAnnotation.types:
+            return TimeAnnotation.types.index(self.type)
+        else:
+            return 0
+    
+    def getType(self):
+        return self.type
+    
+    def getTypeID(self):
+        return self.type
+              
+class SummaryElement(object):
+    __slots__ = ('annotationID', 'text', 'type', 'errorType', 'comment', 'startPos', 'endPos', 'preferTerm', 'featureID', 'timeID',
+                 'timeRel', 'startTime', 'endTime')
+    errorTypes = ['', 'Text incomplete', 'Text redundant']
+    featureTypes = ["DIAGNOSIS", "CAUSE_OF_DEATH", "SECOND_LEVEL_DIAGNOSIS", "SYMPTOM", 
+                       "RULE_OUT", "MEDICAL_HISTORY", "FAMILY_HISTORY", "DRUG", "VACCINE"]
+    elementTypes =  ["Diagnosis", "Secondary Outcome", "Cause of Death", "Symptom", "Vaccine", "Drug"]
+    dictElem2Feat = {"Diagnosis":"DIAGNOSIS", "Secondary Outcome":'SECOND_LEVEL_DIAGNOSIS', 
+                              "Cause of Death":"CAUSE_OF_DEATH", "Symptom":"SYMPTOM", "Vaccine":"VACCINE", "Drug":"DRUG"}
+    dictElemAbr = {"Diagnosis":"Dx", "Secondary Outcome":"S/O", "Cause of Death":"CoD", "Symptom":"SYM",
+                             "Vaccine":"VAX", "Drug":"Tx"}
+    dictFeat2Elem = dict((v,k) for k, v in dictElem2Feat.iteritems())
+
+    def __init__(self, (annotationID, ftext, ftype, ferror, comment, startPos, endPos, pt, featID, tStart, tEnd, timeID, timeRel)):
+        self.annotationID = annotationID
+        self.text = ftext
+        self.type = ftype
+        self.errorType = ferror
+        self.comment = comment
+        self.startPos = startPos
+        self.endPos = endPos
+        self.preferTerm = pt
+        self.featureID = featID
+        self.timeID = timeID
+        self.timeRel = timeRel
+        self.startTime = tStart
+        self.endTime = tEnd
+    
+    def getFeatureID(self):
+        return self.featureID
+    
+    def getText(self):
+        return self.text
+    
+    def getPreferTerm(self):
+        return self.preferTerm
+    
+    def getStartTime(self):
+        return self.startTime
+    
+    def getEndTime(self):
+        return self.endTime
+    
+    def getType(self):
+        return self.type
+    
+    def getErrorType(self):
+        return self.errorType
+    
+    def getPositions(self):
+        return (self.startPos, self.endPos)
+    
+    def isElement(self):
+        if self.type in FeatureAnnotation.elementTypes:
+            return True
+        else:
+            return False
+    
+    def isFeature(self):
+        if self.type in FeatureAnnotation.featureTypes:
+            return True
+        else:
+            return False
+    
+    def summarizationDBRecord(self):
+        record = (self.annotationID, self.text, self.type, self.errorType, self.comment, 
+                  self.startPos, self.endPos, self.preferTerm, self.featureID, self.startTime, self.endTime)
+        
+        return record
+    
+    def getFeatureObj(self):
+        feat = FeatureStruct((self.dictElem2Feat[self.type], self.text, -1, self.startTime, self.endTime, self.startPos, 
+                              self.endPos, -1, self.preferTerm, -1, self.comment, -1, self.text))
+        return feat
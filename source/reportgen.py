@@ -0,0 +1,220 @@
+#!/usr/bin python
+# -*- coding: utf-8 -*-
+
+"""Synthetic VAERS/FAERS reports for benchmarks
+
+This module generates report narratives at any scale, from sentence templates filled with the
+terms of the lexicon (symptoms, diagnoses, drugs and vaccines) and with the time expressions
+the extraction recognizes: calendar dates in several formats, relative days and hours, durations
+and days post vaccination. The dates are consistent with the exposure date of the report, and
+the same seed always gives the same reports. It can be run from the command line, from the
+source folder:
+
+    python reportgen.py synthetic.txt [--count 1000] [--seed 0] [--faers-ratio 0.2]
+
+The core functions it provides include:
+
+class ReportGenerator -- Build report dictionaries, like those read by batch.read_data_file(), and long
+narratives dense in dates.
+
+write_data_file() -- Write reports as a VAERS/FAERS txt export, to be read by ETHER or batch.py.
+"""
+#
+# Wei Wang, Engility, wei.wang@engility.com
+#
+
+import random, datetime, argparse
+import textan, batch
+
+##: Lexicon tags of the terms filled in the templates
+termTags = ['Symptom', 'Diagnosis', 'Drug', 'Vaccine']
+
+monthNames = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+              'November', 'December']
+numberWords = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten']
+
+##: Fields of a txt export line, in order
+dataFileFields = ['Report ID', 'Age', 'Date of Exposure', 'Date of Onset', 'Vaccines', 'Vaccine Names', 'MedDRA', 'Gender',
+                  'Lab Text', 'Received Date', 'Lot Number', 'Free Text']
+
+introTemplates = [
+    "A {age} year-old {person} with past medical history significant for {dx} received {vax} on {exp_long}.",
+    "This {age} year old {gender} patient was vaccinated with {vax} on {exp_slash}.",
+    "Patient received {vax} and {vax2} vaccines at the clinic on {exp_month}.",
+    "Information has been received from a health professional concerning a {age} year old {person} who on {exp_long} was vaccinated with {vax}.",
+]
+
+onsetTemplates = [
+    "{Num_days} days after vaccination, {pron} developed {sym} and {sym2}.",
+    "The next day {pron} experienced {sym}.",
+    "On {onset_long}, {pron} reported {sym}, {sym2} and {sym3}.",
+    "{hours} hours post vaccination the patient had {sym}.",
+    "Within {minutes} minutes of the injection {pron} complained of {sym}.",
+    "On {onset_slash} {pron} woke up with {sym} and {sym2}.",
+]
+
+courseTemplates = [
+    "{Pron} was hospitalized on {later_slash} and diagnosed with {dx}.",
+    "On Day {day} post vaccination {pron} was seen in the emergency room for {sym}.",
+    "{Pron} was treated with {drug} for {duration} days.",
+    "Concomitant medications included {drug} and {drug2}.",
+    "The symptoms resolved {weeks} weeks later.",
+    "Two weeks later {pron} was diagnosed with {dx2}.",
+    "{Pron} had a history of {dx2} since {year}.",
+    "On {later_long}, {drug} was started and the {sym} improved.",
+    "{Pron} was admitted to the hospital on {later_month} with {sym2}.",
+]
+
+outcomeTemplates = [
+    "The patient recovered on {end_long}.",
+    "Patient died on {end_long}. COD: {dx}.",
+    "At the time of this report, the outcome was unknown.",
+    "{Pron} was discharged home on {end_slash}.",
+]
+
+##: Sentences of the long follow-up narratives, each with one or two dates
+timelineTemplates = [
+    "On {date_long}, {pron} reported {sym}.",
+    "{date_slash}: {sym} and {sym2}, treated with {drug}.",
+    "From {date_month} to {date2_month} {pron} was hospitalized for {dx}.",
+    "Laboratory tests on {date_slash} and {date2_slash} were normal.",
+    "{Pron} received {drug} on {date_form} and {date2_long}.",
+    "The {sym} resolved on {date_month} but recurred {days} days later.",
+]
+
+class ReportGenerator:
+    """Generator of synthetic report dictionaries, with terms drawn from the lexicon"""
+
+    def __init__(self, seed = 0, faersRatio = 0., lexiconTables = None):
+        self.seed = seed
+        self.faersRatio = faersRatio
+        if lexiconTables is None:
+            (lexicon, lexiconTables) = textan.load_lexicon()
+        self.terms = self.get_lexicon_terms(lexiconTables[0])
+
+    def get_lexicon_terms(self, hashdict):
+        """Return {tag: sorted list of the plain words with the tag}"""
+        terms = dict((tag, []) for tag in termTags)
+        for word, tag in hashdict.items():
+            if tag in terms and word.isalpha() and len(word) > 3:
+                terms[tag].append(word)
+        for tag in terms:
+            terms[tag].sort()
+        return terms
+
+    def is_faers(self, index):
+        """Reports are FAERS at the rate faersRatio, the first one is always VAERS"""
+        return int((index + 1) * self.faersRatio) > int(index * self.faersRatio)
+
+    def generate(self, count):
+        """Return a list of count report dictionaries"""
+        return [self.generate_report(i) for i in range(count)]
+
+    def generate_report(self, index):
+        """Return the report dictionary of the index-th report, the same for a given seed"""
+        rand = random.Random('%s-%d' % (self.seed, index))
+        faers = self.is_faers(index)
+
+        expDate = datetime.date(2005, 1, 1) + datetime.timedelta(days=rand.randint(0, 3650))
+        onsetDate = expDate + datetime.timedelta(days=rand.choice([0, 0, 1, 1, 2, 3, 5, 7, 10, 14, 21]))
+        receivedDate = onsetDate + datetime.timedelta(days=rand.randint(1, 60))
+        gender = rand.choice(['M', 'F'])
+        vaccines = rand.sample(self.terms['Vaccine'], 2)
+        symptoms = rand.sample(self.terms['Symptom'], 4)
+
+        report = {}
+        if faers:
+            report['Report ID'] = '%d-%d' % (10000000 + index, rand.randint(1, 3))
+            report['Date of Exposure'] = ''
+            report['Date of Onset'] = ''
+        else:
+            report['Report ID'] = '%06d-1' % (300000 + index)
+            report['Date of Exposure'] = self.format_form_date(expDate)
+            report['Date of Onset'] = self.format_form_date(onsetDate)
+        report['Age'] = str(rand.randint(1, 90))
+        report['Vaccines'] = ', '.join([vax[:5].upper() for vax in vaccines])
+        report['Vaccine Names'] = ', '.join([vax.upper() for vax in vaccines])
+        report['MedDRA'] = '; '.join([sym.capitalize() for sym in sorted(symptoms)])
+        report['Gender'] = gender
+        report['Lab Text'] = ''
+        report['Received Date'] = self.format_form_date(receivedDate)
+        report['Lot Number'] = '%s%d' % (rand.choice(['U', 'AC', 'FAV', 'L']), rand.randint(1000, 999999))
+        report['Free Text'] = self.generate_narrative(rand, report['Age'], gender, expDate, onsetDate, vaccines, symptoms)
+
+        return batch.complement_report_fields([report])[0]
+
+    def generate_narrative(self, rand, age, gender, expDate, onsetDate, vaccines, symptoms):
+        later = onsetDate + datetime.timedelta(days=rand.randint(1, 10))
+        end = later + datetime.timedelta(days=rand.randint(1, 30))
+        days = (onsetDate - expDate).days
+        if gender=='M':
+            (person, genderName, pron) = ('man' if int(age) >= 18 else 'boy', 'male', 'he')
+        else:
+            (person, genderName, pron) = ('woman' if int(age) >= 18 else 'girl', 'female', 'she')
+
+        values = {'age': age, 'person': person, 'gender': genderName, 'pron': pron, 'Pron': pron.capitalize(),
+                  'vax': vaccines[0].upper(), 'vax2': vaccines[1].upper(),
+                  'sym': symptoms[0], 'sym2': symptoms[1], 'sym3': symptoms[2],
+                  'dx': rand.choice(self.terms['Diagnosis']), 'dx2': rand.choice(self.terms['Diagnosis']),
+                  'drug': rand.choice(self.terms['Drug']), 'drug2': rand.choice(self.terms['Drug']),
+                  'Num_days': self.format_number(rand, max(days, 1)).capitalize(), 'hours': rand.choice([2, 6, 12, 24, 36, 48]),
+                  'minutes': rand.choice([5, 10, 15, 30]), 'day': (later - expDate).days, 'duration': rand.randint(2, 14),
+                  'weeks': self.format_number(rand, rand.randint(1, 6)), 'year': expDate.year - rand.randint(1, 10)}
+        for name, date in [('exp', expDate), ('onset', onsetDate), ('later', later), ('end', end)]:
+            values[name + '_long'] = '%d %s %d' % (date.day, monthNames[date.month-1], date.year)
+            values[name + '_slash'] = '%d/%d/%02d' % (date.month, date.day, date.year % 100)
+            values[name + '_month'] = '%s %d, %d' % (monthNames[date.month-1], date.day, date.year)
+
+        sentences = [rand.choice(introTemplates)]
+        sentences += rand.sample(onsetTemplates, rand.randint(1, 3))
+        sentences += rand.sample(courseTemplates, rand.randint(1, 6))
+        sentences.append(rand.choice(outcomeTemplates))
+        return ' '.join([sentence.format(**values) for sentence in sentences])
+
+    def generate_timeline(self, numSentences, index = 0):
+        """Return a long narrative dense in dates, like the follow-up of a FAERS report: numSentences dated events,
+        with the dates in all the formats of the templates, the same for a given seed and index."""
+        rand = random.Random('%s-timeline-%d' % (self.seed, index))
+        pron = rand.choice(['he', 'she'])
+        date = datetime.date(2005, 1, 1) + datetime.timedelta(days=rand.randint(0, 3650))
+        sentences = []
+        for i in range(numSentences):
+            date += datetime.timedelta(days=rand.randint(0, 5))
+            date2 = date + datetime.timedelta(days=rand.randint(1, 10))
+            values = {'pron': pron, 'Pron': pron.capitalize(), 'sym': rand.choice(self.terms['Symptom']),
+                      'sym2': rand.choice(self.terms['Symptom']), 'dx': rand.choice(self.terms['Diagnosis']),
+                      'drug': rand.choice(self.terms['Drug']), 'days': self.format_number(rand, rand.randint(2, 10))}
+            for name, d in [('date', date), ('date2', date2)]:
+                values[name + '_long'] = '%d %s %d' % (d.day, monthNames[d.month-1], d.year)
+                values[name + '_slash'] = '%d/%d/%02d' % (d.month, d.day, d.year % 100)
+                values[name + '_month'] = '%s %d, %d' % (monthNames[d.month-1], d.day, d.year)
+                values[name + '_form'] = self.format_form_date(d)
+            sentences.append(rand.choice(timelineTemplates).format(**values))
+        return ' '.join(sentences)
+
+    def format_number(self, rand, n):
+        if n < len(numberWords) and rand.random() < 0.5:
+            return numberWords[n]
+        return str(n)
+
+    def format_form_date(self, date):
+        """Date as in the VAERS export, e.g., 10-MAR-10"""
+        return '%02d-%s-%02d' % (date.day, monthNames[date.month-1][:3].upper(), date.year % 100)
+
+def write_data_file(reports, filename):
+    """Write the reports as a txt export, one quoted report per line."""
+    with open(filename, 'w') as f:
+        for report in reports:
+            f.write('"' + '", "'.join([str(report[fld]) for fld in dataFileFields]) + '"\n')
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description='Synthetic VAERS/FAERS reports')
+    argparser.add_argument('datafile', help='txt export to write')
+    argparser.add_argument('--count', type=int, default=1000, help='number of reports (default: 1000)')
+    argparser.add_argument('--seed', default='0', help='seed of the generated reports (default: 0)')
+    argparser.add_argument('--faers-ratio', type=float, default=0., help='fraction of FAERS reports (default: 0)')
+    args = argparser.parse_args()
+
+    reports = ReportGenerator(args.seed, args.faers_ratio).generate(args.count)
+    write_data_file(reports, args.datafile)
+    print 'Wrote %d reports to %s' % (len(reports), args.datafile)
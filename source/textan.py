@@ -9,21 +9,31 @@ The implementation borrows some code from Tarsqi toolkit [http://www.timeml.org/
 This module includes:
     class FeatureTextractor -- Main class provides functions to extract medical features and 
         associate features with time. 
+    class DocumentContext -- hold the per-document state of an extraction
     class Feature -- define medical feature
     class DocumentFeature – define features extracted from the text
+    class FastTagger -- tag words with the lexicon
+    load_lexicon() -- load the merged lexicon, from the compiled lexicon file when it is up to date
 """
 #
 # Wei Wang, Engility, wei.wang@engility.com 
 #
 
-import nltk, re, StringIO, ast
-import util
+import re, StringIO, ast, os, time, hashlib, marshal, logging, threading
+import util, lazyimport
 import timexan
+import chunker
 from datetime import date, datetime, timedelta
-from dateutil.parser import *
 
-class Feature:
+##: Loaded on first use, see lazyimport.py
+nltk = lazyimport.LazyModule('nltk')
+
+class Feature(object):
     """Feature class represents medical feature extracted from text"""
+    ##: Attributes in slots rather than a per-instance __dict__, there are many instances per report
+    __slots__ = ('type', 'string', 'sentNum', 'startPos', 'endPos', 'tlink', 'id', 'confidence', 'tlinks', 'inclause', 'tags',
+                 'cleanString')
+    
     def __init__(self, (ttype, sfeat, sentN, tags, startInText, endInText), inlinks=None):
         self.type = ttype
         self.string = sfeat
@@ -95,6 +105,13 @@ class Feature:
                 
         return  s
 
+    def copy(self):
+        """Shallow copy; the attributes of a feature are rebound, never changed in place"""
+        feat = Feature.__new__(Feature)
+        for attr in Feature.__slots__:
+            setattr(feat, attr, getattr(self, attr))
+        return feat
+        
     def setInClause(self, flag):
         self.inclause = flag
     
@@ -239,9 +256,10 @@ def read_syntactic_rules(rule_file):
 
     return rules
 
-class TLink:
+class TLink(object):
     """Implements a TLink object. Note that this is not the same as the TLink is defined in TimeML.
     It was initially design to follow TimeML, but turned out to take a different approach. """
+    __slots__ = ('timexes', 'type', 'timexes2')
     
     def __init__(self, timexes=[]):
         if isinstance(timexes, list):
@@ -303,6 +321,10 @@ class TLink:
 class DocumentFeature:
     """Class includes all extracted information for a give document. """
     
+    ##: Why the temporal stage was skipped, 'size' or 'time' (see FeatureExtractor.set_document_budget), '' for a full extraction.
+    ##: A class attribute, so that the objects pickled before it existed read as full extractions.
+    degraded = ''
+    
     def __init__(self, featList, timexes, expDate, onsetDate, receivedDate, expConfidence, expDateIn, onsetDateIn):
         self.timexList = timexes
         
@@ -340,6 +362,12 @@ class DocumentFeature:
     def getConfidenceLevel(self):
         return self.confidence
     
+    def setDegraded(self, reason):
+        self.degraded = reason
+        
+    def getDegraded(self):
+        return self.degraded
+    
     def getCalculatedOnsetTimeHours(self):
         return self.onsetHours
     
@@ -569,17 +597,14 @@ class DocumentFeature:
         return [timex.getTimexString() for timex in self.timexList]
         
         
-class FastTagger:
-    """Implements a tagger with lexicons"""
-    def __init__(self, lexicon):
-        self.pairs = []
-        self.hashdict = {}
-        db = re.compile("\.|\]")
-        for lexis, tag in lexicon:
-            if (db.search(lexis)):
-                self.pairs.append((re.compile(lexis), tag))
-            else:
-                self.hashdict[lexis[:-1]] = tag
+class LinearTagger:
+    """Implements a tagger with lexicons, scanning the wildcard entries one by one. 
+    Kept as the reference implementation of FastTagger."""
+    def __init__(self, lexicon, tables = None):
+        if not tables:
+            tables = build_lexicon_tables(lexicon)
+        (self.hashdict, patterns) = tables
+        self.pairs = [(re.compile(lexis), tag) for lexis, tag in patterns]
 
     def tag(self, words):
         word_tag = []
@@ -594,14 +619,167 @@ class FastTagger:
                         break
             word_tag.append((word, found_tag))
         return word_tag
-
-def normalize_date_string(time_string):
-    if time_string == '':
-        return ''
     
+class FastTagger:
+    """Implements a tagger with lexicons. Plain words are looked up in a dictionary. The wildcard 
+    entries are combined into alternation regexes that keep the lexicon order, so the first 
+    matching entry wins as in LinearTagger, and their results are kept in an LRU cache shared 
+    by all the documents tagged with this tagger."""
+    
+    ##: Python 2 re supports at most 100 groups in one pattern
+    maxGroups = 99
+    
+    def __init__(self, lexicon, tables = None, cacheSize = 50000):
+        if not tables:
+            tables = build_lexicon_tables(lexicon)
+        (self.hashdict, patterns) = tables
+        self.alternations = self._combine_patterns(patterns)
+        self.cache = util.LRUCache(cacheSize)
+        
+    def _combine_patterns(self, patterns):
+        """Combine the wildcard patterns into as few alternation regexes as the group limit allows.
+        Each entry is wrapped in an outer group, which is the last group closed when the entry 
+        matches, so lastindex identifies the entry. Return a list of (regexp, {group index: tag})."""
+        alternations = []
+        parts = []
+        groupTags = {}
+        numGroups = 0
+        for lexis, tag in patterns:
+            n = re.compile(lexis).groups + 1
+            if parts and numGroups + n > self.maxGroups:
+                alternations.append((re.compile('|'.join(parts)), groupTags))
+                parts = []
+                groupTags = {}
+                numGroups = 0
+            parts.append('(' + lexis + ')')
+            groupTags[numGroups + 1] = tag
+            numGroups += n
+        if parts:
+            alternations.append((re.compile('|'.join(parts)), groupTags))
+        return alternations
+    
+    def match_wildcards(self, word):
+        """Return the tag of the first wildcard entry matching the word, or 'no tag'."""
+        for regexp, groupTags in self.alternations:
+            m = regexp.match(word)
+            if m:
+                return groupTags[m.lastindex]
+        return 'no tag'
+
+    def tag(self, words):
+        word_tag = []
+        for word in words:
+            if word in self.hashdict:
+                found_tag = self.hashdict[word]
+            else:
+                found_tag = self.cache.get(word)
+                if found_tag is None:
+                    found_tag = self.match_wildcards(word)
+                    self.cache.put(word, found_tag)
+            word_tag.append((word, found_tag))
+        return word_tag
+
+##: Source lexicon files, in the order they are merged, and the compiled lexicon built from them
+lexiconFiles = ['lexicon3rd.txt', 'lexicon.txt', 'lexicon2nd.txt']
+lexiconCompiledFile = 'lexicon.compiled'
+lexiconCompiledVersion = 1
+
+##: Statistics of the last call to load_lexicon(): source ('compiled' or 'text'), seconds, 
+##: parse_seconds (time to parse the text lexicons) and saved_seconds
+lexiconLoadStats = {}
+##: Sentences whose tags and features FeatureExtractor keeps, see process_sentence()
+sentenceCacheSize = 20000
+
+def build_lexicon_tables(lexicon):
+    """Split the lexicon into the tagger tables: a dictionary of plain words, 
+    and a list of (pattern, tag) for wildcard entries, in lexicon order."""
+    hashdict = {}
+    patterns = []
+    db = re.compile("\.|\]")
+    for lexis, tag in lexicon:
+        if (db.search(lexis)):
+            patterns.append((lexis, tag))
+        else:
+            hashdict[lexis[:-1]] = tag
+    return (hashdict, patterns)
+
+def _lexicon_digests(paths):
+    digests = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            digests.append(hashlib.md5(f.read()).hexdigest())
+    return digests
+
+def _read_compiled_lexicon(filename, digests):
+    """Return the content of the compiled lexicon file, or None if it is missing or out of date."""
+    try:
+        with open(filename, 'rb') as f:
+            header = marshal.load(f)
+            if header.get('version')!=lexiconCompiledVersion or header.get('digests')!=digests:
+                return None
+            content = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError, AttributeError):
+        return None
+    content['parse_seconds'] = header.get('parse_seconds', 0.)
+    return content
+
+def _write_compiled_lexicon(filename, digests, parseSeconds, lexicon, tables):
+    ##: write to a temporary file first, so a concurrent reader never sees a partial file
+    tmpname = '%s.%d.tmp' % (filename, os.getpid())
     try:
-        dt = parse(time_string)
-    except:
+        with open(tmpname, 'wb') as f:
+            marshal.dump({'version': lexiconCompiledVersion, 'digests': digests, 'parse_seconds': parseSeconds}, f)
+            marshal.dump({'lexicon': lexicon, 'hashdict': tables[0], 'patterns': tables[1]}, f)
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+    except (IOError, OSError) as e:
+        logging.warning("Couldn't write compiled lexicon " + filename + ". " + str(e))
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+def load_lexicon(path = '', useCompiled = True):
+    """Load the merged lexicon (lexicon3rd + lexicon + lexicon2nd) and the tagger tables.
+    The compiled lexicon file in the same folder is used if it was built from the current 
+    lexicon files; otherwise the text lexicons are parsed and the compiled file is rebuilt.
+    Return (lexicon, tables), where tables is to be passed to FastTagger."""
+    
+    t0 = time.time()
+    paths = [os.path.join(path, fname) for fname in lexiconFiles]
+    filename = os.path.join(path, lexiconCompiledFile)
+    digests = _lexicon_digests(paths)
+    
+    content = None
+    if useCompiled:
+        content = _read_compiled_lexicon(filename, digests)
+        
+    if content:
+        lexicon = content['lexicon']
+        tables = (content['hashdict'], content['patterns'])
+        seconds = time.time() - t0
+        lexiconLoadStats.clear()
+        lexiconLoadStats.update({'source': 'compiled', 'seconds': seconds, 'parse_seconds': content['parse_seconds'],
+                                 'saved_seconds': content['parse_seconds'] - seconds})
+        return (lexicon, tables)
+    
+    lexicon = []
+    for fname in paths:
+        with open(fname, 'r') as f:
+            lexicon += ast.literal_eval(f.read())
+    tables = build_lexicon_tables(lexicon)
+    seconds = time.time() - t0
+    
+    if useCompiled:
+        _write_compiled_lexicon(filename, digests, seconds, lexicon, tables)
+        
+    lexiconLoadStats.clear()
+    lexiconLoadStats.update({'source': 'text', 'seconds': seconds, 'parse_seconds': seconds, 'saved_seconds': 0.})
+    return (lexicon, tables)
+
+def normalize_date_string(time_string):
+    ##: the memoized parse of timexan, None for an empty or invalid string
+    dt = timexan.parse_time_string(time_string)
+    if dt is None:
         return ''
         
     return dt.isoformat().split('T')[0]
@@ -620,14 +798,47 @@ def report_reader(reports_string):
             report = dict(zip(fieldnames, fields))
             yield report
     
+class DocumentContext:
+    """ Per-document state of an extraction: the text, its sentences and their tags,  
+        the reference dates, clause zones, time impact zones and time references.
+        A new context is created for every document and passed through the temporal 
+        methods, so one FeatureExtractor can be shared by concurrent extractions. 
+        The tokenization of the text is held in a util.TokenizedDocument shared by all stages. """
+    
+    def __init__(self, tokenized, reportType='vaers'):
+        self.tokenized = tokenized
+        self.text = tokenized.text
+        self.sentences = tokenized.sentences
+        self.reportType = reportType
+        self.sentence_startPos = list(tokenized.sentence_startPos)
+        
+        self.taggedSentences = tokenized.taggedSentences
+        self.sentence_tags = []
+        self.sentence_full_tags = []
+        self.blockout_range = []
+        self.clauseZones = []
+        self.timexImpactZones = []
+        self.timeReferences = {}
+        
+        self.exposureDate = None
+        self.onsetDate = None
+        self.receiveDate = None
+        self.exposureDateConfidence = 0
+        self.onsetDateConfidence = 0
+        
+        ##: time.time() after which the temporal stage gives up, checked in its loops; None for no limit
+        self.deadline = None
+        
 class FeatureExtractor:
     """ Main class provides functions to extract medical features and 
-        associate features with time. """
+        associate features with time. The extractor only holds the lexicon, 
+        tagger and compiled grammars; the state of each document lives in a 
+        DocumentContext, so an instance can be shared by a pool of threads. """
         
-    def __init__(self, config=None, lexicon=None):
+    def __init__(self, config=None, lexicon=None, lexiconTables=None):
         
         if not config:
-            config, lexicon = self.initialization()
+            config, lexicon, lexiconTables = self.initialization()
             
         self.signal_rules_raw = read_syntactic_rules("./signal.syntactic.rules.txt")          
         self.signal_rules = self._populate_rules(self.signal_rules_raw)
@@ -646,9 +857,9 @@ class FeatureExtractor:
         
         self.config = config
         self.lexicon = lexicon          
-        self.regexp_tagger = FastTagger(self.lexicon)
-        self.cp = nltk.RegexpParser(self.config['grammar'])
-        self.cp1 = nltk.RegexpParser(self.config['grammar1'])
+        self.regexp_tagger = FastTagger(self.lexicon, lexiconTables)
+        self.cp = chunker.TagChunker(self.config['grammar'])
+        self.cp1 = chunker.TagChunker(self.config['grammar1'])
         self.labels = self.config['features']
         self.labels_gram1 = self.config['features_grammar1']
         self.st_filter = set(self.labels) - set(self.labels_gram1)
@@ -674,12 +885,51 @@ class FeatureExtractor:
         #regexp for replacing all non printable and non ascii characters with whitespace
         self.nonprint = re.compile("[%s]" % ''.join(chr(ind) for ind in range(0, 10) + range(11,32) + range(127, 256)))
         
+        ##: (regexp, replacement) applied in turn by clean_text(). The strings below are replaced first: 
+        ##: abbreviations, e.g., h/o to hx; the apostrophe is deleted to convert shouldn't to shouldnt; 
+        ##: ';' becomes ', ' (added by Wei Wang, agreed by Taxiarchis)
+        replacements = [("hx.", "hx"), ("dx.", "dx"), ("h/o", "hx"), ("r/o", "ro"), ("w/o", "wo"), ("w/i", "wi"), ("b/p", ""), 
+                        ("R/O", "ro"), ("W/O", "wo"), ("W/I", "wi"), ("B/P", ""), ("'", ''), (";", ', ')]
+        self.clean_rules = [(re.compile(re.escape(old)), new) for (old, new) in replacements]
+        self.clean_rules += [(self.symbs, ' '), (self.semis, ', '), (self.nonprint, ' ')]
+        
         self.token_timeline_breakers = ['considered', 'classified', 'documented', 'plan', 'released', 'administered', 'coded', 'commented', 'comment', 'company']
         
         self.re_weekday = re.compile('(monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tue|wed|thu|fri|sat|sun)$', re.I)
     
         self.feature_exclusive_tags = ['DX', 'Assessment', 'Impression', 'rule_out_abbrev', 'Rule', 'Out', 'History', 'MedicalHistory',
                                        'FamilyModifier', 'FamilyHistory', 'Family', 'DeathIndicator', 'Cause']
+        
+        ##: Feed the first pass chunk leaves into the second pass directly, see extract_sentence_features()
+        self.cascade = True
+        ##: Words checked by is_cascade_word()
+        self.cascade_words = {}
+        
+        ##: Wall time and calls of the extraction stages, off unless enabled
+        self.timer = util.StageTimer()
+        
+        ##: Tagged tokens and features of the sentences seen, with spans relative to the sentence; None to disable
+        self.sentence_cache = util.LRUCache(sentenceCacheSize)
+        
+        ##: Per-document budget of extract_features_temporal(), None for no limit, see set_document_budget()
+        self.budget_chars = None
+        self.budget_seconds = None
+        ##: Documents given the features-only result, by the budget exceeded; counted under budget_lock, 
+        ##: since the extractions of a thread pool share the extractor (the sentence cache can be None, and its lock with it)
+        self.budget_overruns = {'size': 0, 'time': 0}
+        self.budget_lock = threading.Lock()
+    
+    def set_document_budget(self, maxChars = None, maxSeconds = None):
+        """Limit the narrative length and the extraction time of a document. A narrative longer than maxChars 
+        is not associated with time at all; an extraction still in the temporal stage after maxSeconds stops 
+        there, the deadline being checked in the loops over the timex windows, the timexes and the sentences. 
+        Both give the features-only result of extract_degraded(). None or 0 means no limit."""
+        self.budget_chars = maxChars or None
+        self.budget_seconds = maxSeconds or None
+        
+    def getBudgetOverruns(self):
+        with self.budget_lock:
+            return dict(self.budget_overruns)
     
     def initialization(self):    
         try:
@@ -690,20 +940,11 @@ class FeatureExtractor:
             print str(e)
 
         try:
-            with open('lexicon.txt', 'r') as f:
-                lexicon = ast.literal_eval(f.read())
-            
-            with open('lexicon2nd.txt', 'r') as f:
-                lexicon2 = ast.literal_eval(f.read())    
-
-            with open('lexicon3rd.txt', 'r') as f:
-                lexicon3 = ast.literal_eval(f.read())    
-                
+            (lexicon, lexiconTables) = load_lexicon()
         except Exception as e:
             print str(e)
-        lexicon = lexicon3 + lexicon + lexicon2 
         
-        return (config, lexicon)
+        return (config, lexicon, lexiconTables)
     
     def getSignalRelation(self,word):        
  
@@ -730,11 +971,17 @@ class FeatureExtractor:
         return rule2_index
     
     
-    def get_untagged(self, text):
+    def get_untagged(self, text, spans=None):
+        """Tag the words, leaving out punctuations and unimportant words. With the spans of the words, 
+        return util.TaggedToken that carry them."""
         punctuations = ['."',"```","`","+","*","^","%","@","<",">","'","-",'!', '?', ';', ':', '"', '/', ')','(','.','?','?','?','|','_','~','#','[',']','{','}','$','?']
-        all = self.regexp_tagger.tag([w.lower() for w in text if w not in punctuations])
-
-        return [(word,tag) for word,tag in all if not tag == 'unimportant']
+        if spans is None:
+            all = self.regexp_tagger.tag([w.lower() for w in text if w not in punctuations])
+            return [(word,tag) for word,tag in all if not tag == 'unimportant']
+        
+        kept = [(w.lower(), span) for (w, span) in zip(text, spans) if w not in punctuations]
+        all = self.regexp_tagger.tag([w for (w, span) in kept])
+        return [util.TaggedToken(word, tag, span) for ((word, tag), (w, span)) in zip(all, kept) if not tag == 'unimportant']
     
     def get_tags(self, text):
         return self.regexp_tagger.tag([w.lower() for w in text if w.lower()])
@@ -763,34 +1010,190 @@ class FeatureExtractor:
         return line
     
     def clean_text(self, freetext):
-        #here we replace the first string with the second throughout the document
-        freetext = freetext.replace("hx.", "hx")
-        freetext = freetext.replace("dx.", "dx")
-        freetext = freetext.replace("h/o", "hx")
-        freetext = freetext.replace("r/o", "ro")
-        freetext = freetext.replace("w/o", "wo")
-        freetext = freetext.replace("w/i", "wi")
-        freetext = freetext.replace("b/p", "")
-        freetext = freetext.replace("R/O", "ro")
-        freetext = freetext.replace("W/O", "wo")
-        freetext = freetext.replace("W/I", "wi")
-        freetext = freetext.replace("B/P", "")
-
-        #here we delete the apostrophe in order to convert r/o to ro or shouldnt to shouldnt
-        freetext = freetext.replace("'", '')
-        
-        freetext = freetext.replace(";", ', ') # added by Wei Wang, agreed by Taxiarchis
-        
-        #here we delete all these symbols and replace it with whitespace to convert post-vac to post vac
-        freetext = self.symbs.sub(' ', freetext)
-        #here we delete semi-colon and comma and replace it with comma and whitespace
-        #to convert post-vac to post vac
-        freetext = self.semis.sub(', ', freetext)   
-        #replace all non printable and non ascii characters with whitespace
-        freetext = self.nonprint.sub(' ', freetext)
-        
+        """Normalize abbreviations such as 'h/o', and replace the symbols, semi-colons and non printable 
+        characters with whitespace or commas, e.g., post-vac to post vac."""
+        for (regexp, repl) in self.clean_rules:
+            freetext = regexp.sub(repl, freetext)
         return freetext
-
+    
+    def clean_text_offsets(self, freetext):
+        """Clean the text as clean_text() does. Return the cleaned text, and the offset in the  
+        original text of each character of it."""
+        offsets = range(len(freetext))
+        for (regexp, repl) in self.clean_rules:
+            (freetext, offsets) = util.sub_with_offsets(regexp, repl, freetext, offsets)
+        return (freetext, offsets)
+    
+    def tag_sentence(self, sentence0, sentStart = 0):
+        """Clean, tokenize and tag the sentence starting at sentStart in the text. The tagged tokens are 
+        util.TaggedToken carrying the span of their words in the text, through chunking to the features."""
+        with self.timer.stage('tokenize'):
+            (sentence, offsets) = self.clean_text_offsets(sentence0)
+            tokens = nltk.word_tokenize(sentence)
+            spans = []
+            for (start, end) in util.find_token_spans(tokens, sentence):
+                if end > start:
+                    spans.append((offsets[start] + sentStart, offsets[end-1] + 1 + sentStart))
+                else:
+                    spans.append(None)
+        with self.timer.stage('tag'):
+            return self.get_untagged(tokens, spans)
+
+    def process_sentence(self, sentence0, sentStart, sentnumber):
+        """Tag and chunk the sentence starting at sentStart in the text. Return (tagged tokens, feature tuples), 
+        as tag_sentence() and extract_sentence_features() give them. Both only depend on the sentence text,
+        so they are kept in the sentence cache with spans relative to the sentence, and the boilerplate 
+        sentences repeated across reports are only tagged and chunked once."""
+        cache = self.sentence_cache
+        key = (sentence0, self.cascade)
+        cached = cache.get(key) if cache is not None else None
+        if cached is None:
+            tagged = self.tag_sentence(sentence0)
+            features = []
+            #only if the cleaned sentence is NOT empty we parse it
+            if tagged!=[]:
+                with self.timer.stage('chunk'):
+                    features = self.extract_sentence_features(tagged, 0)
+            if cache is not None:
+                cache.put(key, (tagged, features))
+        else:
+            (tagged, features) = cached
+        
+        ##: new tokens with the spans in the text, the same token for a leaf of a feature and of the sentence
+        shifted = {}
+        def shift(tokens):
+            result = []
+            for token in tokens:
+                new = shifted.get(id(token))
+                if new is None:
+                    span = getattr(token, 'span', None)
+                    if span:
+                        span = (span[0] + sentStart, span[1] + sentStart)
+                    new = util.TaggedToken(token[0], token[1], span)
+                    shifted[id(token)] = new
+                result.append(new)
+            return result
+        
+        return (shift(tagged), [(label, featString, sentnumber, shift(leaves)) for (label, featString, num, leaves) in features])
+    
+    def extract_sentence_features(self, sentence_to_parse, sentnumber, cascade = None):
+        """Chunk a tagged sentence and return its feature tuples (label, string, sentnumber, leaves). 
+        The features of 'grammar' are chunked twice: the second pass parses the leaves of the 
+        st_filter chunks found by the first pass, separated by commas."""
+        
+        if cascade is None:
+            cascade = self.cascade
+            
+        with self.timer.stage('chunk.first_pass'):
+            tree = self.cp.parse(sentence_to_parse)
+        with self.timer.stage('chunk.grammar1'):
+            tree1 = self.cp1.parse(sentence_to_parse)
+        
+        with self.timer.stage('chunk.second_pass_input'):
+            new_sentence_to_parse = None
+            if cascade:
+                new_sentence_to_parse = self.get_cascade_tokens(tree)
+            if new_sentence_to_parse is None:
+                new_sentence_to_parse = self.get_second_pass_tokens(tree)
+        
+        featurelist = []
+        with self.timer.stage('chunk.second_pass'):
+            if new_sentence_to_parse!=[]:
+                tree2 = self.cp.parse(new_sentence_to_parse)
+                for subtree in tree2.subtrees():
+                    if subtree.label() in self.st_filter:                            
+                        featString = self.massage_features(subtree)
+                        featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
+                    
+        for subtree in tree1.subtrees():
+            if subtree.label() in self.labels_gram1:
+                featString = self.massage_features(subtree)
+                featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
+                
+        return featurelist
+    
+    def get_second_pass_tokens(self, tree):
+        """Join the leaves of the st_filter chunks into a string, then tokenize and tag it again. 
+        The new tokens carry the spans of the leaves they come from."""
+        
+#         new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.node in self.st_filter])
+        new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.label() in self.st_filter])
+
+        #here we delete the dash and replace it with whitespace to convert post-vac to post vac
+        new_sentence_to_parse = new_sentence_to_parse.replace(', ,', ',')
+        #here we delete the dash and replace it with whitespace to convert post-vac to post vac
+        new_sentence_to_parse = new_sentence_to_parse.replace(',', ', ')
+
+        new_sentence_to_parse = nltk.word_tokenize(new_sentence_to_parse)
+
+        #run the above procedure
+        tagged = self.get_untagged(new_sentence_to_parse)
+        
+        leaves = [leaf for subtree in tree.subtrees() if subtree.label() in self.st_filter for leaf in subtree.leaves()]
+        return self.align_token_spans(tagged, leaves)
+    
+    def align_token_spans(self, tagged, leaves):
+        """Give each tagged token re-tokenized from the leaf words the span of the leaf it comes from, 
+        i.e., the next leaf whose word contains it."""
+        aligned = []
+        ileaf = 0
+        pos = 0
+        for (word, tag) in tagged:
+            span = None
+            if word!=',':
+                i = ileaf
+                loc = -1
+                while i < len(leaves):
+                    loc = leaves[i][0].find(word, pos if i==ileaf else 0)
+                    if loc >= 0:
+                        break
+                    i += 1
+                if loc >= 0:
+                    ileaf = i
+                    pos = loc + len(word)
+                    span = getattr(leaves[i], 'span', None)
+            aligned.append(util.TaggedToken(word, tag, span))
+        return aligned
+    
+    def is_cascade_word(self, word):
+        """Check if the word is tokenized back to itself in the second pass string: a single  
+        token, without commas or sentence-ending punctuation that would change with its neighbors."""
+        
+        safe = self.cascade_words.get(word)
+        if safe is None:
+            safe = word==',' or (not re.search('[,.?!]', word) and nltk.word_tokenize(word)==[word])
+            self.cascade_words[word] = safe
+        return safe
+    
+    def get_cascade_tokens(self, tree):
+        """Build the second pass input of get_second_pass_tokens() from the tagged leaves directly, 
+        without joining, tokenizing and tagging them again. The commas inserted between chunks, 
+        and merged by the string replacements, are reproduced on a skeleton of the string.
+        Return None if a leaf word might not be tokenized back to itself."""
+        
+        leavesList = [subtree.leaves() for subtree in tree.subtrees() if subtree.label() in self.st_filter]
+        words = []
+        skeleton = []
+        for leaves in leavesList:
+            for leaf in leaves:
+                if not self.is_cascade_word(leaf[0]):
+                    return None
+                if leaf[0]!=',':
+                    words.append(leaf)
+            skeleton.append(' '.join([',' if leaf[0]==',' else 'x' for leaf in leaves]) + ' ')
+        skeleton = ','.join(skeleton).replace(', ,', ',').replace(',', ', ')
+        
+        comma = self.get_untagged([','])
+        tokens = []
+        iword = 0
+        for tk in skeleton.split():
+            if tk==',':
+                tokens += comma
+            else:
+                tokens.append(words[iword])
+                iword += 1
+        return tokens
+    
     def extract_features_temporal(self, text,  expDateStr = None, onsetDateStr = None, refExpDateStr = None, textType='vaers'):
         """Main function to extract feature and temporal information. 
         Arguments:
@@ -802,79 +1205,70 @@ class FeatureExtractor:
         
         featurelist = []
         
-        sentences = util.sentence_tokenize(text)
+        t0 = time.time()
+        with self.timer.stage('sentence_split'):
+            tokenized = util.TokenizedDocument(text)
+        sentences = tokenized.sentences
         taggedSentences = []        
 #         id = 0
         for sentnumber, sentence0 in enumerate(sentences):
             
-            sentence = self.clean_text(sentence0)
-                        
-            # tokenize each sentence to have a list of words to be processed
-            tokens = nltk.word_tokenize(sentence)
-            #run the above procedure
-            sentence_to_parse = self.get_untagged(tokens)
+            # clean, tokenize, tag and chunk each sentence, with the spans of the words in the text
+            (sentence_to_parse, features) = self.process_sentence(sentence0, tokenized.sentence_startPos[sentnumber], sentnumber)
             
             # Save tagged sentences for later computing of expose date
             taggedSentences.append(sentence_to_parse)
-                
-            #only if the cleaned sentence is NOT empty we parse it
-            if sentence_to_parse!=[]:
-                tree = self.cp.parse(sentence_to_parse)
-                tree1 = self.cp1.parse(sentence_to_parse)
-                 
-#                 new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.node in self.st_filter])
-                new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.label() in self.st_filter])
-
-                #here we delete the dash and replace it with whitespace to convert post-vac to post vac
-                new_sentence_to_parse = new_sentence_to_parse.replace(', ,', ',')
-                #here we delete the dash and replace it with whitespace to convert post-vac to post vac
-                new_sentence_to_parse = new_sentence_to_parse.replace(',', ', ')
-
-                new_sentence_to_parse = nltk.word_tokenize(new_sentence_to_parse)
+            featurelist += features
 
-                #run the above procedure
-                new_sentence_to_parse = self.get_untagged(new_sentence_to_parse)
-                
-                if new_sentence_to_parse!=[]:
-                    tree2 = self.cp.parse(new_sentence_to_parse)
-                    for subtree in tree2.subtrees():
-                        if subtree.label() in self.st_filter:                            
-                            featString = self.massage_features(subtree)
-                            featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
-                            
-                for subtree in tree1.subtrees():
-                    if subtree.label() in self.labels_gram1:
-                        featString = self.massage_features(subtree)
-                        featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
-
-        self.initialization_text_data(text, sentences, taggedSentences, textType)
-        
-        featObjList = self.initialize_feature_obj_list(featurelist)
-        
-        docFeature = self.extract_temporal_info(featObjList, expDateStr, onsetDateStr, refExpDateStr)
+        tokenized.taggedSentences = taggedSentences
+        overSize = self.budget_chars and len(text) > self.budget_chars
+        if overSize:
+            doc = DocumentContext(tokenized, textType)
+        else:
+            with self.timer.stage('initialization_text_data'):
+                doc = self.initialization_text_data(tokenized, textType)
+        
+        with self.timer.stage('initialize_feature_obj_list'):
+            featObjList = self.initialize_feature_obj_list(doc, featurelist)
+        if overSize:
+            return self.extract_degraded(featObjList, expDateStr, onsetDateStr, refExpDateStr, 'size', t0)
+        
+        ##: the temporal stage changes the features and divides some, their copies are the result if it gives up
+        featureCopies = None
+        if self.budget_seconds:
+            doc.deadline = t0 + self.budget_seconds
+            featureCopies = [feat.copy() for feat in featObjList]
+        try:
+            with self.timer.stage('temporal'):
+                docFeature = self.extract_temporal_info(doc, featObjList, expDateStr, onsetDateStr, refExpDateStr)
+        except timexan.BudgetExceeded:
+            return self.extract_degraded(featureCopies, expDateStr, onsetDateStr, refExpDateStr, 'time', t0)
         
         return docFeature
     
-    def initialization_text_data(self, text, sentences, taggedSentences, rptType='vaers'):
-        """Initialize some gobal information for the text what will be used later."""
-        
-        self.text = text
-        self.sentences = sentences
-        self.reportType = rptType
-        
-        n = len(sentences)
-        locsSentStarts = [-1] * n
-        curpt = 0
-        for i in range(n):
-            pos = text[curpt:].find(sentences[i])
-            locsSentStarts[i] = pos + curpt
-            curpt = locsSentStarts[i] + len(sentences[i])
-        self.sentence_startPos = locsSentStarts
+    def extract_degraded(self, featObjList, expDateStr, onsetDateStr, refExpDateStr, reason, t0):
+        """Features-only result of a document over its budget: the features without time, no timexes, and the 
+        form dates as the exposure and onset dates. The DocumentFeature is flagged with the reason, 'size' or 'time', 
+        for a later full extraction. The overrun is counted, and timed from t0 as a 'budget_overrun' stage."""
+        with self.timer.stage('degraded'):
+            expDateInput = self.parse_time_string(expDateStr)
+            onsetDateInput = self.parse_time_string(onsetDateStr)
+            receiveDate = self.parse_time_string(refExpDateStr)
+            docFeature = DocumentFeature(featObjList, [], expDateInput, onsetDateInput, receiveDate, 0.8, expDateInput, onsetDateInput)
+            docFeature.setDegraded(reason)
+        
+        with self.budget_lock:
+            self.budget_overruns[reason] += 1
+        if self.timer.enabled:
+            self.timer.add('budget_overrun.' + reason, time.time() - t0)
+        return docFeature
+    
+    def initialization_text_data(self, tokenized, rptType='vaers'):
+        """Create the document context holding the global information for the tokenized text that will be used later."""
         
-        self.taggedSentences = taggedSentences
-        self.exposureDate = None
-        self.blockout_range = []
-        self.clauseZones = []
+        doc = DocumentContext(tokenized, rptType)
+        sentences = doc.sentences
+        taggedSentences = doc.taggedSentences
         
         sent_tags = []
         ##: 'IGNORE' tag breaks the timeline continuity, i.e., stops time impact zone; 
@@ -882,11 +1276,11 @@ class FeatureExtractor:
         for sentnumber, sentence in enumerate(sentences):
             tags = set([tg[1] for tg in taggedSentences[sentnumber]])
             
-            tokens0 = nltk.word_tokenize(sentence.lower())            
+            tokens0 = doc.tokenized.getLowerTokens(sentnumber)
             with_who_range = self.extract_standard_summary_pattern(tokens0, sentence)
             if with_who_range:
-                r = (with_who_range[0]+self.sentence_startPos[sentnumber], with_who_range[1]+self.sentence_startPos[sentnumber])
-                self.blockout_range.append(r)
+                r = (with_who_range[0]+doc.sentence_startPos[sentnumber], with_who_range[1]+doc.sentence_startPos[sentnumber])
+                doc.blockout_range.append(r)
                 
                 
             ##: Ignore dates in this sentence since it is about history or family
@@ -919,7 +1313,9 @@ class FeatureExtractor:
                 continue
             
             sent_tags.append('NORMAL')
-        self.sentence_tags = sent_tags
+        doc.sentence_tags = sent_tags
+        
+        return doc
     
 
     def extract_standard_summary_pattern(self, tokens, sentence):
@@ -950,7 +1346,7 @@ class FeatureExtractor:
         return (loc_with, loc_who)    
             
 
-    def initialize_feature_obj_list(self, featurelist):
+    def initialize_feature_obj_list(self, doc, featurelist):
         """ Convert feature tuples to feature object list:
             1. clean up ill-shaped feature
             2. create feature with Feature Type, String, SentNum, StartPos and EndPos 
@@ -964,56 +1360,55 @@ class FeatureExtractor:
                 featurelist.pop(i)
                 featurelist.insert(i, newf)
         
-        sentences = self.sentences
         featObjList = []
         for feature in featurelist:
             if feature[0]=='LOT': continue
             
             sentNum = feature[2]
-            sentence = sentences[sentNum]
-            sent_start = self.sentence_startPos[sentNum] #self.text.find(sentence)          
-            
-            ##: remove the duplicated substring of the same feature strings, and save the location in 'sub_start'
-            duplicates = [feat for feat in featObjList if feat.getSentNum()==sentNum and feat.getString()==feature[1]]
-            sub_start = 0
-            if duplicates:
-                sub_start = duplicates[-1].getEndPos() - sent_start
-                sentence = sentence[sub_start:]
-            
             dictTags = dict(feature[3])
             words = nltk.word_tokenize(feature[1])
             feat_tags = [(w, dictTags[w]) for w in words if dictTags[w] not in self.feature_exclusive_tags]
             featText = ' '.join([ft[0] for ft in feat_tags])
             featText = featText.replace(' ,', ',')
-                            
-            (start_char_feat, end_char_feat) = util.find_sub_text_range(sentence, featText)
-            start_char_feat += sent_start + sub_start
-            end_char_feat += sent_start + sub_start
+            
+            ##: the feature spans from its first to its last word, as carried by the leaves (util.TaggedToken) 
+            ##: matched to the words in order; it falls back to the whole sentence if the leaves carry no spans
+            spans = []
+            ileaf = 0
+            for (w, t) in feat_tags:
+                if w==',': continue
+                while ileaf < len(feature[3]) and feature[3][ileaf][0]!=w:
+                    ileaf += 1
+                if ileaf == len(feature[3]): break
+                span = getattr(feature[3][ileaf], 'span', None)
+                if span:
+                    spans.append(span)
+                ileaf += 1
+            if spans:
+                start_char_feat = min([s[0] for s in spans])
+                end_char_feat = max([s[1] for s in spans])
+            else:
+                start_char_feat = doc.sentence_startPos[sentNum]
+                end_char_feat = start_char_feat + len(doc.sentences[sentNum])
             
             featObjList.append(Feature((feature[0], featText, feature[2], feat_tags, start_char_feat, end_char_feat)))            
                     
         return featObjList
         
     def parse_time_string(self, time_string):        
-        if time_string == '':
-            return None
-     
-        try:
-            dt = parse(time_string)
-        except:
-            return None
-        
-        return dt
+        ##: the same parse, memoized in timexan
+        return timexan.parse_time_string(time_string)
     
-    def create_timex_impact_zone(self, timexList):
+    def create_timex_impact_zone(self, doc, timexList):
         """Create impact zones for timex list"""
         
         timexList = [t for t in timexList if t.getDateTime() and t.getRole()!='IGNORE']
         timeZones=[]
         for timex in timexList:
+            timexan.check_deadline(doc.deadline)
             dtime = timex.getDateTime()
             if dtime and timex.getRole()!='IGNORE': 
-                timeZone = self.get_timex_impact_zone(timex, timexList)
+                timeZone = self.get_timex_impact_zone(doc, timex, timexList)
                 if timeZone:
                     timeZones.append(timeZone)
     
@@ -1021,9 +1416,9 @@ class FeatureExtractor:
         
         ##: Take out skiped sentences (e.g., history sentence) from timexe impact zones. 
         ##: Skiped sentence is different from ignored sentence for not stop timeline continuity.
-        for i, sent in enumerate(self.sentences): 
-            if self.sentence_tags[i]!='SKIP': continue
-            sent_pos = self.sentence_startPos[i]
+        for i, sent in enumerate(doc.sentences): 
+            if doc.sentence_tags[i]!='SKIP': continue
+            sent_pos = doc.sentence_startPos[i]
             for j, r in enumerate(timeZones):
                 if r[0]<sent_pos and r[1]>sent_pos:
                     nr = (r[0], sent_pos, r[2])
@@ -1036,7 +1431,7 @@ class FeatureExtractor:
         
         return timeZones
         
-    def update_time_references_with_relative_timex(self, timex, timeReferences, timexList, featurelist):
+    def update_time_references_with_relative_timex(self, doc, timex, timeReferences, timexList, featurelist):
         """ Update the time impact zone for the input relative timex after it obtains datetime
             Find features associated with this timex and add them into time reference if not yet.
         """
@@ -1074,23 +1469,23 @@ class FeatureExtractor:
         if refs: ##: already in time references
             return timeReferences
             
-        tags = set([tg[1] for tg in self.taggedSentences[sentnum]])
+        tags = set([tg[1] for tg in doc.taggedSentences[sentnum]])
        
         intersect = tags.intersection(exposureSet)
         if intersect:
-            tgs = [tg for tg in self.sentence_full_tags[sentnum] if tg[1] in exposureSet]
+            tgs = [tg for tg in doc.sentence_full_tags[sentnum] if tg[1] in exposureSet]
             if tgs:
-                tgpos = self.sentence_startPos[sentnum] + tgs[0][2]
-                if not self.is_in_clause(tgpos, sentnum):
+                tgpos = doc.sentence_startPos[sentnum] + tgs[0][2]
+                if not self.is_in_clause(doc, tgpos, sentnum):
                     timeReferences[(tgs[0][1], timex.getString(), None, sentnum, timex.getStartPos(), timex.getEndPos(), 0.85)] = timex.getDateTime()
             
         return timeReferences
     
-    def update_timex_impact_zone_with_timex(self, timex, timeZones, timexList):
+    def update_timex_impact_zone_with_timex(self, doc, timex, timeZones, timexList):
         """Update the time impact zone for the input timex."""
         
         if not timeZones:
-            return self.create_timex_impact_zone([timex])
+            return self.create_timex_impact_zone(doc, [timex])
         
         ##: timex falls into one of existing zones
         tPos = timex.getStartPos()
@@ -1101,13 +1496,13 @@ class FeatureExtractor:
                 return timeZones
         
         ##: timex create a new impact zone
-        newZone = self.get_timex_impact_zone(timex, timexList)
+        newZone = self.get_timex_impact_zone(doc, timex, timexList)
         timeZones.append(newZone)
         ##: Take out skiped sentences (e.g., history sentence) from timexe impact zones. 
         ##: Skiped sentence is different from ignored sentence for not stop timeline continuity.
-        for i, sent in enumerate(self.sentences): 
-            if self.sentence_tags[i]!='SKIP': continue
-            sent_pos = self.sentence_startPos[i]
+        for i, sent in enumerate(doc.sentences): 
+            if doc.sentence_tags[i]!='SKIP': continue
+            sent_pos = doc.sentence_startPos[i]
             for j, r in enumerate(timeZones):
                 if r[0]<sent_pos and r[1]>sent_pos:
                     nr = (r[0], sent_pos, r[2], r[3])
@@ -1119,19 +1514,19 @@ class FeatureExtractor:
         timeZones.sort(key = lambda t:t[0])
         return timeZones
     
-    def create_sentence_full_tags(self, docFeatList, timexList):
+    def create_sentence_full_tags(self, doc, docFeatList, timexList):
         sentence_full_tags = []
-        for sentNum, sentence in enumerate(self.sentences):
+        for sentNum, sentence in enumerate(doc.sentences):
             timexStrings = [(t.getString(), t.getStartPos()) for t in timexList if t.getSentNum()==sentNum]
             
-            tags = self.retag_full_sentence(timexStrings, sentence,  self.taggedSentences[sentNum])
+            tags = self.retag_full_sentence(timexStrings, sentence,  doc.taggedSentences[sentNum])
             sentence_full_tags.append(tags)
                 
         return sentence_full_tags     
     
-    def estimate_onset_date(self, featureList):
-        if self.onsetDate:
-            return (self.onsetDate, 1)
+    def estimate_onset_date(self, doc, featureList):
+        if doc.onsetDate:
+            return (doc.onsetDate, 1)
         
         onsetDates = []
         for feature in featureList:
@@ -1141,36 +1536,36 @@ class FeatureExtractor:
                     onsetDates.append(dt)
         if onsetDates:
             onsetDate = min(onsetDates)
-            if self.exposureDate and onsetDate < self.exposureDate: 
-                onsetDate = self.exposureDate
+            if doc.exposureDate and onsetDate < doc.exposureDate: 
+                onsetDate = doc.exposureDate
                 return (onsetDate, 0.7)
             else:
                 return (onsetDate, 0.9)
         else:
             return (None, 0)
         
-    def estimate_exposure_date(self, timeReferences, timexList):
-        if self.exposureDate:
-            self.exposureDateConfidence = 1
-            return (self.exposureDate, 1)
+    def estimate_exposure_date(self, doc, timeReferences, timexList):
+        if doc.exposureDate:
+            doc.exposureDateConfidence = 1
+            return (doc.exposureDate, 1)
                 
         exposureSet = ['Vaccination', 'Injection']
-        refs = [ref for ref in self.timeReferences if ref[0] in exposureSet and ref[6]>0.6]        
+        refs = [ref for ref in doc.timeReferences if ref[0] in exposureSet and ref[6]>0.6]        
         if refs:
             maxConf = max([ref[6] for ref in refs])
             refs = [ref for ref in refs if ref[6]==maxConf]
             refs.sort(key=lambda r:r[4])
-            return (self.timeReferences[refs[0]], ref[6]) 
+            return (doc.timeReferences[refs[0]], ref[6]) 
         
-        if self.reportType == 'vaers':
+        if doc.reportType == 'vaers':
             exposureSet = set(['Vaccine']) 
         else: # =='faers'
             exposureSet = set(['Drug', 'Vaccine']) 
         exposureSet = set(['Drug', 'Vaccine']) 
-        refs = [ref for ref in self.timeReferences if ref[0] in exposureSet and ref[6]>0.6]    
+        refs = [ref for ref in doc.timeReferences if ref[0] in exposureSet and ref[6]>0.6]    
         if refs:
             refs.sort(key=lambda r:r[4])
-            return (self.timeReferences[refs[0]], refs[0][6]) 
+            return (doc.timeReferences[refs[0]], refs[0][6]) 
         
         ###: When no valid exposure date is available, use the first mentioned date
         for timex in timexList:
@@ -1179,24 +1574,24 @@ class FeatureExtractor:
         
         return (None, 0)
     
-    def update_time_references_with_impact_zones(self, docFeatList, timexList):      
+    def update_time_references_with_impact_zones(self, doc, docFeatList, timexList):      
         """Update time references after some features obtain their time from time impact zones
             The time refernce from time impact zone are less reliable. Set confidence = 0.6.
         """
         
-        if not self.timexImpactZones:
-            return self.timeReferences
+        if not doc.timexImpactZones:
+            return doc.timeReferences
         
-        impactZoneStart = self.timexImpactZones[0][0]
+        impactZoneStart = doc.timexImpactZones[0][0]
         features = [feat for feat in docFeatList if feat.getStartPos() > impactZoneStart 
-                    and self.sentence_tags[feat.getSentNum()]=='NORMAL' and not feat.inClause() 
+                    and doc.sentence_tags[feat.getSentNum()]=='NORMAL' and not feat.inClause() 
                     and feat.getType() in ['VACCINE', 'DRUG']]   
         for feature in features:
             sentnumber = feature.getSentNum()
             if not feature.getTlink() or not feature.getTlink().getDateTime():
-                if 'concomitant' in [tg[0] for tg in self.sentence_full_tags[sentnumber]]:
+                if 'concomitant' in [tg[0] for tg in doc.sentence_full_tags[sentnumber]]:
                     continue
-                feature = self.assign_feature_time_with_impact_zones(feature, self.timexImpactZones)
+                feature = self.assign_feature_time_with_impact_zones(feature, doc.timexImpactZones)
                 tlink = feature.getTlink()
                 if tlink:
                     if feature.getType()=='VACCINE':
@@ -1206,30 +1601,30 @@ class FeatureExtractor:
                         refType = 'Drug'
                         confidence = 0.6
                     
-                    self.timeReferences[(refType, feature.getString(), 0, sentnumber, 
+                    doc.timeReferences[(refType, feature.getString(), 0, sentnumber, 
                                          feature.getStartPos(), feature.getEndPos(), confidence)] = tlink.getDateTime()
         
         ##: Too many false alarms. Disable this part for now.
         ##: E.g, in 3603565(4th). .... Before treatment, .... 
 #         exposureSet = ['Vaccination', 'Injection']
-#         for sentnum, sentence in enumerate(self.sentences):
+#         for sentnum, sentence in enumerate(doc.sentences):
 #             timexes = [t for t in timexList if t.getDateTime() and t.getSentNum()==sentnum]
 #             if timexes: ##: has been processed for time references
 #                 continue
 #             
-#             tags = set([tg[1] for tg in self.taggedSentences[sentnum]])
+#             tags = set([tg[1] for tg in doc.taggedSentences[sentnum]])
 #             intersect = tags.intersection(exposureSet)
 #             if intersect:
-#                 tgs = [tg for tg in self.taggedSentences[sentnum] if tg[1] in exposureSet]
+#                 tgs = [tg for tg in doc.taggedSentences[sentnum] if tg[1] in exposureSet]
 #                 word = tgs[0][0]
-#                 sentStartPos = self.sentence_startPos[sentnum]
-#                 dtimes = [r[2] for r in self.timexImpactZones if sentStartPos >=r[0] and sentStartPos<=r[1]]
+#                 sentStartPos = doc.sentence_startPos[sentnum]
+#                 dtimes = [r[2] for r in doc.timexImpactZones if sentStartPos >=r[0] and sentStartPos<=r[1]]
 #                 if dtimes:
-#                     self.timeReferences[(tgs[0][1], word, None, sentnum, sentStartPos, sentStartPos, 0.6)] = dtimes[0]
+#                     doc.timeReferences[(tgs[0][1], word, None, sentnum, sentStartPos, sentStartPos, 0.6)] = dtimes[0]
 #         
-        return self.timeReferences
+        return doc.timeReferences
     
-    def create_time_references(self, docFeatList, timexList): 
+    def create_time_references(self, doc, docFeatList, timexList): 
         """Create time references based on timex list"""                    
         timeReferences = {}  
         
@@ -1239,16 +1634,16 @@ class FeatureExtractor:
         ##:            = 0.8: obtained from extracted vaccines
         ##:            = 0.7: obtained from extracted drugs
         ##:            = 0.6: date of drug or vaccine is obtained from time impact zone
-        if self.exposureDate: ##: input exposure date is available
-            self.exposureDateConfidence = 1 
-            timeReferences[('Vaccination', None, None, 0, None, None, confidence)] = self.exposureDate
-            timeReferences[('Injection', None, None, 0, None, None, confidence)] = self.exposureDate
-        if self.onsetDate:  ##: input onset date is available
-            self.onsetDateConfidence = 1
-            timeReferences[('Onset', None, None, 0, None, None, confidence)] = self.exposureDate
+        if doc.exposureDate: ##: input exposure date is available
+            doc.exposureDateConfidence = 1 
+            timeReferences[('Vaccination', None, None, 0, None, None, confidence)] = doc.exposureDate
+            timeReferences[('Injection', None, None, 0, None, None, confidence)] = doc.exposureDate
+        if doc.onsetDate:  ##: input onset date is available
+            doc.onsetDateConfidence = 1
+            timeReferences[('Onset', None, None, 0, None, None, confidence)] = doc.exposureDate
             
-        if self.receiveDate:
-            timeReferences[('Administration', None, None, None, None, None, 1)] = self.receiveDate
+        if doc.receiveDate:
+            timeReferences[('Administration', None, None, None, None, None, 1)] = doc.receiveDate
             
         coordFeatTypes = set(['VACCINE', 'DRUG']) 
         ##: add tags in features into coordinates
@@ -1272,12 +1667,12 @@ class FeatureExtractor:
             if tlink:
                 ##: Handle features with does number
                 counts = []
-                if 'DoseIndicator' in [tg[1] for tg in self.sentence_full_tags[sentnumber]]:
-                    counts = [tg[0] for tg in self.sentence_full_tags[sentnumber] if tg[1]=='Count']
+                if 'DoseIndicator' in [tg[1] for tg in doc.sentence_full_tags[sentnumber]]:
+                    counts = [tg[0] for tg in doc.sentence_full_tags[sentnumber] if tg[1]=='Count']
                     
                 timexes = [t for t in tlink.getTimexes() if t.getDateTime() and t.getRole()!='IGNORE']
                 
-                if self.get_drug_dose_number(feature) and len(counts) == len(timexes):
+                if self.get_drug_dose_number(doc, feature) and len(counts) == len(timexes):
                     for i, t in enumerate(timexes):
                         val = util.text2num.convertOrdinal(counts[i])
                         timeReferences[(coordType, feature.getString(), val, sentnumber, feature.getStartPos(), t.getStartPos(), confidence)] = t.getDateTime()
@@ -1287,16 +1682,16 @@ class FeatureExtractor:
                         
         exposureSet = ['Vaccination', 'Injection']
         anchorSet = ['Hospitalization', 'Administration']
-        for sentnum, sentence in enumerate(self.sentences):
-            tags = set([tg[1] for tg in self.taggedSentences[sentnum]])
+        for sentnum, sentence in enumerate(doc.sentences):
+            tags = set([tg[1] for tg in doc.taggedSentences[sentnum]])
             timexes = [t for t in timexList if t.getDateTime() and t.getSentNum()==sentnum and t.getRole()!='IGNORE']
             if timexes:
-                sent_start = self.sentence_startPos[sentnum]
+                sent_start = doc.sentence_startPos[sentnum]
                 intersect = tags.intersection(anchorSet)
                 for st in intersect:
-                    words = [tg[0] for tg in self.taggedSentences[sentnum] if tg[1]==st]
+                    words = [tg[0] for tg in doc.taggedSentences[sentnum] if tg[1]==st]
                     wordPos = [sentence.lower().find(word) for word in words]
-                    validWords = [pos for pos in wordPos if not self.is_in_clause(pos+sent_start, sentnum)]
+                    validWords = [pos for pos in wordPos if not self.is_in_clause(doc, pos+sent_start, sentnum)]
                     if not validWords:
                         continue                    
                     coord = (st, '', None, sentnum, None, None, 0.9)
@@ -1305,11 +1700,11 @@ class FeatureExtractor:
                                 
                 ref =[]
                 if tags.intersection(exposureSet):
-                    tgs = [tg for tg in self.taggedSentences[sentnum] if tg[1] in exposureSet]
+                    tgs = [tg for tg in doc.taggedSentences[sentnum] if tg[1] in exposureSet]
                     ref = tgs[0]
                     
                 if tags.intersection(['Treatment']):
-                    tokens = set([tg[0].lower() for tg in self.sentence_full_tags[sentnum]])
+                    tokens = set([tg[0].lower() for tg in doc.sentence_full_tags[sentnum]])
                     intst = tokens.intersection(['started', 'starts', 'begins', 'began'])
                     if intst:
                         ref = (list(intst)[0], 'Injection')    
@@ -1317,7 +1712,7 @@ class FeatureExtractor:
                 if ref:
                     word = ref[0].lower()
                     wpos = sentence.lower().find(word) + sent_start
-                    if self.is_in_clause(wpos, sentnum):
+                    if self.is_in_clause(doc, wpos, sentnum):
                         continue
                     leftTimexes = [t for t in timexes if t.getStartPos() <= wpos]
                     rightTimexes = [t for t in timexes if t.getStartPos() >= wpos]
@@ -1326,8 +1721,8 @@ class FeatureExtractor:
                     elif not rightTimexes:
                         dt = leftTimexes[-1].getDateTime()
                     else:
-                        leftSeg = self.text[leftTimexes[-1].getEndPos():wpos]
-                        rightSeg = self.text[wpos+len(word):rightTimexes[0].getStartPos()]
+                        leftSeg = doc.text[leftTimexes[-1].getEndPos():wpos]
+                        rightSeg = doc.text[wpos+len(word):rightTimexes[0].getStartPos()]
                 
                         if self.is_next_separated(leftSeg, rightSeg):
                             dt = leftTimexes[-1].getDateTime()
@@ -1337,7 +1732,7 @@ class FeatureExtractor:
             
         return timeReferences
     
-    def get_timex_impact_zone(self, timex, timexList):
+    def get_timex_impact_zone(self, doc, timex, timexList):
         """Get the impact zone for a given timex"""
         
         index = timexList.index(timex)
@@ -1353,23 +1748,23 @@ class FeatureExtractor:
             nextSentNum = nextTimex.getSentNum()
             nextTimexPos =  nextTimex.getStartPos()
         else: ##: timex is at the end of the list
-            nextSentNum = len(self.sentences)-1
-            nextTimexPos = len(self.text)
+            nextSentNum = len(doc.sentences)-1
+            nextTimexPos = len(doc.text)
             
         #nextTimex = timexList[index+1]
         k = timex.getSentNum()+1
         endPos = -1
         while k <= nextSentNum:
             ##: Ignored sentence breaks time continuity
-            if self.sentence_tags[k]=='IGNORE':
-                endPos = self.sentence_startPos[k] - 1
+            if doc.sentence_tags[k]=='IGNORE':
+                endPos = doc.sentence_startPos[k] - 1
                 break
                     
 #             ##: Unspecified/unknown date breaks time continuity, except this is a sentence for concomitant, which usually should not stop continuity.  
-#             tokens = set([tag[0].lower() for tag in self.sentence_full_tags[k]])
+#             tokens = set([tag[0].lower() for tag in doc.sentence_full_tags[k]])
 #             if tokens.intersection(['unknown', 'unspecified']) and tokens.intersection(['date', 'dates']) and not tokens.intersection(['concomitant']):
-#                 #endPos = self.sentences[k].find(' date')
-#                 endPos = self.sentence_startPos[k] - 1
+#                 #endPos = doc.sentences[k].find(' date')
+#                 endPos = doc.sentence_startPos[k] - 1
 #                 break
             
             k += 1
@@ -1381,7 +1776,7 @@ class FeatureExtractor:
     
         
          
-    def get_initial_exposure_date(self, timexList, expDateInput, onsetDateInput, strRefExpDate):
+    def get_initial_exposure_date(self, doc, timexList, expDateInput, onsetDateInput, strRefExpDate):
          
         ###: Use the input exposure date if available
         if expDateInput:
@@ -1392,18 +1787,18 @@ class FeatureExtractor:
         
         ###: To estimate the exposure date if not provided
         cleanTimexList = []
-        if self.reportType == 'vaers':
+        if doc.reportType == 'vaers':
             exposureTagSet = set(['Vaccine', 'Vaccination', 'Injection']) 
         else: # =='faers'
             exposureTagSet = set(['Drug', 'Injection']) 
          
         if not expDate:
             expDates = []
-            for sentnumber, sentence in enumerate(self.sentences):                
-                if self.sentence_tags[sentnumber]=='IGNORE':
+            for sentnumber, sentence in enumerate(doc.sentences):                
+                if doc.sentence_tags[sentnumber]=='IGNORE':
                     continue
                      
-                tags = set([tg[1] for tg in self.taggedSentences[sentnumber]])
+                tags = set([tg[1] for tg in doc.taggedSentences[sentnumber]])
                  
                 timexes = [t for t in timexList if t.getSentNum()==sentnumber]
                 cleanTimexList += timexes
@@ -1563,19 +1958,19 @@ class FeatureExtractor:
          
         return (expDate, onsetDate, 'Extracted')
      
-    def preprocess_timex_list(self, timexList, featurelist):
+    def preprocess_timex_list(self, doc, timexList, featurelist):
         """preprocessing on timex list. Cleaning up list by set undesired timex role as 'ignore', 
         such as in a sentence containing 'follow-up', and remove scales like '6/12' for measuring
         "visual acuity" or 'pain'"""
                         
-        for sentNum, sentence in enumerate(self.sentences):
+        for sentNum, sentence in enumerate(doc.sentences):
             
             sentence = sentence.lower()
-            tokens = set(nltk.word_tokenize(sentence))
+            tokens = set(doc.tokenized.getLowerTokens(sentNum))
             intersect_info = tokens.intersection(['report', 'case', 'information', 'summary', 'records', 'info', 'evaluation', 'mr', 'f/u']) 
             if intersect_info and tokens.intersection(['received', 'obtained']):
                 sent_has_received_info = True
-                self.sentence_tags[sentNum] = 'IGNORE'
+                doc.sentence_tags[sentNum] = 'IGNORE'
             else:
                 sent_has_received_info = False                
             
@@ -1590,11 +1985,11 @@ class FeatureExtractor:
                     else:
                         end_pos = len(sentence)
                                         
-                    ts = [t for t in timexes if t.getStartPos() < end_pos+self.sentence_startPos[sentNum]]
+                    ts = [t for t in timexes if t.getStartPos() < end_pos+doc.sentence_startPos[sentNum]]
                     
                     if len(ts) > 1 and ts[0].getStartPos()!=ts[1].getStartPos():
                         ##: e.g., follow-up is received on 1/2/2014 and 2/3/2014
-                        if self.text[ts[0].getStartPos():ts[1].getStartPos()].split()[0]=='and': 
+                        if doc.text[ts[0].getStartPos():ts[1].getStartPos()].split()[0]=='and': 
                             ts[1].setRole('IGNORE')
                         
                     if ts:
@@ -1604,7 +1999,7 @@ class FeatureExtractor:
                     ##: If there is no features in this sentence, the dates in this senntence are most likely the date of receiving report
                     poses = [sentence.find(w) + 2 for w in intersect_info] ##: add 2 to pass the ':' in the case of "case:"  
                     init_pos = min(poses)
-                    sent_start = self.sentence_startPos[sentNum]
+                    sent_start = doc.sentence_startPos[sentNum]
                     match_pos = [m.start() for m in re.finditer(',|;|:|who|that|concerning|regarding', sentence[init_pos:])]
                     if match_pos:
                         end_pos = match_pos[0] + sent_start + init_pos
@@ -1613,18 +2008,18 @@ class FeatureExtractor:
                     tms = [t for t in timexes if t.getStartPos()<end_pos]
                     if tms:
                         tms[0].setRole('IGNORE')
-                        if not self.receiveDate:
-                            self.receiveDate = tms[0].getDateTime()
+                        if not doc.receiveDate:
+                            doc.receiveDate = tms[0].getDateTime()
                             
                         if len(tms) > 1:
                             ##: e.g., follow-up is received on 1/2/2014 and 2/3/2014
-                            mid = self.text[tms[0].getStartPos():tms[1].getStartPos()].split()
+                            mid = doc.text[tms[0].getStartPos():tms[1].getStartPos()].split()
                             if mid and mid[0]=='and': 
                                 tms[1].setRole('IGNORE')
                     
                     ##: Ignore dates following "received/obtained on", e.g., "report was recieved on 2/3/2014"
                     ##: This is for FAERS only. For VAERS, it is very likely to have something like "VAX was received on 2/3/2014"
-                    if self.reportType=='faers':
+                    if doc.reportType=='faers':
                         for t in timexes:
                             ll = len('received on')+2
                             tPos = t.getStartPos()-sent_start
@@ -1635,8 +2030,8 @@ class FeatureExtractor:
                                 
                 itset = tokens.intersection(['acuity', 'pain', 'ache', 'tsp', 'inch', 'strength', 'intensity', 'scale', 'score', 'scores', 'erection'])
                 if itset:
-                    itemLocs = [i for i, tg in enumerate(self.sentence_full_tags[sentNum]) if tg[0].lower() in itset]
-                    words = [tg[0].lower() for tg in self.sentence_full_tags[sentNum]]
+                    itemLocs = [i for i, tg in enumerate(doc.sentence_full_tags[sentNum]) if tg[0].lower() in itset]
+                    words = [tg[0].lower() for tg in doc.sentence_full_tags[sentNum]]
                     for t in timexes:
                         if t.getString().lower() in words:
                             tpos = words.index(t.getString().lower())
@@ -1651,15 +2046,15 @@ class FeatureExtractor:
                         if hasDeleted:
                             continue                                
                 
-                tgs = set([tg[1] for tg in self.taggedSentences[sentNum]])      
+                tgs = set([tg[1] for tg in doc.taggedSentences[sentNum]])      
                 if tgs.intersection(['Expiration', 'DOB', 'Death']):    
                     if 'Death' in tgs: ##: Special handling because 'expired' is tagged as 'Death' in the lexicon
-                        tgsfull = [tg[1] for tg in self.sentence_full_tags[sentNum]]
+                        tgsfull = [tg[1] for tg in doc.sentence_full_tags[sentNum]]
                         if 'Death' in tgsfull:
                             deathLoc = tgsfull.index('Death')
                         else:
                             continue
-                        if self.sentence_full_tags[sentNum][deathLoc][0]=='expired':
+                        if doc.sentence_full_tags[sentNum][deathLoc][0]=='expired':
                             drugDist = [abs(i-deathLoc) for (i, tg) in enumerate(tgsfull) if tg=='Vaccine' or tg=='Drug']
                             if not drugDist or min(drugDist)>3:
                                 continue
@@ -1667,7 +2062,7 @@ class FeatureExtractor:
                     match_pos = [m.start() for m in re.finditer('exp|DOB', sentence)]
                     if match_pos:
                         for pos in match_pos:
-                            expPos = self.sentence_startPos[sentNum] + pos
+                            expPos = doc.sentence_startPos[sentNum] + pos
                             tms = [t for t in timexes if t.getStartPos()>expPos and t.getStartPos()-expPos<25] ##: exp{iration date is reported in }June 2001
                             for t in tms:
                                 t.setRole('IGNORE')
@@ -1675,48 +2070,64 @@ class FeatureExtractor:
         return timexList
     
 
-    def extract_temporal_info(self, featurelist, strExpDate, strOnsetDate, strReceiveDate):
+    def extract_temporal_info(self, doc, featurelist, strExpDate, strOnsetDate, strReceiveDate):
         """Main function to extract temporal information. 
         Arguments:
             featurelist -- list of extracted features
             strExpDate -- exposure date in string format
             strOnsetDate -- onset date in string format
             strReceiveDate -- date when the report is received in string format
+        timexan.BudgetExceeded is raised once doc.deadline is past.
             """
             
-        expDateInput = self.parse_time_string(strExpDate)
-        onsetDateInput = self.parse_time_string(strOnsetDate)  
-        receiveDate = self.parse_time_string(strReceiveDate)  
+        timer = self.timer
+        with timer.stage('temporal.parse_input_dates'):
+            expDateInput = self.parse_time_string(strExpDate)
+            onsetDateInput = self.parse_time_string(strOnsetDate)  
+            receiveDate = self.parse_time_string(strReceiveDate)  
         
-        self.exposureDate = expDateInput
-        self.onsetDate = onsetDateInput
-        self.receiveDate = receiveDate
-        self.exposureDateConfidence = 0
-        self.onsetDateConfidence = 0
+        doc.exposureDate = expDateInput
+        doc.onsetDate = onsetDateInput
+        doc.receiveDate = receiveDate
+        doc.exposureDateConfidence = 0
+        doc.onsetDateConfidence = 0
         
         ##: Obtain timex list
-        timexList = timexan.annotateTimexes(self.text, expDateInput)        
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.annotate_timexes'):
+            timexList = timexan.annotateTimexes(doc.text, expDateInput, doc.tokenized, doc.deadline)        
         
-        self.sentence_full_tags = self.create_sentence_full_tags(featurelist, timexList)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.sentence_full_tags'):
+            doc.sentence_full_tags = self.create_sentence_full_tags(doc, featurelist, timexList)
         
-        timexList = self.preprocess_timex_list(timexList, featurelist)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.preprocess_timex_list'):
+            timexList = self.preprocess_timex_list(doc, timexList, featurelist)
                       
         ###: divide features that contain multiple timexes
-        featurelist = self.divide_feature_containing_multiple_timexes(featurelist, timexList)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.divide_features'):
+            featurelist = self.divide_feature_containing_multiple_timexes(doc, featurelist, timexList)
         
-        featurelist = self.create_feature_timex_association(featurelist, timexList)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.feature_timex_association'):
+            featurelist = self.create_feature_timex_association(doc, featurelist, timexList)
         
-        timexList = self.construct_timeline(timexList, featurelist)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.timeline'):
+            timexList = self.construct_timeline(doc, timexList, featurelist)
         
 #         (expDate, onsetDate, state) = self.calculate_exposure_onset_dates(
 #                                 timexList, featurelist, sentences, taggedSentences, expDateInput, onsetDateInput, expDate)
         
-        featurelist = self.process_feature_durations(featurelist)
-        
-        featurelist = self.postprocess_features(featurelist)
+        timexan.check_deadline(doc.deadline)
+        with timer.stage('temporal.postprocess_features'):
+            featurelist = self.process_feature_durations(featurelist)
+            featurelist = self.postprocess_features(doc, featurelist)
         
-        if self.exposureDateConfidence==1:
-            if self.onsetDateConfidence==1:
+        if doc.exposureDateConfidence==1:
+            if doc.onsetDateConfidence==1:
                 datesConfidence = 1
             else:
                 datesConfidence = 0.9
@@ -1724,17 +2135,17 @@ class FeatureExtractor:
             datesConfidence = 0.8
             
         ##: Create DocumentFeature object for return
-        docFeature = DocumentFeature(featurelist, timexList, self.exposureDate, self.onsetDate, self.receiveDate, datesConfidence, expDateInput, onsetDateInput)     
+        docFeature = DocumentFeature(featurelist, timexList, doc.exposureDate, doc.onsetDate, doc.receiveDate, datesConfidence, expDateInput, onsetDateInput)     
             
         return docFeature
     
-    def postprocess_features(self, featurelist):
+    def postprocess_features(self, doc, featurelist):
         """Clean out features for special scenarios. """
         
         ##: To overwrite the time of features that are in a clause
         for feature in featurelist:
-            if feature.inClause() or self.is_in_clause(feature.getStartPos(), feature.getSentNum()):
-                feature = self.assign_feature_time_with_references(feature, self.timeReferences, feature.getStartPos(), True)
+            if feature.inClause() or self.is_in_clause(doc, feature.getStartPos(), feature.getSentNum()):
+                feature = self.assign_feature_time_with_references(doc, feature, doc.timeReferences, feature.getStartPos(), True)
                         
         ##: To set time of features after death to none. Currently disabled.
 #         deathDates = []
@@ -1759,7 +2170,7 @@ class FeatureExtractor:
         for feature in featurelist:
             posStart = feature.getStartPos()
             posEnd = feature.getEndPos()
-            for r in self.blockout_range:
+            for r in doc.blockout_range:
                 if (posStart>r[0] and posStart<r[1]) or (posEnd>r[0] and posEnd<r[1]):
                     timex = feature.getTimex()
                     if timex:
@@ -1771,19 +2182,19 @@ class FeatureExtractor:
             
         return featurelist
     
-    def get_drug_dose_number(self, feature):
+    def get_drug_dose_number(self, doc, feature):
         """Extract drug dose number."""
         
         if not feature.getType() in ['DRUG', 'VACCINE']:
             return None
         
         sentNum = feature.getSentNum()
-        fulltags = self.sentence_full_tags[sentNum]
+        fulltags = doc.sentence_full_tags[sentNum]
         tags = [tg[1] for tg in fulltags]
         if not 'DoseIndicator' in tags:
             return None
         
-        sentStartPos = self.sentence_startPos[sentNum]
+        sentStartPos = doc.sentence_startPos[sentNum]
         featStartPos = feature.getStartPos()
         posFeat = 0
         for i, tg in enumerate(fulltags):
@@ -1801,21 +2212,21 @@ class FeatureExtractor:
         
         return None
                                 
-    def assign_feature_time_with_references(self, feature, timeReferences, searchEnd = -1, earlierDateOnly = False):    
+    def assign_feature_time_with_references(self, doc, feature, timeReferences, searchEnd = -1, earlierDateOnly = False):    
         """Assign feature time with the time reference. This is called when feature has not been assigned a time earlier."""    
         
         if searchEnd < 0:
-            searchEnd = len(self.text)
+            searchEnd = len(doc.text)
             
         ftime = None
         tags = [tg for tg in feature.getTags() if tg[1] in ['Drug', 'Vaccine']]
         
-        doseNum = self.get_drug_dose_number(feature)
+        doseNum = self.get_drug_dose_number(doc, feature)
         if doseNum:
-            refs = [(ref[5], self.timeReferences[ref]) for tg in tags for ref in self.timeReferences 
+            refs = [(ref[5], doc.timeReferences[ref]) for tg in tags for ref in doc.timeReferences 
                     if ref[0]==tg[1] and tg[0] in ref[1] and ref[2]==doseNum and ref[6]>0.6 and ref[5] < searchEnd]        
         else:
-            refs = [(ref[5], self.timeReferences[ref]) for tg in tags for ref in self.timeReferences 
+            refs = [(ref[5], doc.timeReferences[ref]) for tg in tags for ref in doc.timeReferences 
                     if ref[0]==tg[1] and tg[0] in ref[1] and ref[6]>0.6 and ref[5] < searchEnd]     
         
         if refs:
@@ -1825,10 +2236,10 @@ class FeatureExtractor:
         featType = feature.getType()    
         if not ftime:
             ##: For VAERS report, drug is used only after a symptom appears, so assign onset to it instead of exposure
-            if featType in ['SYMPTOM', "DIAGNOSIS","SECOND_LEVEL_DIAGNOSIS", "RULE_OUT", 'DRUG'] and self.onsetDateConfidence==1 and self.reportType=='vaers':
-                ftime = self.onsetDate
-            elif self.exposureDate and self.exposureDateConfidence==1 and self.reportType=='vaers':
-                ftime = self.exposureDate
+            if featType in ['SYMPTOM', "DIAGNOSIS","SECOND_LEVEL_DIAGNOSIS", "RULE_OUT", 'DRUG'] and doc.onsetDateConfidence==1 and doc.reportType=='vaers':
+                ftime = doc.onsetDate
+            elif doc.exposureDate and doc.exposureDateConfidence==1 and doc.reportType=='vaers':
+                ftime = doc.exposureDate
             
         if ftime:
             if not (earlierDateOnly and feature.getDateTime() and ftime>feature.getDateTime()):  
@@ -1849,7 +2260,7 @@ class FeatureExtractor:
             
         return feature
     
-    def evaluate_all_relative_timexes(self, timexList, docFeatList):
+    def evaluate_all_relative_timexes(self, doc, timexList, docFeatList):
         """Evaluate all relative timexes. """
         
         for timex in timexList:
@@ -1857,16 +2268,16 @@ class FeatureExtractor:
             if timex.getType()!='REL' or timex.getRole()=='IGNORE': continue
             
             ###: evaluate timexes in formats of weekday (e.g. "Monday"), day # (e.g., "day 3", "day three") 
-            time_day_count = self.evaluate_timex_in_day_count(timex, timexList)
+            time_day_count = self.evaluate_timex_in_day_count(doc, timex, timexList)
             if time_day_count:
                 timex.setDateTime(time_day_count)
-                self.timexImpactZones = self.update_timex_impact_zone_with_timex(timex, self.timexImpactZones, timexList)
+                doc.timexImpactZones = self.update_timex_impact_zone_with_timex(doc, timex, doc.timexImpactZones, timexList)
                 continue
             
             sentNum = timex.getSentNum()
 
             tags = []
-            full_tags = self.sentence_full_tags[sentNum]
+            full_tags = doc.sentence_full_tags[sentNum]
             posTimex = []
             for i, tg in enumerate(full_tags):
                 ##: Label other timexes as 'unimportant' for this timex to avoid mistakes
@@ -1888,16 +2299,16 @@ class FeatureExtractor:
                 tpos = posTimex[0]
                 signal = [tg[0] for tg in tags[max(0,tpos-1):] if tg[1]=='TimexSignal']
                 if signal and signal[0] in self.clause_signals:
-                    sentence = self.sentences[sentNum]
+                    sentence = doc.sentences[sentNum]
                     clause_start =  full_tags[tpos][2] + len(full_tags[tpos][0])
                     clause_end = len(sentence)
                     endPos = sentence[clause_start:clause_end].find(',')
                     if endPos >= 0:
                         clause_end = endPos + clause_start
-                    self.clauseZones.append((self.sentence_startPos[sentNum] + clause_start, 
-                                             self.sentence_startPos[sentNum] + clause_end, sentNum))
+                    doc.clauseZones.append((doc.sentence_startPos[sentNum] + clause_start, 
+                                             doc.sentence_startPos[sentNum] + clause_end, sentNum))
             
-            ref_time = self.find_relative_time_reference(search_direction, tags, timex, posTimex[0])
+            ref_time = self.find_relative_time_reference(doc, search_direction, tags, timex, posTimex[0])
             if not ref_time: 
                 continue
             
@@ -1905,17 +2316,17 @@ class FeatureExtractor:
             
             timex.setDateTime(newtime)
             
-            self.timexImpactZones = self.update_timex_impact_zone_with_timex(timex, self.timexImpactZones, timexList)
+            doc.timexImpactZones = self.update_timex_impact_zone_with_timex(doc, timex, doc.timexImpactZones, timexList)
         
         for timex in timexList:
             ##: Only process relative timex
             if timex.getType()!='REL' or timex.getRole()=='IGNORE' or not timex.getDateTime(): continue
             
-            self.timeReferences = self.update_time_references_with_relative_timex(timex, self.timeReferences, timexList, docFeatList)
+            doc.timeReferences = self.update_time_references_with_relative_timex(doc, timex, doc.timeReferences, timexList, docFeatList)
             
         return timexList
     
-    def evaluate_timex_in_day_count(self, timex, timexList):
+    def evaluate_timex_in_day_count(self, doc, timex, timexList):
         """evaluate timexes such as "day 3", "day three", and "Monday" """
         
         timexString = timex.getString().lower()
@@ -1931,7 +2342,7 @@ class FeatureExtractor:
 #         anchorTags = ['Vaccination', 'Injection', 'Hospitalization']
         anchorTags = ['Vaccination', 'Hospitalization']
         sentNum = timex.getSentNum()
-        tags = self.sentence_full_tags[sentNum]
+        tags = doc.sentence_full_tags[sentNum]
         afterTimex = False
         dist_after = 0
         ref_time = None
@@ -1943,7 +2354,7 @@ class FeatureExtractor:
                 
             if not afterTimex: ##: Before this timex appears
                 if tg[1] in anchorTags:
-                    ref_time = self.find_time_reference_with_tag(tg[1], tg[0], sentNum)
+                    ref_time = self.find_time_reference_with_tag(doc, tg[1], tg[0], sentNum)
                 elif tg[1]=='Timex':
                     ts = [t for t in timexList if t.getSentNum()==sentNum and t.getType()=='DATE' and t.getString()==tg[0]]
 #                     ts = [t for t in timexList if t.getSentNum()==sentNum and t.getDateTime() and t.getString()==tg[0]]
@@ -1953,19 +2364,19 @@ class FeatureExtractor:
                 if tg[0] in [',', ';'] or dist_after > 10:
                     break
                 if tg[1] in anchorTags:
-                    ref_time = self.find_time_reference_with_tag(tg[1], tg[0], sentNum)
+                    ref_time = self.find_time_reference_with_tag(doc, tg[1], tg[0], sentNum)
                     break
                 
         sentIndices = range(sentNum)
         sentIndices.reverse()
         for sentid in sentIndices:
-            tags = self.sentence_full_tags[sentid]
+            tags = doc.sentence_full_tags[sentid]
             tids = range(len(tags))
             tids.reverse() 
             for tid in tids:
                 tg = tags[tid]
                 if tg[1] in anchorTags:
-                    ref_time = self.find_time_reference_with_tag(tg[1], tg[0], sentNum)
+                    ref_time = self.find_time_reference_with_tag(doc, tg[1], tg[0], sentNum)
                 elif tg[1]=='Timex':
                     ts = [t for t in timexList if t.getSentNum()==sentid and t.getType()=='DATE' and t.getString()==tg[0]]
 #                     ts = [t for t in timexList if t.getSentNum()==sentid and t.getDateTime() and t.getString()==tg[0]]
@@ -1977,10 +2388,10 @@ class FeatureExtractor:
                 break
         
         if not ref_time:
-            if self.exposureDate:
-                ref_time = self.exposureDate
-            elif self.onsetDate:
-                ref_time = self.onsetDate
+            if doc.exposureDate:
+                ref_time = doc.exposureDate
+            elif doc.onsetDate:
+                ref_time = doc.onsetDate
         
         if not ref_time:
             return None
@@ -2008,66 +2419,66 @@ class FeatureExtractor:
         return newtime
                 
     
-    def construct_timeline(self, timexList, docFeatList):
+    def construct_timeline(self, doc, timexList, docFeatList):
         """A main function to construct time line"""
         if not docFeatList:
             return timexList     
        
             
-        self.timeReferences = self.create_time_references(docFeatList, timexList)
+        doc.timeReferences = self.create_time_references(doc, docFeatList, timexList)
         
-        self.timexImpactZones = self.create_timex_impact_zone(timexList)
+        doc.timexImpactZones = self.create_timex_impact_zone(doc, timexList)
         
-        timexList = self.evaluate_all_relative_timexes(timexList, docFeatList)
+        timexList = self.evaluate_all_relative_timexes(doc, timexList, docFeatList)
         
-#         (expDate, expConf) = self.estimate_exposure_date(self.timeReferences, timexList)
+#         (expDate, expConf) = self.estimate_exposure_date(doc, doc.timeReferences, timexList)
         ##: expDate is obtained based on the first time. 
         ##: Update time reference and re-estimate exposure time
         
         
         ##: Update time references after some features obtain their time from time impact zones
-        self.timeReferences = self.update_time_references_with_impact_zones(docFeatList, timexList)
+        doc.timeReferences = self.update_time_references_with_impact_zones(doc, docFeatList, timexList)
         
-        (expDate, expConf) = self.estimate_exposure_date(self.timeReferences, timexList)
+        (expDate, expConf) = self.estimate_exposure_date(doc, doc.timeReferences, timexList)
         
         if expDate:
-            self.exposureDate = expDate
-            self.exposureDateConfidence = expConf 
-            self.timeReferences[('Vaccination', None, None, None, None, None, expConf)] = self.exposureDate
-            self.timeReferences[('Injection', None, None, None, None, None, expConf)] = self.exposureDate
+            doc.exposureDate = expDate
+            doc.exposureDateConfidence = expConf 
+            doc.timeReferences[('Vaccination', None, None, None, None, None, expConf)] = doc.exposureDate
+            doc.timeReferences[('Injection', None, None, None, None, None, expConf)] = doc.exposureDate
             
-        (onsetDate, onsetConf) = self.estimate_onset_date(docFeatList)
+        (onsetDate, onsetConf) = self.estimate_onset_date(doc, docFeatList)
         if onsetDate:
-            self.onsetDate = onsetDate
-            self.onsetDateConfidence = onsetConf 
+            doc.onsetDate = onsetDate
+            doc.onsetDateConfidence = onsetConf 
             
         ##: Final scan for all features without assigned date time        
         for feat in docFeatList:
-            if self.sentence_tags[feat.getSentNum()]!='NORMAL': continue
+            if doc.sentence_tags[feat.getSentNum()]!='NORMAL': continue
             if not feat.getTlink() or not feat.getTlink().getDateTime():
                 ##: feautures in clause should not be assigned a time. They should have been given a time somewhere else
                 if feat.inClause():
-                    feat = self.assign_feature_time_with_references(feat, self.timeReferences, feat.getStartPos())
+                    feat = self.assign_feature_time_with_references(doc, feat, doc.timeReferences, feat.getStartPos())
                     ##: TLink could still be None if no reference is found. Then use the time from time impact zones
                     if feat.getTlink():
                         continue
                 
-                if feat.getType()=='DRUG' and 'concomitant' in [tg[0] for tg in self.sentence_full_tags[feat.getSentNum()]]:
-                    feat = self.assign_time_to_concomitant_drug(feat, docFeatList)
+                if feat.getType()=='DRUG' and 'concomitant' in [tg[0] for tg in doc.sentence_full_tags[feat.getSentNum()]]:
+                    feat = self.assign_time_to_concomitant_drug(doc, feat, docFeatList)
                     if feat.getTlink():
                         continue
                 
-                if not self.timexImpactZones or feat.getStartPos() < self.timexImpactZones[0][0]: ##: feature locates before any time zones
+                if not doc.timexImpactZones or feat.getStartPos() < doc.timexImpactZones[0][0]: ##: feature locates before any time zones
                     ##: Assignment on features in the begining for VAERS
-                    if self.reportType == 'vaers': 
-                        feat = self.assign_feature_time_with_references(feat, self.timeReferences)                        
+                    if doc.reportType == 'vaers': 
+                        feat = self.assign_feature_time_with_references(doc, feat, doc.timeReferences)                        
                     continue
         
-                feat = self.assign_feature_time_with_impact_zones(feat, self.timexImpactZones)
+                feat = self.assign_feature_time_with_impact_zones(feat, doc.timexImpactZones)
             
         return timexList
         
-    def assign_time_to_concomitant_drug(self, feature, featurelist):
+    def assign_time_to_concomitant_drug(self, doc, feature, featurelist):
         """Assigne time to concomitant drugs."""
         
         index = featurelist.index(feature)-1
@@ -2078,13 +2489,13 @@ class FeatureExtractor:
             else:
                 index = index - 1
         
-        if self.exposureDate:
-            feature.setDateTime(self.exposureDate)
+        if doc.exposureDate:
+            feature.setDateTime(doc.exposureDate)
             
         return feature
         
 
-    def flag_features_in_associate_clause(self, docFeatList):
+    def flag_features_in_associate_clause(self, doc, docFeatList):
         """flag features in a clause of assiciate tlink.  
            E.g, On 03 July 2012, 10 days after Priorix, child reveloped rash on face,..."""
         for feat in docFeatList:
@@ -2093,8 +2504,8 @@ class FeatureExtractor:
                 continue
             
             sentNum = feat.getSentNum()
-            sentence = self.sentences[sentNum]
-            sent_start = self.sentence_startPos[sentNum]
+            sentence = doc.sentences[sentNum]
+            sent_start = doc.sentence_startPos[sentNum]
             startClause = tlink.getTimexes()[1].getStartPos()
             endPos = sentence[startClause - sent_start:].find(',')
             if endPos < 0: #: No comma is found, skip to be safe
@@ -2103,8 +2514,8 @@ class FeatureExtractor:
                 endClause = startClause + endPos
             
             zone = (startClause, endClause, sentNum)
-            if not zone in self.clauseZones:
-                self.clauseZones.append(zone)
+            if not zone in doc.clauseZones:
+                doc.clauseZones.append(zone)
             
             if feat.getStartPos() > startClause and feat.getStartPos() < endClause:
                 feat.setInClause(True)
@@ -2144,10 +2555,10 @@ class FeatureExtractor:
         return docFeatList
     
         
-    def find_time_reference_with_tag(self, tag, word, sentNum, doseNum=0):  
+    def find_time_reference_with_tag(self, doc, tag, word, sentNum, doseNum=0):  
         """Find the time reference with give tag."""
         
-        timeReferences = self.timeReferences
+        timeReferences = doc.timeReferences
         if tag=='Drug' or tag=='Vaccine':
             refs = []
             refDoses = []
@@ -2200,19 +2611,19 @@ class FeatureExtractor:
         
         return None
     
-    def is_in_clause(self, loc, sentNum):
-        zones = [r for r in self.clauseZones if r[2]==sentNum]
+    def is_in_clause(self, doc, loc, sentNum):
+        zones = [r for r in doc.clauseZones if r[2]==sentNum]
         for r in zones:
             if loc>=r[0] and loc<=r[1]:
                 return True
             
         return False
     
-    def find_relative_time_reference(self, search_direction, tags, timex, timesIndex):
+    def find_relative_time_reference(self, doc, search_direction, tags, timex, timesIndex):
         """Find the time reference for the input timex"""
                 
         if search_direction == 'Backward':
-            ts = [r[2] for r in self.timexImpactZones if r[0]<=timex.getStartPos() and r[1]>=timex.getEndPos()]
+            ts = [r[2] for r in doc.timexImpactZones if r[0]<=timex.getStartPos() and r[1]>=timex.getEndPos()]
             if ts:
                 return ts[-1]
             else:
@@ -2239,19 +2650,19 @@ class FeatureExtractor:
                     if doseword and dist<doseTagRange:
                         doseNum = util.text2num.convertOrdinal(doseword)                
                 
-                t = self.find_time_reference_with_tag(tag[1], tag[0], timex.getSentNum(), doseNum)
+                t = self.find_time_reference_with_tag(doc, tag[1], tag[0], timex.getSentNum(), doseNum)
                 if t:
                     return t
                 
             if tag[1] in ['Hospitalization', 'Administration']:
-                t = self.find_time_reference_with_tag(tag[1], tag[0], timex.getSentNum())
+                t = self.find_time_reference_with_tag(doc, tag[1], tag[0], timex.getSentNum())
                 if t:
                     return t
                 
             if tag[1] in ['Vaccination', 'Injection']:
                 if i+2<len(parts) and parts[i+1][0] in ['with', 'of', 'to'] and parts[i+2][1] in ['Drug', 'Vaccine']:
                     continue
-                t = self.find_time_reference_with_tag(tag[1], tag[0], timex.getSentNum())
+                t = self.find_time_reference_with_tag(doc, tag[1], tag[0], timex.getSentNum())
                 if t:
                     return t
                 
@@ -2259,7 +2670,7 @@ class FeatureExtractor:
         ##: In ideal case, this should "return None" directly. However, considering that the current lexicon is not 
         ##: complete enough, it's very likely some Vaccines or drugs are not tagged, we return the previous time
         ##: in the current development stage.
-        ts = [r[2] for r in self.timexImpactZones if r[0]<=timex.getStartPos() and r[1]>=timex.getEndPos()]
+        ts = [r[2] for r in doc.timexImpactZones if r[0]<=timex.getStartPos() and r[1]>=timex.getEndPos()]
         if ts:
             return ts[-1]
         
@@ -2341,7 +2752,7 @@ class FeatureExtractor:
         
         return tags
 
-    def divide_feature_containing_multiple_timexes(self, featurelist, timexList):
+    def divide_feature_containing_multiple_timexes(self, doc, featurelist, timexList):
         """Divide features that contain multiple timexes into mulitple shorter features."""
         
         if not timexList:
@@ -2350,7 +2761,7 @@ class FeatureExtractor:
             return []
 
         #sentences = util.sentence_tokenize(text)
-        text = self.text.lower()
+        text = doc.text.lower()
         
         extraFeatureList = []
         for index, feature in enumerate(featurelist):
@@ -2531,16 +2942,17 @@ class FeatureExtractor:
         
         return tlinkList
 
-    def create_feature_timex_association(self, featurelist, timexList):
+    def create_feature_timex_association(self, doc, featurelist, timexList):
         """Create tlinks for features. Assign timexes to the corresponding feature."""
         
         if not timexList or not featurelist:
             return featurelist
                     
-        text = self.text
-        sentences = self.sentences
+        text = doc.text
+        sentences = doc.sentences
         
         for sentNum, sentence in enumerate(sentences):
+            timexan.check_deadline(doc.deadline)
             timexes = [t for t in timexList if t.getSentNum()==sentNum and t.getRole()!='IGNORE']
             features = [feat for feat in featurelist if feat.getSentNum()==sentNum]
             if not timexes or not features:
@@ -2616,7 +3028,7 @@ class FeatureExtractor:
                     featleft.getTlink().setType('DURATION')
                     
         ##: Set flag to indicate if the feature is in a clause 
-        featurelist = self.flag_features_in_associate_clause(featurelist)
+        featurelist = self.flag_features_in_associate_clause(doc, featurelist)
         
         return featurelist    
 
@@ -2667,21 +3079,14 @@ class FeatureExtractor:
             text -- text to extract information from
             reportType = 'vaers' or 'faers'"""
         
-        sentences = util.sentence_tokenize(text)
+        tokenized = util.TokenizedDocument(text)
+        sentences = tokenized.sentences
         
-        n = len(sentences)
-        locsSentStarts = [-1] * n
-        curpt = 0
-        for i in range(n):
-            pos = text[curpt:].find(sentences[i])
-            locsSentStarts[i] = pos + curpt
-            curpt = locsSentStarts[i] + len(sentences[i])
-        locsSentStarts.append(len(text))
-        self.sentence_startPos = locsSentStarts
+        locsSentStarts = tokenized.sentence_startPos + [len(text)]
         
         AnnSent = None
-        for sentnum, pos in enumerate(self.sentence_startPos):
-            if annotationStartPos>=pos and annotationStartPos<=self.sentence_startPos[sentnum+1]-1:
+        for sentnum, pos in enumerate(locsSentStarts):
+            if annotationStartPos>=pos and annotationStartPos<=locsSentStarts[sentnum+1]-1:
                 AnnSent = sentnum
                 break
         
@@ -2703,35 +3108,36 @@ class FeatureExtractor:
             taggedSentences.append(sentence_to_parse)
                 
 
-        self.initialization_text_data(text, sentences, taggedSentences, textType)
+        tokenized.taggedSentences = taggedSentences
+        doc = self.initialization_text_data(tokenized, textType)
         
         expDateInput = self.parse_time_string(expDateStr)
         onsetDateInput = self.parse_time_string(onsetDateStr)  
         receiveDate = self.parse_time_string(refExpDateStr)  
         
-        self.exposureDate = expDateInput
-        self.onsetDate = onsetDateInput
-        self.receiveDate = receiveDate
-        self.exposureDateConfidence = 0
-        self.onsetDateConfidence = 0
+        doc.exposureDate = expDateInput
+        doc.onsetDate = onsetDateInput
+        doc.receiveDate = receiveDate
+        doc.exposureDateConfidence = 0
+        doc.onsetDateConfidence = 0
         
         ##: Obtain timex list
-        timexList = timexan.annotateTimexes(self.text, expDateInput)        
+        timexList = timexan.annotateTimexes(doc.text, expDateInput, doc.tokenized)        
         
-        self.sentence_full_tags = self.create_sentence_full_tags(featurelist, timexList)
+        doc.sentence_full_tags = self.create_sentence_full_tags(doc, featurelist, timexList)
         
-        timexList = self.preprocess_timex_list(timexList, featurelist)
+        timexList = self.preprocess_timex_list(doc, timexList, featurelist)
                       
         ###: divide features that contain multiple timexes
-        featurelist = self.divide_feature_containing_multiple_timexes(featurelist, timexList)
+        featurelist = self.divide_feature_containing_multiple_timexes(doc, featurelist, timexList)
         
-        featurelist = self.create_feature_timex_association(featurelist, timexList)
+        featurelist = self.create_feature_timex_association(doc, featurelist, timexList)
         
-        timexList = self.construct_timeline(timexList, featurelist)
+        timexList = self.construct_timeline(doc, timexList, featurelist)
         
         featurelist = self.process_feature_durations(featurelist)
         
-        featurelist = self.postprocess_features(featurelist)
+        featurelist = self.postprocess_features(doc, featurelist)
         
         feature = featurelist[0]
         tlink = feature.getTlink()
@@ -2766,62 +3172,22 @@ class FeatureExtractor:
         
         featurelist = []
         
-        sentences = util.sentence_tokenize(text)
+        tokenized = util.TokenizedDocument(text)
+        sentences = tokenized.sentences
         taggedSentences = []        
         for sentnumber, sentence0 in enumerate(sentences):
             
-            sentence = self.clean_text(sentence0)
-                        
-            # tokenize each sentence to have a list of words to be processed
-            tokens = nltk.word_tokenize(sentence)
-            #run the above procedure
-            sentence_to_parse = self.get_untagged(tokens)
+            # clean, tokenize, tag and chunk each sentence, with the spans of the words in the text
+            (sentence_to_parse, features) = self.process_sentence(sentence0, tokenized.sentence_startPos[sentnumber], sentnumber)
             
             # Save tagged sentences for later computing of expose date
             taggedSentences.append(sentence_to_parse)
-                
-            #only if the cleaned sentence is NOT empty we parse it
-            if sentence_to_parse!=[]:
-                tree = self.cp.parse(sentence_to_parse)
-                tree1 = self.cp1.parse(sentence_to_parse)
-                 
-#                 new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.node in self.st_filter])
-                new_sentence_to_parse = ','.join([' '.join(nltk.tag.untag(subtree.leaves())) + ' ' for subtree in tree.subtrees() if subtree.label() in self.st_filter])
-
-                #here we delete the dash and replace it with whitespace to convert post-vac to post vac
-                new_sentence_to_parse = new_sentence_to_parse.replace(', ,', ',')
-                #here we delete the dash and replace it with whitespace to convert post-vac to post vac
-                new_sentence_to_parse = new_sentence_to_parse.replace(',', ', ')
-
-                new_sentence_to_parse = nltk.word_tokenize(new_sentence_to_parse)
+            featurelist += features
 
-                #run the above procedure
-                new_sentence_to_parse = self.get_untagged(new_sentence_to_parse)
-                
-                if new_sentence_to_parse!=[]:
-                    tree2 = self.cp.parse(new_sentence_to_parse)
-                    for subtree in tree2.subtrees():
-                        if subtree.label() in self.st_filter:                            
-                            featString = self.massage_features(subtree)
-                            featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
-                            
-                for subtree in tree1.subtrees():
-                    if subtree.label() in self.labels_gram1:
-                        featString = self.massage_features(subtree)
-                        featurelist.append((subtree.label(), featString, sentnumber, subtree.leaves()))
-
-        self.sentences = sentences
-        
-        n = len(sentences)
-        locsSentStarts = [-1] * n
-        curpt = 0
-        for i in range(n):
-            pos = text[curpt:].find(sentences[i])
-            locsSentStarts[i] = pos + curpt
-            curpt = locsSentStarts[i] + len(sentences[i])
-        self.sentence_startPos = locsSentStarts
+        tokenized.taggedSentences = taggedSentences
+        doc = DocumentContext(tokenized)
         
-        featObjList = self.initialize_feature_obj_list(featurelist)
+        featObjList = self.initialize_feature_obj_list(doc, featurelist)
         
         featList = [(feat.getType(), feat.getStartPos(), feat.getEndPos(), feat.getString()) for feat in featObjList]
         return featList
@@ -2835,7 +3201,8 @@ class FeatureExtractor:
             strReceiveDate -- date when the report is received in string format
             """
             
-        sentences = util.sentence_tokenize(text)
+        tokenized = util.TokenizedDocument(text)
+        sentences = tokenized.sentences
         
         taggedSentences = []        
         for sentnumber, sentence0 in enumerate(sentences):
@@ -2848,14 +3215,15 @@ class FeatureExtractor:
             # Save tagged sentences for later computing of expose date
             taggedSentences.append(sentence_to_parse)
             
-        self.initialization_text_data(text, sentences, taggedSentences, textType)
+        tokenized.taggedSentences = taggedSentences
+        doc = self.initialization_text_data(tokenized, textType)
         
         ##: reconstruct missing fields (sentNum and tags) for features
         sentNum = 0
-        self.sentence_startPos.append(len(text)+1)
+        doc.sentence_startPos.append(len(text)+1)
         for feat in featurelist:
-            while not (feat.getStartPos() >= self.sentence_startPos[sentNum] 
-                       and feat.getEndPos() < self.sentence_startPos[sentNum+1]):
+            while not (feat.getStartPos() >= doc.sentence_startPos[sentNum] 
+                       and feat.getEndPos() < doc.sentence_startPos[sentNum+1]):
                 sentNum += 1
             feat.setSentNum(sentNum)
             
@@ -2869,8 +3237,8 @@ class FeatureExtractor:
         sentNum = 0
         if timexList and timexList[0].getSentNum()<0:
             for timex in timexList:
-                while not (timex.getStartPos() >= self.sentence_startPos[sentNum] 
-                       and timex.getEndPos() < self.sentence_startPos[sentNum+1]):
+                while not (timex.getStartPos() >= doc.sentence_startPos[sentNum] 
+                       and timex.getEndPos() < doc.sentence_startPos[sentNum+1]):
                     sentNum += 1
                 timex.setSentenceNum(sentNum)
         
@@ -2878,28 +3246,28 @@ class FeatureExtractor:
         onsetDateInput = self.parse_time_string(strOnsetDate)  
         receiveDate = self.parse_time_string(strReceiveDate)  
         
-        self.exposureDate = expDateInput
-        self.onsetDate = onsetDateInput
-        self.receiveDate = receiveDate
-        self.exposureDateConfidence = 0
-        self.onsetDateConfidence = 0
+        doc.exposureDate = expDateInput
+        doc.onsetDate = onsetDateInput
+        doc.receiveDate = receiveDate
+        doc.exposureDateConfidence = 0
+        doc.onsetDateConfidence = 0
         
         ##: Obtain timex list
-        self.sentence_full_tags = self.create_sentence_full_tags(featurelist, timexList)
+        doc.sentence_full_tags = self.create_sentence_full_tags(doc, featurelist, timexList)
         
-        timexList = self.preprocess_timex_list(timexList, featurelist)
+        timexList = self.preprocess_timex_list(doc, timexList, featurelist)
                       
         ###: divide features that contain multiple timexes
-        featurelist = self.create_feature_timex_association(featurelist, timexList)
+        featurelist = self.create_feature_timex_association(doc, featurelist, timexList)
         
-        timexList = self.construct_timeline(timexList, featurelist)
+        timexList = self.construct_timeline(doc, timexList, featurelist)
 
         featurelist = self.process_feature_durations(featurelist)
         
-        featurelist = self.postprocess_features(featurelist)
+        featurelist = self.postprocess_features(doc, featurelist)
         
-        if self.exposureDateConfidence==1:
-            if self.onsetDateConfidence==1:
+        if doc.exposureDateConfidence==1:
+            if doc.onsetDateConfidence==1:
                 datesConfidence = 1
             else:
                 datesConfidence = 0.9
@@ -2907,7 +3275,7 @@ class FeatureExtractor:
             datesConfidence = 0.8
             
         ##: Create DocumentFeature object for return
-        docFeature = DocumentFeature(featurelist, timexList, self.exposureDate, self.onsetDate, self.receiveDate, datesConfidence, expDateInput, onsetDateInput)     
+        docFeature = DocumentFeature(featurelist, timexList, doc.exposureDate, doc.onsetDate, doc.receiveDate, datesConfidence, expDateInput, onsetDateInput)     
             
         return docFeature
 
@@ -16,14 +16,22 @@ and time reference.
 
 class Timex3 -- Define a timex with information such as time string, type, datetime, location, etc 
 
+findTimexes() -- Find the token spans of the time expressions, with the n-gram windows matched either by
+one combined scanner regex, or by each pattern in turn (legacyTimexScanner).
+
+memoized_date_parser() -- Decorator keeping the results of a date parser in a bounded cache, see get_date_parser_stats().
+
+parse_date() -- Parse a date string as dateutil does, the layouts of the report form dates without dateutil.
+
+check_deadline() -- Stop the extraction of a document over its time budget, with BudgetExceeded.
+
 """
 #
 # Wei Wang, Engility, wei.wang@engility.com
 #
 
-from nltk import word_tokenize, sent_tokenize
 from datetime import date, datetime, timedelta
-import re, util
+import re, time, sre_parse, sre_constants, functools, util
 from dateutil.parser import parser
 from StringIO import StringIO
 
@@ -32,11 +40,87 @@ months = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct',
 
 #relTimeSignals = ['in','during','on','at','before','after','when','since','from','until','prior','later','earlier','post','ago','next', 'following']    
 relTimeSignals = ['before','after','prior','later','earlier','post','ago','next', 'following']    
+
+##: Match the n-gram windows in findTimexes() with each timex pattern in turn, instead of the combined scanner
+legacyTimexScanner = False
+##: Merge the matched windows and remove the contained timexes by comparing all pairs, instead of indexing and sorting them
+legacyTimexMerge = False
+##: Skip the n-gram windows in findTimexes() without any trigger token, i.e., without a digit, a month, a weekday, a time unit...
+prefilterTimexWindows = True
+##: TimexScanner of the patterns of findTimexes(), keyed by the tuple of the patterns
+_timexScanners = {}
+##: n-gram windows built by findTimexes(), and those skipped by the prefilter, since the last reset_timex_window_stats()
+timexWindowStats = {'windows': 0, 'pruned': 0}
+
+##: Windows of findTimexes() matched between two checks of the deadline
+deadlineCheckWindows = 256
+
+class BudgetExceeded(Exception):
+    """Raised by check_deadline() in the loops of a document extraction whose time budget is spent"""
+
+def check_deadline(deadline):
+    """Raise BudgetExceeded if time.time() is past the deadline; None is no deadline"""
+    if deadline is not None and time.time() > deadline:
+        raise BudgetExceeded()
+
+##: Keep the results of the date parsers decorated with memoized_date_parser()
+memoizeDateParsers = True
+dateParserCacheSize = 20000
+##: Name of the parser -> util.LRUCache of its results, created on first use as util imports this module
+_dateParserCaches = {}
+_notCached = object()
+
+def _copy_parse_result(value):
+    """Copy the dictionaries and lists of a parse result, e.g., the YMD of parse_raw_time() completed by annotateTimexes()"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_copy_parse_result(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_copy_parse_result(v) for v in value)
+    return value
+
+def memoized_date_parser(todayDefault = False):
+    """Return a decorator of a date parser function, keeping its results in an LRU cache keyed by its arguments, 
+    and by today's date if the parser fills in the missing fields with it (todayDefault), as dateutil.parser.parse.
+    A result is copied before it is returned, so the callers may change it."""
+    def decorator(function):
+        name = '%s.%s' % (function.__module__, function.__name__)
+        
+        @functools.wraps(function)
+        def memoized(*args, **kwargs):
+            if not memoizeDateParsers:
+                return function(*args, **kwargs)
+            cache = _dateParserCaches.get(name)
+            if cache is None:
+                cache = _dateParserCaches.setdefault(name, util.LRUCache(dateParserCacheSize))
+            key = (args, tuple(sorted(kwargs.items())), date.today() if todayDefault else None)
+            value = cache.get(key, _notCached)
+            if value is _notCached:
+                value = function(*args, **kwargs)
+                cache.put(key, value)
+            return _copy_parse_result(value)
+        return memoized
+    return decorator
+
+def get_date_parser_stats():
+    """Return {parser name: hits, misses, hit rate and size of its cache}, and the totals under 'all'"""
+    stats = dict((name, cache.getStats()) for name, cache in _dateParserCaches.items())
+    hits = sum(s['hits'] for s in stats.values())
+    misses = sum(s['misses'] for s in stats.values())
+    stats['all'] = {'hits': hits, 'misses': misses, 'hit_rate': float(hits) / (hits + misses) if hits + misses else 0.}
+    return stats
+
+def clear_date_parser_caches():
+    for cache in _dateParserCaches.values():
+        cache.clear()
             
-class Timex3:
+class Timex3(object):
     """ Implements a timex with information such as time string, type, datetime, location, etc. 
         Note that this is not the same as the TLink is defined in TimeML. It was initially design 
         to follow TimeML, but turned out to take a different approach. """ 
+    ##: Slots instead of an instance __dict__, as every report holds a list of timexes
+    __slots__ = ('start', 'end', 'type', 'string', 'sentNum', 'confidence', 'id', 'role', 'YMD', 'datetime')
         
     def __init__(self,inStart,inEnd,inType, inDatetime, inStr, conf = 0):
         self.start = inStart
@@ -172,10 +256,125 @@ def buildTimeString(wordList):
 
     return ' '.join(wordList)
 
-def findTimexes(words):  
+class TimexScanner:
+    """Matcher of a list of anchored timex patterns: match() tells whether any of the patterns matches the string,
+    with one regex search instead of one per pattern. The patterns are combined into alternations, one for each
+    first character a match can start with, so that only the patterns able to match are tried."""
+    
+    re_group_open = re.compile(r'(?<!\\)\((?!\?)')
+    re_backreference = re.compile(r'\\([1-9][0-9]?)')
+    
+    def __init__(self, patterns):
+        self.patterns = patterns
+        ##: first characters of each pattern, lower case, or None if they couldn't be determined
+        firstChars = [self._first_chars(sre_parse.parse(pattern, re.I))[0] for pattern in patterns]
+        
+        alternations = {}
+        self.dispatch = {}
+        chars = set()
+        for fc in firstChars:
+            chars.update(fc or [])
+        for char in chars:
+            indices = tuple(i for i, fc in enumerate(firstChars) if fc is None or char in fc)
+            if indices not in alternations:
+                alternations[indices] = self._combine([patterns[i] for i in indices])
+            self.dispatch[char] = alternations[indices]
+        ##: for the strings starting with other characters, and the empty string
+        others = [patterns[i] for i, fc in enumerate(firstChars) if fc is None]
+        self.otherScanner = self._combine(others) if others else None
+        self.scanner = self._combine(patterns)
+
+    def _combine(self, patterns):
+        """Return one regex matching where any of the patterns does. Each pattern becomes a non-capturing branch,
+        and its groups are made non-capturing, except in the patterns with backreferences, which are renumbered."""
+        branches = []
+        numGroups = 0
+        for pattern in patterns:
+            if self.re_backreference.search(pattern):
+                offset = numGroups
+                branch = self.re_backreference.sub(lambda m: '\\%d' % (int(m.group(1)) + offset), pattern)
+                numGroups += re.compile(pattern).groups
+            else:
+                branch = self.re_group_open.sub('(?:', pattern)
+            branches.append('(?:' + branch + ')')
+        return re.compile('|'.join(branches), re.I)
+
+    def _first_chars(self, items):
+        """Return (set of the lower case characters a match of the parsed items can start with, or None if any,
+        True if the items can match the empty string)."""
+        chars = set()
+        for op, av in items:
+            if op==sre_constants.AT:
+                continue
+            if op==sre_constants.LITERAL:
+                (first, empty) = (set([chr(av).lower()]), False)
+            elif op==sre_constants.IN:
+                first = set()
+                for setOp, setAv in av:
+                    if setOp==sre_constants.LITERAL:
+                        first.add(chr(setAv).lower())
+                    elif setOp==sre_constants.RANGE:
+                        first.update(chr(c).lower() for c in range(setAv[0], setAv[1]+1))
+                    else:
+                        first = None
+                        break
+                empty = False
+            elif op==sre_constants.BRANCH:
+                (first, empty) = (set(), False)
+                for branch in av[1]:
+                    (branchFirst, branchEmpty) = self._first_chars(branch)
+                    first = first | branchFirst if first is not None and branchFirst is not None else None
+                    empty = empty or branchEmpty
+            elif op==sre_constants.SUBPATTERN:
+                (first, empty) = self._first_chars(av[1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                (first, empty) = self._first_chars(av[2])
+                empty = empty or av[0]==0
+            else:
+                (first, empty) = (None, False)
+            if first is None:
+                return (None, empty)
+            chars |= first
+            if not empty:
+                return (chars, False)
+        return (chars, True)
+
+    def match(self, string):
+        if string:
+            scanner = self.dispatch.get(string[0].lower(), self.otherScanner)
+        else:
+            scanner = self.scanner
+        return scanner is not None and scanner.match(string) is not None
+
+def get_timex_scanner(patterns):
+    """Return the TimexScanner of the patterns, built once."""
+    key = tuple(patterns)
+    scanner = _timexScanners.get(key)
+    if scanner is None:
+        scanner = TimexScanner(patterns)
+        _timexScanners[key] = scanner
+    return scanner
+
+def get_timex_window_stats():
+    """Return the counts of the n-gram windows of findTimexes(): all, pruned by the prefilter, and their ratio"""
+    stats = dict(timexWindowStats)
+    stats['pruned_rate'] = float(stats['pruned']) / stats['windows'] if stats['windows'] else 0.
+    return stats
+
+def reset_timex_window_stats():
+    timexWindowStats['windows'] = 0
+    timexWindowStats['pruned'] = 0
+
+def findTimexes(words, legacy = None, deadline = None):  
     """Extract time expressions using Regular Expression rules. 
     input -- words to be in the format of ngram: words[filename][sentence index][word index] = "token" .
+    legacy -- match all the n-grams with each pattern in turn and merge them by comparing all pairs, as the original 
+              implementation; by default legacyTimexScanner, legacyTimexMerge and not prefilterTimexWindows.
+    deadline -- time.time() after which BudgetExceeded is raised while the windows are matched, see check_deadline()
     return -- a list of timex object indicating its starting and ending location in words 
+    
+    Both ways give the same timex spans; the 'tid' of the timexes only differ, as a window matching several 
+    patterns is merged once by the scanner.
     """
 
     #calendar_interval = "(minute|hour|day|weekend|week|month|quarter|year)"
@@ -259,18 +458,38 @@ def findTimexes(words):
     
     ###: add '^' + string + '$'
     timex_re = map(addBoundary, timex_re)
+    
+    ##: every pattern needs a digit or a word of these, starting a token or after a punctuation; textual numbers, 
+    ##: ordinals and vague words only come with a calendar interval
+    trigger_words = [calendar_interval, longdays, monthspec, times, "(now|current|tonight|stay)"]
+    trigger_re = re.compile("[0-9]|(^|[^a-z])(" + '|'.join(trigger_words) + ")", re.I)
+    
+    legacyScanner = legacyTimexScanner if legacy is None else legacy
+    legacyMerge = legacyTimexMerge if legacy is None else legacy
+    prefilter = prefilterTimexWindows if legacy is None else not legacy
+    if not legacyScanner:
+        scanner = get_timex_scanner(timex_re)
 
     # ngrams[0] is empty; ngrams[1] contains unigrams; ngrams [2] bigrams, and so on.
     ngrams = []
     ngrams.insert(0,  [])
 
     # build ngrams of input string
+    numWindows = 0
+    numPruned = 0
+    triggers = {}
     for n in range(1, 6):
         ngrams.insert(n,  {})
 
         for docName in words.keys():
             for sentenceIndex,  wordList in enumerate(words[docName]):
                 sentenceList = buildSentenceList(words[docName][sentenceIndex])
+                if prefilter and n == 1:
+                    ##: number of trigger tokens before each token, to count those of a window by a difference
+                    counts = [0]
+                    for word in sentenceList:
+                        counts.append(counts[-1] + (1 if trigger_re.search(word) else 0))
+                    triggers[(docName, sentenceIndex)] = counts
 
                 if n == 1:
                     maxBound = len(sentenceList)
@@ -278,82 +497,49 @@ def findTimexes(words):
                     maxBound = -(n - 1)
 
                 for wordIndex,  word in enumerate(sentenceList[0:maxBound]):
-                    ngrams[n][':'.join([docName,  str(sentenceIndex),  str(wordIndex)])] = sentenceList[wordIndex:wordIndex + n]
-
-    timexes = []
+                    key = ':'.join([docName,  str(sentenceIndex),  str(wordIndex)])
+                    numWindows += 1
+                    if prefilter:
+                        counts = triggers[(docName, sentenceIndex)]
+                        if counts[wordIndex + n]==counts[wordIndex]:
+                            ##: kept as None, so that the windows are visited in the same order as without the prefilter
+                            ngrams[n][key] = None
+                            numPruned += 1
+                            continue
+                    ngrams[n][key] = sentenceList[wordIndex:wordIndex + n]
+    timexWindowStats['windows'] += numWindows
+    timexWindowStats['pruned'] += numPruned
 
     # feed this regex list a set of ngrams; look for complete matches.
-    tid = 0
+    candidates = []
     for n in range(1, 6):
-        for key,  wordList in ngrams[n].items():
+        for i, (key,  wordList) in enumerate(ngrams[n].items()):
+            if deadline is not None and i % deadlineCheckWindows == 0:
+                check_deadline(deadline)
+            if wordList is None:
+                continue
             
             #window_string = ' '.join(wordList)
             window_string = buildTimeString(wordList)
-            for test in timex_re:
-                matches = re.compile(test,  re.I).finditer(window_string)
-
-                for match in matches:
-                    matchDoc,  matchSentence,  matchStart = key.split(':')
-                    matchSentence,  matchStart = map(int,  [matchSentence,  matchStart])
-                    matchEnd = matchStart + n - 1
-
-                    c = {'doc':matchDoc,  'sentence':matchSentence,  'start':matchStart,  'end':matchEnd}
-
-                    # list item l
-                    added = False
-#                    print c['start'],  c['end'],  buildSentenceList(words[c['doc']][c['sentence']])[c['start']:c['end']+1]
-                    for k, l in enumerate(timexes):
-
-                        # skip timexes not in the same sentence
-                        if c['sentence'] != l['sentence'] or c['doc'] != l['doc']:
-                            continue
-
-                        # already found this one - don't bother doing anything with it
-                        if c['start'] == l['start'] and c['end'] == l['end']:
-                            added = True
-                            break
-
-                        # have we got an overlap?
-                        elif (c['start'] >= l['start'] and c['start'] <= l['end']) or (c['end'] >= l['start'] and c['end'] <= l['end']):
-                            expanded_start = min(c['start'],  l['start'])
-                            expanded_end = max(c['end'],  l['end'])
-                            expanded_string = buildSentenceList(words[c['doc']][c['sentence']])[expanded_start:expanded_end+1]
-                            expanded_entry = {'doc':c['doc'], 'sentence':c['sentence'],  'start':expanded_start,  'end':expanded_end,  'tid':tid}
-#                            print 'Merged with', l['start'], '-', l['end'], 'to',  expanded_entry,  expanded_string,  '(from)',  buildSentenceList(words[c['doc']][c['sentence']])[c['start']:c['end']+1],  'and',  buildSentenceList(words[c['doc']][c['sentence']])[l['start']:l['end']+1]
-                            tid += 1
-                            timexes[k] = expanded_entry
-                            added = True
-                            continue
+            if legacyScanner:
+                numMatches = 0
+                for test in timex_re:
+                    for match in re.compile(test,  re.I).finditer(window_string):
+                        numMatches += 1
+            else:
+                numMatches = 1 if scanner.match(window_string) else 0
 
-#                        k += 1 # This does nothing in Python for loop. k is reassigned each loop
+            for match in range(numMatches):
+                matchDoc,  matchSentence,  matchStart = key.split(':')
+                matchSentence,  matchStart = map(int,  [matchSentence,  matchStart])
+                matchEnd = matchStart + n - 1
 
-                    if not added:
-                        c['tid'] = tid
-                        timexes.append(c)
-                        tid += 1
+                candidates.append({'doc':matchDoc,  'sentence':matchSentence,  'start':matchStart,  'end':matchEnd})
 
-    # remove duplicate timexes - these can be annotated when we have something like 10th January 1920, and annotate "January" and "1920" separately, then merge to form "10th January" and "1920", and try to merge "10th January 1920", which will match both fragments.
-    # de-dupe timexes by doc / sentence / start / end
-    for t in timexes:
-        # count how many matches for this timex there are; if a copy is found when matches already = 1, nuke it
-        matches = 0
-        for reference,  y in enumerate(timexes):
-            if t['doc'] == y['doc'] and t['sentence'] == y['sentence'] and t['start'] == y['start'] and t['end'] == y['end']:
-                if matches == 0:
-                    matches += 1
-                else:
-                    # remove this element
-                    del timexes[reference]
-        
-        ##: remove elements if it is included within this timex
-        nr = range(len(timexes))
-        nr.reverse()
-        for reference in nr:
-            y = timexes[reference]
-            if t['doc'] == y['doc'] and t['sentence'] == y['sentence'] and ((t['start'] <= y['start'] and t['end'] > y['end'])
-                                                                             or (t['start'] < y['start'] and t['end'] >= y['end'])):
-                # remove this element
-                del timexes[reference]
+    if legacyMerge:
+        timexes = _merge_timex_candidates_legacy(candidates)
+    else:
+        timexes = remove_contained_timexes(merge_timex_candidates(candidates))
                 
     timexes.sort(key=lambda t: t['start'])
      
@@ -412,8 +598,129 @@ def findTimexes(words):
 #                 timexes.remove(t)
     
     # remove timexes contained in others, AGAIN, after above merge operations
+    if legacyMerge:
+        _remove_contained_timexes_legacy(timexes)
+    else:
+        timexes = remove_contained_timexes(timexes, False)
+                 
+    timexes.sort(key=lambda t: t['start'])
+    
+    return timexes
+
+def merge_timex_candidates(candidates):
+    """Merge the matched n-gram windows into timexes, in the order of the candidates: a candidate already found is
+    dropped, and one starting or ending within timexes found before expands each of them to cover it; otherwise it is
+    a new timex. The timexes covering each token are indexed, so that a candidate is only compared with those.
+    Return the list of timexes, each {'doc', 'sentence', 'start', 'end', 'tid'}, with duplicates left in."""
+    timexes = []
+    ##: (doc, sentence, token index) -> set of the indices in timexes covering the token
+    covering = {}
+    tid = 0
+    for c in candidates:
+        doc = c['doc']
+        sentence = c['sentence']
+        overlaps = covering.get((doc, sentence, c['start']), set()) | covering.get((doc, sentence, c['end']), set())
+        added = False
+        for k in sorted(overlaps):
+            l = timexes[k]
+            # already found this one - don't bother doing anything with it
+            if c['start'] == l['start'] and c['end'] == l['end']:
+                added = True
+                break
+            
+            expanded_start = min(c['start'],  l['start'])
+            expanded_end = max(c['end'],  l['end'])
+            timexes[k] = {'doc':doc, 'sentence':sentence,  'start':expanded_start,  'end':expanded_end,  'tid':tid}
+            tid += 1
+            for i in range(expanded_start, expanded_end + 1):
+                covering.setdefault((doc, sentence, i), set()).add(k)
+            added = True
+        
+        if not added:
+            c = dict(c, tid=tid)
+            tid += 1
+            for i in range(c['start'], c['end'] + 1):
+                covering.setdefault((doc, sentence, i), set()).add(len(timexes))
+            timexes.append(c)
+    
+    return timexes
+
+def remove_contained_timexes(timexes, dedupe = True):
+    """Return the timexes not contained within another timex of the same sentence, in their order, in one sweep 
+    over the timexes sorted by start. Of equal timexes, only the first is kept if dedupe, all of them otherwise."""
+    byStart = sorted(range(len(timexes)), key=lambda k: (timexes[k]['doc'], timexes[k]['sentence'], timexes[k]['start'], 
+                                                         -timexes[k]['end'], k))
+    kept = []
+    (sentence, lastStart, lastEnd, maxEnd) = (None, None, None, -1)
+    for k in byStart:
+        t = timexes[k]
+        if (t['doc'], t['sentence'])!=sentence:
+            (sentence, lastStart, lastEnd, maxEnd) = ((t['doc'], t['sentence']), None, None, -1)
+        if t['end'] <= maxEnd:
+            ##: equal to the last kept timex, or within a timex starting before
+            if dedupe or t['start']!=lastStart or t['end']!=lastEnd:
+                continue
+        (lastStart, lastEnd, maxEnd) = (t['start'], t['end'], max(maxEnd, t['end']))
+        kept.append(k)
+    
+    kept.sort()
+    return [timexes[k] for k in kept]
+
+def _merge_timex_candidates_legacy(candidates):
+    """merge_timex_candidates() and remove_contained_timexes() as in the original implementation, comparing each 
+    candidate, then each timex, with all the timexes."""
+    timexes = []
+    tid = 0
+    for c in candidates:
+        # list item l
+        added = False
+        for k, l in enumerate(timexes):
+
+            # skip timexes not in the same sentence
+            if c['sentence'] != l['sentence'] or c['doc'] != l['doc']:
+                continue
+
+            # already found this one - don't bother doing anything with it
+            if c['start'] == l['start'] and c['end'] == l['end']:
+                added = True
+                break
+
+            # have we got an overlap?
+            elif (c['start'] >= l['start'] and c['start'] <= l['end']) or (c['end'] >= l['start'] and c['end'] <= l['end']):
+                expanded_start = min(c['start'],  l['start'])
+                expanded_end = max(c['end'],  l['end'])
+                expanded_entry = {'doc':c['doc'], 'sentence':c['sentence'],  'start':expanded_start,  'end':expanded_end,  'tid':tid}
+                tid += 1
+                timexes[k] = expanded_entry
+                added = True
+                continue
+
+        if not added:
+            c = dict(c, tid=tid)
+            timexes.append(c)
+            tid += 1
+
+    # remove duplicate timexes - these can be annotated when we have something like 10th January 1920, and annotate "January" and "1920" separately, then merge to form "10th January" and "1920", and try to merge "10th January 1920", which will match both fragments.
+    # de-dupe timexes by doc / sentence / start / end
     for t in timexes:
+        # count how many matches for this timex there are; if a copy is found when matches already = 1, nuke it
+        matches = 0
+        for reference,  y in enumerate(timexes):
+            if t['doc'] == y['doc'] and t['sentence'] == y['sentence'] and t['start'] == y['start'] and t['end'] == y['end']:
+                if matches == 0:
+                    matches += 1
+                else:
+                    # remove this element
+                    del timexes[reference]
+        
         ##: remove elements if it is included within this timex
+        _remove_contained_timexes_legacy(timexes, t)
+
+    return timexes
+
+def _remove_contained_timexes_legacy(timexes, timex = None):
+    """Remove from timexes, in place, those contained within the timex, or within any of them."""
+    for t in ([timex] if timex else timexes):
         nr = range(len(timexes))
         nr.reverse()
         for reference in nr:
@@ -422,10 +729,6 @@ def findTimexes(words):
                                                                              or (t['start'] < y['start'] and t['end'] >= y['end'])):
                 # remove this element
                 del timexes[reference]
-                 
-    timexes.sort(key=lambda t: t['start'])
-    
-    return timexes
 
 def getTimexType(timexString,  previous3Words, next2Words):
     """Determine the type of time expression based on its neighbouring information"""
@@ -640,6 +943,7 @@ def getRelativeDatetime(timexString, relation, refDatetime):
     
     return newtime
 
+@memoized_date_parser()
 def parse_string_complementary(timexString, referenceDate = None):
     """Parse time string that cannot be parsed with dateutil.parser. Called in annotateTimexes()"""
     
@@ -950,6 +1254,7 @@ def parse_string_complementary(timexString, referenceDate = None):
     return (None, None)
 
 
+@memoized_date_parser()
 def parse_raw_time(timestring):    
     """ Break down time string like: "2 and 5 Dec 2019" """
     fullmonth = "january|february|march|april|may|june|july|august|september|october|november|december"
@@ -1055,36 +1360,22 @@ def get_timexes_for_evaluation(text):
     
     return timexList
 
-def annotateTimexes(text, referenceDate = None):
+def annotateTimexes(text, referenceDate = None, tokenized = None, deadline = None):
     """This is the main function in this module. Extract timexes from the text. 
     It determines the time string, type, location, partial information and evaluates absolute date.
     
-    Input -- The text to be processed
+    Input -- The text to be processed, and its util.TokenizedDocument if it is already tokenized
     Output -- A list of Timex3 objects. 
+    BudgetExceeded is raised once the deadline is past, see check_deadline().
     """
-    sentences = util.sentence_tokenize(text)
-    tokens = [word for sent in sentences for word in word_tokenize(sent)]
-    
-    ###: find starting locations of all tokens
-    n = len(tokens)
-    lenText = len(text)
-    locsTokenStarts = [-1] * n
-    curpt = 0
-    for i in range(n):
-        pos = text[curpt:].find(tokens[i])
-        
-        if tokens[i]=='``' or tokens[i]=="''":
-            pos2 = text[curpt:].find('"')
-            if pos2>=0 and pos2<pos:
-                tokens[i]='"'
-                pos = pos2
-                
-        if pos < 0:
-            locsTokenStarts[i] = curpt
-            curpt += 1
-        else:
-            locsTokenStarts[i] = pos + curpt
-            curpt = locsTokenStarts[i] + len(tokens[i])
+    if tokenized is None:
+        tokenized = util.TokenizedDocument(text)
+    sentences = tokenized.sentences
+    
+    ###: starting locations of all tokens; copied since they are adjusted to the timex strings below
+    (tokens, locsTokenStarts) = tokenized.getTokenSpans()
+    tokens = list(tokens)
+    locsTokenStarts = list(locsTokenStarts)
 
     ###: convert to words[file][sent][word] = "token"
     words = {}
@@ -1097,13 +1388,14 @@ def annotateTimexes(text, referenceDate = None):
         offset += 1
 
     # get timexes
-    timexes = findTimexes(words)    
+    timexes = findTimexes(words, deadline = deadline)    
     #timexes.sort(key=lambda t: t['start'])
     
     timexList = []
 
     id = 0;
     for t in timexes:        
+        check_deadline(deadline)
         timexString0 = text[locsTokenStarts[t['start']]:locsTokenStarts[t['end']]+len(tokens[t['end']])]
         timexString = timexString0.strip(' ?-/,')
         if len(timexString0)!=len(timexString):
@@ -1157,14 +1449,8 @@ def annotateTimexes(text, referenceDate = None):
         timex = Timex3(istart, iend, strType, timexDate, timexString, confidence)
         timexList.append(timex)
             
-    n = len(sentences)
-    sentence_startPos = [-1] * n
-    curpt = 0
-    for i in range(n):
-        pos = text[curpt:].find(sentences[i])
-        sentence_startPos[i] = pos + curpt
-        curpt = sentence_startPos[i] + len(sentences[i])
-        
+    sentence_startPos = tokenized.sentence_startPos
+
     for i, sent in enumerate(sentences):
         start_char_sent = sentence_startPos[i]
         
@@ -1271,12 +1557,57 @@ def beautifyTimeInterval(timediff):
         return str(years) +  ' years and ' +str(mons) + ' months' 
 
     
+##: Layouts of the report form dates: 2010-03-10 (database), 10-MAR-10 (VAERS txt export) and 3/10/2010, 
+##: as (regex, order of the year, month and day groups)
+formDateLayouts = [(re.compile(r'^([0-9]{4})-([0-9]{2})-([0-9]{2})$'), (1, 2, 3)),
+                   (re.compile(r'^([0-9]{1,2})-(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)-([0-9]{4}|[0-9]{2})$', re.I), (3, 2, 1)),
+                   (re.compile(r'^([0-9]{1,2})/([0-9]{1,2})/([0-9]{4}|[0-9]{2})$'), (3, 1, 2))]
+
+def parse_form_date(dateString):
+    """Return the datetime of a date string in one of the formDateLayouts, as dateutil.parser.parse would, 
+    or None if it is in another layout or not a valid date. Two digit years are taken within 50 years 
+    of the current year, as dateutil does, not 1969-2068 as strptime."""
+    for layout, (yearGroup, monthGroup, dayGroup) in formDateLayouts:
+        match = layout.match(dateString)
+        if not match:
+            continue
+        (yearStr, monthStr, dayStr) = (match.group(yearGroup), match.group(monthGroup), match.group(dayGroup))
+        month = int(monthStr) if monthStr.isdigit() else months.index(monthStr.lower()) + 1
+        ##: e.g., 13/2/2010 is day first for dateutil
+        if month > 12:
+            return None
+        year = int(yearStr)
+        if len(yearStr)==2:
+            currentYear = date.today().year
+            year += currentYear // 100 * 100
+            if year >= currentYear + 50:
+                year -= 100
+            elif year < currentYear - 50:
+                year += 100
+        try:
+            return datetime(year, month, int(dayStr))
+        except ValueError:
+            return None
+    return None
+
+@memoized_date_parser(todayDefault=True)
+def _parse_date_dateutil(dateString):
+    return parser.parse(parser(), dateString)
+
+def parse_date(dateString):
+    """Parse a date string as dateutil.parser.parse, raising its errors. The layouts of the report forms
+    are parsed by parse_form_date(), faster than a cache lookup; only the others by dateutil, memoized."""
+    dt = parse_form_date(dateString)
+    if dt is None:
+        dt = _parse_date_dateutil(dateString)
+    return dt
+
 def parse_time_string(time_string):        
     if time_string == '':
         return None
      
     try:
-        dt = parser.parse(parser(), time_string)
+        dt = parse_date(time_string)
     except:
         return None
         
@@ -1380,14 +1711,8 @@ def createTimexList(timexes, text, referenceDate = None):
         timex.setID(t['id'])
         timexList.append(timex)
             
-    n = len(sentences)
-    sentence_startPos = [-1] * n
-    curpt = 0
-    for i in range(n):
-        pos = text[curpt:].find(sentences[i])
-        sentence_startPos[i] = pos + curpt
-        curpt = sentence_startPos[i] + len(sentences[i])
-        
+    sentence_startPos = util.find_sentence_positions(sentences, text)
+
     for i, sent in enumerate(sentences):
         start_char_sent = sentence_startPos[i]
         
@@ -10,6 +10,14 @@
     class ReportGenerator – provides functions to export ETHER results into a series of format
     
     class XMLUtil – class provides capability to handle XML files
+    
+    class LRUCache – bounded cache discarding the least recently used entries
+    
+    class TokenizedDocument – a narrative tokenized once, with the character offsets of its sentences and tokens
+    
+    class TaggedToken – a (word, tag) pair carrying the character span of the word in the text
+    
+    class StageTimer – wall time and call counts of the extraction stages, per document and over a batch
 
 """
 #
@@ -21,11 +29,12 @@ Created on Oct 28, 2014
 
 @author: WEI.WANG1
 '''
-import re, nltk, csv
-import xml.etree.cElementTree as ETree
-import timexan, textan
-from lxml import etree as ET
-from lxml.etree import CDATA
+import re, csv, json, time, collections, threading
+import timexan, textan, chunker, lazyimport
+##: Loaded on first use, see lazyimport.py
+nltk = lazyimport.LazyModule('nltk')
+ETree = lazyimport.LazyModule('xml.etree.cElementTree')
+ET = lazyimport.LazyModule('lxml.etree')
 
 dictFeatureNamesInv = {"SYMPTOM":"Symptom", "VACCINE":"Vaccine", "DIAGNOSIS": "Primary Diagnosis", 
                 "SECOND_LEVEL_DIAGNOSIS":"Second Level Diagnosis", "CAUSE_OF_DEATH":"Cause of Death", 
@@ -553,7 +562,15 @@ class ReportUtil:
         return s
     
 class ReportClassifier:
-    """Perform report classification. Developed by Taxiarchis Botsis."""
+    """Perform report classification. Developed by Taxiarchis Botsis.
+    The words are tagged with a textan.FastTagger built from the lexicon so that it gives the tags of
+    nltk.RegexpTagger, and chunked with chunker.TagChunker. See batch.classify_reports() to classify
+    many reports in worker processes."""
+    
+    ##: Lexicon entries looked up in the tagger dictionary: a word, anchored at the end
+    re_plain_entry = re.compile(r'^\w+\$$')
+    ##: Lexicon entry matching every word, the tags of the entries after it are never used
+    catchAllEntry = r'.*'
     
     def __init__(self):  
         self.lexicon=[(r'non$','NEGATION'), (r'no$','NEGATION'), (r'hour$','TIME'),(r'minute.*$','TIME'), (r'hr$','TIME'), (r'hrs$','TIME'), (r'day$','TIME'), (r'min$','TIME'), 
@@ -569,7 +586,7 @@ class ReportClassifier:
              (r'.*','unimportant'), (r'one$','NUMBER'),(r'two$','NUMBER'),(r'three$','NUMBER'),(r'four$','NUMBER'),(r'five$','NUMBER'),(r'six$','NUMBER'),(r'seven$','NUMBER'),
              (r'eight$','NUMBER'),(r'nine$','NUMBER'), (r'ten$','NUMBER') , (r'^-?[0-9]+(.[0-9]+)?$','CD')]
 
-        self.regexp_tagger=nltk.RegexpTagger(self.lexicon)
+        self.regexp_tagger=textan.FastTagger(self.lexicon, self.get_tagger_tables(self.lexicon))
 
         grammar = r""" non: {<unimportant|CD|NUMBER|TIME>}
                             observation: {<OBSERV>}
@@ -644,14 +661,38 @@ class ReportClassifier:
                             {<GI><exclude>*<mRESP><exclude>*<mDERM>}"""
 
 
-        self.cp=nltk.RegexpParser(grammar)
+        self.grammar = grammar
+        self.cp=chunker.TagChunker(grammar)
+
+    @classmethod
+    def get_tagger_tables(cls, lexicon):
+        """Return the textan.FastTagger tables of the lexicon. nltk.RegexpTagger gives the tag of the first
+        matching entry, so a plain word is only put in the dictionary if no wildcard entry before it matches 
+        it, and the entries after the catch-all entry are left out."""
+        hashdict = {}
+        patterns = []
+        for lexis, tag in lexicon:
+            if cls.re_plain_entry.match(lexis):
+                word = lexis[:-1]
+                if word not in hashdict and not any(re.match(pattern, word) for pattern, t in patterns):
+                    hashdict[word] = tag
+            else:
+                patterns.append((lexis, tag))
+                if lexis==cls.catchAllEntry:
+                    break
+        return (hashdict, patterns)
 
     def getClassification(self, reportText):
         cls = self.ie_process(reportText) 
         level = 0
         return (cls, level)
         
+    def classify_text(self, text):
+        """Return the classification of a narrative, 'positive' or ''"""
+        return self.ie_process(nltk.word_tokenize(text))
+        
     def ie_process(self, document):    
+        """Return the classification of a document given as a list of words"""
         punctuations = ['."',"```","`","+","*","^","%","@","&","<",">","'","-",',', '.', '!', '?', ';', ':', '"', '/', ')','(']
         allw=self.regexp_tagger.tag([w.lower() for w in document if w.lower() not in punctuations]) 
         tree=self.cp.parse(allw)
@@ -659,16 +700,16 @@ class ReportClassifier:
         features={}
         for subtree in tree.subtrees():
             if subtree.label()=='pattern1':
-                features['pattern1']= (subtree.node=='pattern1')
+                features['pattern1']= True
                 report='positive'
             if subtree.label()=='pattern2':
-                features['pattern2']= (subtree.node=='pattern2')
+                features['pattern2']= True
                 report='positive'
             if subtree.label()=='pattern3':
-                features['pattern3']= (subtree.node=='pattern3')
+                features['pattern3']= True
                 report='positive'
             if subtree.label()=='observation':
-                features['observation']= (subtree.node=='observation')
+                features['observation']= True
                 report='positive'
         return report
     
@@ -1182,7 +1223,7 @@ class XMLUtil:
         root = ET.Element("ClinicalNarrativeTemporalAnnotation")
         
         elemText = ET.SubElement(root, "Text")
-        elemText.text = CDATA(doctext)
+        elemText.text = ET.CDATA(doctext)
         elemTags = ET.SubElement(root, "TAGS")
         
         ##: Export Feature Annotations
@@ -1229,7 +1270,7 @@ class XMLUtil:
         root = ET.Element("ClinicalNarrativeTemporalAnnotation")
         
         elemText = ET.SubElement(root, "TEXT")
-        elemText.text = CDATA(doctext)
+        elemText.text = ET.CDATA(doctext)
         elemTags = ET.SubElement(root, "TAGS")
         ##: Export Feature Annotations        
         features = docFeature.featureList
@@ -1686,26 +1727,90 @@ def find_neighboring_words(text, locLeft, locRight, numLeft, numRight):
         
     return (wordsLeft, wordsRight)
 
-def find_sub_text_range(text, sub):
-    """This function find the range of sub in the text. Sub is a token set obtained from the full text. """
-
+def find_from(text, s, start):
+    """Return text[start:].find(s) + start, i.e., the position of s in the text from start on, 
+    or start-1 if it is not found, without copying the text."""
+    pos = text.find(s, start)
+    if pos >= 0:
+        return pos
+    if s=='':
+        ##: the empty string is found in the empty slice beyond the end of the text
+        return start
+    return start - 1
+
+def find_token_spans(tokens, text):
+    """Find the character span (start, end) of each token in the text, searching from the end of the previous token.
+    Quotes tokenized as `` or '' are matched to '"' if it comes first in the text. A token that is not found 
+    gets an empty span at the current position, which then moves one character on."""
+    spans = []
+    curpt = 0
+    for tk in tokens:
+        pos = text.find(tk, curpt)
+        end = pos + len(tk)
+        
+        if tk=='``' or tk=="''":
+            pos2 = text.find('"', curpt)
+            if pos2>=0 and pos2<pos:
+                pos = pos2
+                end = pos2 + 1
+                
+        if pos < 0:
+            spans.append((curpt, curpt))
+            curpt += 1
+        else:
+            spans.append((pos, end))
+            curpt = end
+    return spans
+
+def sub_with_offsets(regexp, repl, text, offsets):
+    """Replace the matches of the compiled regexp in the text with the string repl, as regexp.sub() does, and 
+    keep track of the character offsets: offsets[i] is where the i-th character of the text comes from.
+    The replacement characters come from the start of the match. Return the new text and its offsets."""
+    pieces = []
+    newOffsets = []
+    pos = 0
+    for m in regexp.finditer(text):
+        pieces.append(text[pos:m.start()])
+        newOffsets += offsets[pos:m.start()]
+        pieces.append(repl)
+        newOffsets += [offsets[m.start()]] * len(repl)
+        pos = m.end()
+    pieces.append(text[pos:])
+    newOffsets += offsets[pos:]
+    return (''.join(pieces), newOffsets)
+
+def find_sentence_positions(sentences, text):
+    """Find the starting position of each sentence in the text."""
+    locsSentStarts = []
+    curpt = 0
+    for sent in sentences:
+        pos = find_from(text, sent, curpt)
+        locsSentStarts.append(pos)
+        curpt = pos + len(sent)
+    return locsSentStarts
+
+def find_sub_text_tokens(text):
+    """Tokenize the lower case text for find_sub_text_range(), where tokens are further split on '-' and '/'.
+    Return the tokens and their starting positions in the text."""
     text = text.lower()
-#    tokens = text.split()
-    tks = nltk.word_tokenize(text)
     tokens=[]
-    for t in tks:
+    for t in nltk.word_tokenize(text):
         tokens+=re.split('-|/', t)
-    n = len(tokens)
-    #print tokens
     
-    ###: find starting locations of all tokens
-    charlocs = [-1] * n
+    charlocs = []
     curpt = 0
-    for i in range(n):
-        pos = text[curpt:].find(tokens[i])
-        charlocs[i] = pos + curpt
-        curpt = charlocs[i] + len(tokens[i])
-        
+    for tk in tokens:
+        pos = find_from(text, tk, curpt)
+        charlocs.append(pos)
+        curpt = pos + len(tk)
+    return (tokens, charlocs)
+
+def find_sub_text_range(text, sub, subTextTokens = None):
+    """This function find the range of sub in the text. Sub is a token set obtained from the full text. 
+    subTextTokens -- the result of find_sub_text_tokens(text), if it is already computed"""
+
+    text = text.lower()
+    (tokens, charlocs) = subTextTokens or find_sub_text_tokens(text)
         
     s = sub.lower()
     words = re.split(', | ', s)
@@ -1736,32 +1841,17 @@ def find_sub_text_range(text, sub):
     ##: e.g., non-ascii characters are removed, as well as certain punctuations such as "'" or "-"
     ##: In this case, the feature word is only required to match the beginning part of tokens. 
     if minRange[0]==0 and minRange[1]==len(text):
-        minRange = find_sub_text_range_partial_match(text, sub)
+        minRange = find_sub_text_range_partial_match(text, sub, (tokens, charlocs))
     
     return minRange    
 
-def find_sub_text_range_partial_match(text, sub):
+def find_sub_text_range_partial_match(text, sub, subTextTokens = None):
     """When range is the whole text, this is possibly due to the fact that feature is extracted from the cleaned text,
        e.g., non-ascii characters are removed, as well as certain punctuations such as "'" or "-"
        In this case, the feature word is only required to match the beginning part of tokens. """
        
     text = text.lower()
-#    tokens = text.split()
-    tks = nltk.word_tokenize(text)
-    tokens=[]
-    for t in tks:
-        tokens+=re.split('-|/', t)
-    n = len(tokens)
-    #print tokens
-    
-    ###: find starting locations of all tokens
-    charlocs = [-1] * n
-    curpt = 0
-    for i in range(n):
-        pos = text[curpt:].find(tokens[i])
-        charlocs[i] = pos + curpt
-        curpt = charlocs[i] + len(tokens[i])
-        
+    (tokens, charlocs) = subTextTokens or find_sub_text_tokens(text)
         
     s = sub.lower()
     words = re.split(', | ', s)
@@ -2033,6 +2123,275 @@ def sentence_tokenize(text):
     
     return sentences
 
+class LRUCache:
+    """A bounded dictionary that discards the least recently used entry when it is full.
+    It is thread safe, so that it can be shared by extractions running in a thread pool."""
+    
+    def __init__(self, maxsize = 10000):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+    def __len__(self):
+        return len(self.data)
+    
+    def get(self, key, default = None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            ##: re-insert to mark it as the most recently used
+            self.data[key] = value
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        with self.lock:
+            if key in self.data:
+                del self.data[key]
+            elif len(self.data) >= self.maxsize:
+                self.data.popitem(last=False)
+            self.data[key] = value
+            
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+            
+    def getStats(self):
+        lookups = self.hits + self.misses
+        rate = float(self.hits) / lookups if lookups else 0.
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': rate, 'size': len(self.data), 'maxsize': self.maxsize}
+        
+class TokenizedDocument:
+    """A narrative tokenized once and shared by all stages of an extraction: its sentences, 
+    the words of every sentence and the character offsets of both. The words and lower case 
+    words of each sentence are computed on first use and kept; the tags of the sentences are 
+    set by the feature extractor."""
+    
+    def __init__(self, text, sentences = None):
+        self.text = text
+        if sentences is None:
+            sentences = sentence_tokenize(text)
+        self.sentences = sentences
+        self.sentence_startPos = find_sentence_positions(sentences, text)
+        self.taggedSentences = []
+        
+        self._sentenceTokens = {}
+        self._lowerTokens = {}
+        self._tokenSpans = None
+        
+    def getSentenceTokens(self, sentNum):
+        """Return the words of the sentence, as nltk.word_tokenize() gives them."""
+        if not sentNum in self._sentenceTokens:
+            self._sentenceTokens[sentNum] = nltk.word_tokenize(self.sentences[sentNum])
+        return self._sentenceTokens[sentNum]
+    
+    def getLowerTokens(self, sentNum):
+        """Return the words of the lower case sentence."""
+        if not sentNum in self._lowerTokens:
+            self._lowerTokens[sentNum] = nltk.word_tokenize(self.sentences[sentNum].lower())
+        return self._lowerTokens[sentNum]
+    
+    def getTokenSpans(self):
+        """Return the words of all sentences and their starting positions in the text. 
+        Quotes tokenized as `` or '' are restored to '"' where the text has it."""
+        if self._tokenSpans is None:
+            tokens = [word for i in range(len(self.sentences)) for word in self.getSentenceTokens(i)]
+            spans = find_token_spans(tokens, self.text)
+            for i, (start, end) in enumerate(spans):
+                if (tokens[i]=='``' or tokens[i]=="''") and end-start==1:
+                    tokens[i] = '"'
+            self._tokenSpans = (tokens, [start for start, end in spans])
+        return self._tokenSpans
+        
+class TaggedToken(tuple):
+    """A (word, tag) pair that also carries the character span (start, end) of the word in the text, 
+    or None if it is not known. It is used as a plain (word, tag) tuple by the taggers and chunkers."""
+    
+    def __new__(cls, word, tag, span = None):
+        token = tuple.__new__(cls, (word, tag))
+        token.span = span
+        return token
+    
+    def __getnewargs__(self):
+        return (self[0], self[1], self.span)
+        
+class _NoTiming(object):
+    """Context of a stage or document when the timer is off"""
+    def __enter__(self):
+        return self
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+_noTiming = _NoTiming()
+
+class _TimedStage(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+    def __exit__(self, excType, excValue, tb):
+        self.timer.add(self.name, time.time() - self.t0)
+        return False
+
+class _TimedDocument(object):
+    def __init__(self, timer, docId, size):
+        self.timer = timer
+        self.record = {'document': docId, 'size': size, 'seconds': 0., 'stages': collections.OrderedDict()}
+    def __enter__(self):
+        self.timer.local.record = self.record
+        self.t0 = time.time()
+        return self
+    def __exit__(self, excType, excValue, tb):
+        self.record['seconds'] = time.time() - self.t0
+        self.timer.local.record = None
+        self.timer.addDocument(self.record)
+        return False
+
+class StageTimer:
+    """Wall time and number of calls of the stages of the extraction, for each document and in total.
+    Stages are timed with 'with timer.stage(name):', inside 'with timer.document(id, size):' for
+    the per-document records. The times of nested stages are included in the enclosing ones. 
+    When the timer is off, both return a shared context that does nothing. Documents timed in 
+    different threads are recorded separately. For long runs, the document records are written to a file 
+    as they end, instead of being kept, with open_output()."""
+    
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.documents = []
+        self.totals = collections.OrderedDict()
+        ##: the file of open_output(), its csv writer, or None for JSON, and the number of records written
+        self.output = None
+        self.writer = None
+        self.written = 0
+        
+    def enable(self, enabled = True):
+        self.enabled = enabled
+        
+    def stage(self, name):
+        if not self.enabled:
+            return _noTiming
+        return _TimedStage(self, name)
+    
+    def document(self, docId, size = 0):
+        if not self.enabled:
+            return _noTiming
+        return _TimedDocument(self, docId, size)
+    
+    def add(self, name, seconds, calls = 1):
+        """Add the time of a stage to the current document and the totals."""
+        record = getattr(self.local, 'record', None)
+        if record is not None:
+            stats = record['stages'].setdefault(name, [0., 0])
+            stats[0] += seconds
+            stats[1] += calls
+        self._addTotal(name, seconds, calls)
+        
+    def _addTotal(self, name, seconds, calls):
+        with self.lock:
+            stats = self.totals.setdefault(name, [0., 0])
+            stats[0] += seconds
+            stats[1] += calls
+            
+    def addDocument(self, record):
+        with self.lock:
+            if self.output is None:
+                self.documents.append(record)
+                return
+            if self.writer:
+                self.writer.writerows(self._csvRows(record))
+            else:
+                self.output.write((',\n' if self.written else '\n') + json.dumps(record))
+            self.written += 1
+            
+    def mergeDocument(self, record):
+        """Add a document record timed by another timer, e.g., in a worker process, and its stages to the totals."""
+        self.addDocument(record)
+        for name, (seconds, calls) in record['stages'].items():
+            self._addTotal(name, seconds, calls)
+    
+    def popDocuments(self):
+        """Remove and return the document records"""
+        with self.lock:
+            (documents, self.documents) = (self.documents, [])
+        return documents
+            
+    def clear(self):
+        with self.lock:
+            self.documents = []
+            self.totals = collections.OrderedDict()
+            
+    def getTotals(self):
+        """Return {stage: {'seconds', 'calls', 'seconds_per_call'}} over all the documents"""
+        with self.lock:
+            return collections.OrderedDict((name, {'seconds': seconds, 'calls': calls, 'seconds_per_call': seconds / calls if calls else 0.}) 
+                                           for name, (seconds, calls) in self.totals.items())
+    
+    def _csvRows(self, record):
+        rows = [[record['document'], record['size'], 'document', '%.6f' % record['seconds'], 1]]
+        for name, (seconds, calls) in record['stages'].items():
+            rows.append([record['document'], record['size'], name, '%.6f' % seconds, calls])
+        return rows
+    
+    def _csvTotalRows(self):
+        return [['ALL', '', name, '%.6f' % stats['seconds'], stats['calls']] for name, stats in self.getTotals().items()]
+    
+    def dump_csv(self, filename):
+        """Write one row per document and stage, then the totals as document 'ALL'."""
+        with open(filename, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(['document', 'size', 'stage', 'seconds', 'calls'])
+            for record in self.documents:
+                writer.writerows(self._csvRows(record))
+            writer.writerows(self._csvTotalRows())
+                
+    def dump_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'documents': self.documents, 'totals': self.getTotals()}, f, indent=1)
+            
+    def dump(self, filename):
+        """Write the timings as CSV if the file name ends with .csv, as JSON otherwise."""
+        if filename.lower().endswith('.csv'):
+            self.dump_csv(filename)
+        else:
+            self.dump_json(filename)
+            
+    def open_output(self, filename):
+        """Write the next document records to the file as they end, in the format of dump(), instead of keeping them:
+        the memory used doesn't grow with the number of documents. close_output() adds the totals."""
+        with self.lock:
+            if filename.lower().endswith('.csv'):
+                self.output = open(filename, 'wb')
+                self.writer = csv.writer(self.output)
+                self.writer.writerow(['document', 'size', 'stage', 'seconds', 'calls'])
+            else:
+                self.output = open(filename, 'w')
+                self.output.write('{"documents": [')
+            self.written = 0
+                
+    def close_output(self):
+        """Write the totals to the file of open_output(), and close it"""
+        totals = self.getTotals()
+        totalRows = self._csvTotalRows()
+        with self.lock:
+            if self.output is None:
+                return
+            if self.writer:
+                self.writer.writerows(totalRows)
+            else:
+                self.output.write('\n], "totals": ' + json.dumps(totals, indent=1) + '}')
+            self.output.close()
+            (self.output, self.writer) = (None, None)
         
 if __name__ == '__main__':
     